@@ -55,3 +55,16 @@ Clinical Recommendation:
             med_safety_summary=med_safety_summary,
             recommendation=rec
         ) + routing_info
+
+    def from_result(self, result):
+        # Render the text for a stored pipeline result (explanation policy 'lazy'); results carry the
+        # evaluation timestamp, so the render time is only a fallback for ones stored without it
+        return self.generate(
+            result['patient_id'],
+            result.get('timestamp') or datetime.datetime.now().isoformat(),
+            {"symptoms": result.get('symptoms', [])},
+            {"interactions": result.get('interactions', [])},
+            {"risk_level": result.get('risk_level', 'Unknown'), "risk_score": result.get('risk_score', 0.0)},
+            {"priority": result.get('priority', 'Low')},
+            result.get('routing')
+        )
@@ -1,15 +1,115 @@
+import numpy as np
 import pandas as pd
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 import datetime
 import os
 
+SCORE_MAP = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8, 'Critical': 1.0}
+
+
+def pair_key(drug1, drug2):
+    # Order-free, case-insensitive key for a drug pair
+    a, b = drug1.lower(), drug2.lower()
+    return (a, b) if a <= b else (b, a)
+
+
+def rule_pairs(rules):
+    """{pair_key: rule row} with the first row winning when a pair is listed twice (either direction)."""
+    pairs = {}
+    if rules.empty:
+        return pairs
+    for row in rules.to_dict('records'):
+        pairs.setdefault(pair_key(row['drug_a'], row['drug_b']), row)
+    return pairs
+
+
 class MedicationSafetyAgent:
+    MAX_CACHED_NAMES = 100000
+
     def __init__(self, rules_path='data/med_rules.csv'):
         try:
-            self.rules = pd.read_csv(rules_path)
+            rules = pd.read_csv(rules_path)
         except FileNotFoundError:
-            self.rules = pd.DataFrame()
+            rules = pd.DataFrame()
             print("Warning: Med rules file not found.")
+        self._canonical_cache = {}
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        self.rules = rules
+        # Load rules drugs for matching (fixed order so ties resolve the same way every run)
+        if not self.rules.empty:
+            known_drugs = sorted(set(self.rules['drug_a'].unique()) | set(self.rules['drug_b'].unique()))
+        else:
+            known_drugs = []
+        if known_drugs != getattr(self, 'known_drugs', None):
+            # A new vocabulary can change what a raw name resolves to
+            self._canonical_cache = {}
+        self.known_drugs = known_drugs
+        self._known_lower = [k.lower() for k in self.known_drugs]
+        self.pair_rules = rule_pairs(self.rules)
+
+    def _remember(self, mapping):
+        if len(self._canonical_cache) + len(mapping) > self.MAX_CACHED_NAMES:
+            self._canonical_cache.clear()
+        self._canonical_cache.update(mapping)
+
+    @property
+    def cached_names(self):
+        return len(self._canonical_cache)
+
+    def resize_cache(self, max_names):
+        # Lower (or raise) the cache bound; an over-full cache is dropped, as in _remember
+        self.MAX_CACHED_NAMES = max_names
+        if len(self._canonical_cache) > max_names:
+            self._canonical_cache.clear()
+
+    def canonicalize(self, med):
+        if med in self._canonical_cache:
+            return self._canonical_cache[med]
+
+        best_match = None
+        best_ratio = 0.0
+
+        # Exact match first (case insensitive)
+        for known, known_lower in zip(self.known_drugs, self._known_lower):
+            if med.lower() == known_lower:
+                best_match = known
+                best_ratio = 100.0
+                break
+
+        # Fuzzy match
+        if not best_match:
+            for known, known_lower in zip(self.known_drugs, self._known_lower):
+                ratio = fuzz.ratio(med.lower(), known_lower)
+                if ratio > 70: # Threshold 70/100
+                    if ratio > best_ratio:
+                        best_ratio = ratio
+                        best_match = known
+
+        canonical = best_match if best_match else med
+        self._remember({med: canonical})
+        return canonical
+
+    def canonicalize_batch(self, raw_meds, workers=-1):
+        """
+        Resolve many raw medication strings at once. Only distinct strings not already
+        resolved are scored, with one multi-threaded all-pairs similarity matrix against
+        the known-drug vocabulary; results match canonicalize() and are cached for check().
+        """
+        pending = [m for m in dict.fromkeys(raw_meds) if m not in self._canonical_cache]
+        if pending and self.known_drugs:
+            scores = process.cdist([m.lower() for m in pending], self._known_lower, scorer=fuzz.ratio,
+                                   dtype=np.float64, workers=workers)
+            best = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(pending)), best]
+            self._remember({
+                med: self.known_drugs[j] if score > 70 else med
+                for med, j, score in zip(pending, best, best_scores)
+            })
+        elif pending:
+            self._remember({m: m for m in pending})
+        return {m: self._canonical_cache.get(m, m) for m in raw_meds}
 
     def check(self, med_input):
         # 1. Input Parsing
@@ -26,58 +126,22 @@ class MedicationSafetyAgent:
         if not med_list or len(med_list) < 2:
             return {"interactions": [], "severity_score": 0.0}
 
-        # 2. Canonicalization
-        # Load rules drugs for matching
-        if not self.rules.empty:
-            known_drugs = set(self.rules['drug_a'].unique()) | set(self.rules['drug_b'].unique())
-        else:
-            known_drugs = set()
-        
-        canonical_meds = []
-        for med in med_list:
-            best_match = None
-            best_ratio = 0.0
-            
-            # Exact match first (case insensitive)
-            for known in known_drugs:
-                if med.lower() == known.lower():
-                    best_match = known
-                    best_ratio = 100.0
-                    break
-            
-            # Fuzzy match
-            if not best_match:
-                for known in known_drugs:
-                    ratio = fuzz.ratio(med.lower(), known.lower())
-                    if ratio > 70: # Threshold 70/100
-                        if ratio > best_ratio:
-                            best_ratio = ratio
-                            best_match = known
-            
-            if best_match:
-                canonical_meds.append(best_match)
-            else:
-                canonical_meds.append(med)
-
-        # 3. Interaction Checking
-        if not self.rules.empty:
+        # 2. Canonicalization (cached; see canonicalize_batch for the cohort pre-pass)
+        canonical_meds = [self.canonicalize(med) for med in med_list]
+
+        # 3. Interaction Checking (one dict lookup per pair, both directions share a key)
+        if self.pair_rules:
             for i in range(len(canonical_meds)):
                 for j in range(i + 1, len(canonical_meds)):
                     drug1 = canonical_meds[i]
                     drug2 = canonical_meds[j]
                     
-                    # Check both directions
-                    match = self.rules[
-                        ((self.rules['drug_a'].str.lower() == drug1.lower()) & (self.rules['drug_b'].str.lower() == drug2.lower())) |
-                        ((self.rules['drug_a'].str.lower() == drug2.lower()) & (self.rules['drug_b'].str.lower() == drug1.lower()))
-                    ]
+                    row = self.pair_rules.get(pair_key(drug1, drug2))
                     
-                    if not match.empty:
-                        row = match.iloc[0]
+                    if row is not None:
                         severity = row['severity']
                         
-                        score_map = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8, 'Critical': 1.0}
-                        severity_score += score_map.get(severity, 0.0)
+                        severity_score += SCORE_MAP.get(severity, 0.0)
                         
                         interaction = {
                             "pair": [drug1, drug2],
@@ -1,50 +1,197 @@
+import os
+import copy
+import numpy as np
+from utils import load_json
+
+DEFAULT_CONFIG = {
+    "weights": {
+        "risk": 0.6,
+        "med_severity": 0.25,
+        "symptom_severity": 0.15
+    },
+    # Tiers checked in order; first score strictly above its threshold wins, else "Low"
+    "thresholds": [["Critical", 0.8], ["High", 0.6], ["Medium", 0.4]],
+    "critical_symptoms": ["chest pain", "shortness of breath", "confusion"],
+    "critical_symptom_score": 1.0,
+    "base_symptom_score": 0.3,
+    "reason_thresholds": {
+        "risk": 0.7,
+        "med_severity": 0.5,
+        "symptom_severity": 0.8
+    },
+    "escalation": {
+        "priority": "High",
+        "exempt": ["High", "Critical"],
+        "reason": "Clinical Rule Alert Triggered"
+    },
+    # Flag scores within `margin` of a tier threshold when the risk model's trees disagree
+    # (RiskAgent uncertainty, the spread of per-tree votes, at or above `threshold`). 0.38 is
+    # the upper quartile over data/patient_summary.csv: roughly a 17/83 split of the trees or closer
+    "uncertainty": {
+        "threshold": 0.38,
+        "margin": 0.05,
+        "reason": "Uncertain risk estimate near a priority boundary; review manually."
+    },
+    # Alerts that route a patient as Critical on the fast path (TriageGraph.fast_route). With
+    # `floor` on, the full chain never decides such a patient lower, with or without the fast path;
+    # off, it re-decides them as usual (rule alerts escalate to High) and may re-route them
+    "critical_alerts": {
+        "codes": ["HYPOTENSION_SHOCK", "HYPOXEMIA"],
+        "priority": "Critical",
+        "reason": "Critical Clinical Rule Alert",
+        "floor": False
+    }
+}
+
+REASONS = {
+    "risk": "High deterioration risk detected.",
+    "med_severity": "Significant medication interactions found.",
+    "symptom_severity": "Critical symptoms reported."
+}
+
+
+def load_priority_config(config_path='data/priority_config.json'):
+    # Values in the file override the defaults key by key
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if config_path and os.path.exists(config_path):
+        for key, value in load_json(config_path).items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
 class PriorityAgent:
-    def __init__(self):
-        self.weights = {
-            'risk': 0.6,
-            'med_severity': 0.25,
-            'symptom_severity': 0.15
-        }
+    def __init__(self, config_path='data/priority_config.json', config=None):
+        self.config = config if config is not None else load_priority_config(config_path)
+        self.weights = self.config['weights']
+        self.critical_symptoms = set(s.lower() for s in self.config['critical_symptoms'])
+
+    def symptom_score(self, symptoms):
+        # Simple symptom severity heuristic
+        for s in symptoms:
+            if s.lower() in self.critical_symptoms:
+                return self.config['critical_symptom_score']
+        return self.config['base_symptom_score'] if symptoms else 0.0
+
+    def borderline(self, final_score, uncertainty):
+        rule = self.config['uncertainty']
+        if uncertainty is None or uncertainty < rule['threshold']:
+            return False
+        return any(abs(final_score - threshold) <= rule['margin'] for _, threshold in self.config['thresholds'])
 
     def decide(self, symptom_json, med_json, risk_json):
         risk_score = risk_json.get('risk_score', 0.0)
         med_score = med_json.get('severity_score', 0.0)
-        
-        # Simple symptom severity heuristic
-        symptoms = symptom_json.get('symptoms', [])
-        critical_symptoms = ['chest pain', 'shortness of breath', 'confusion']
-        symptom_score = 0.0
-        for s in symptoms:
-            if s.lower() in critical_symptoms:
-                symptom_score = 1.0
-                break
-        if not symptom_score and symptoms:
-            symptom_score = 0.3 # Base score for any symptom
-            
+        symptom_score = self.symptom_score(symptom_json.get('symptoms', []))
+
         final_score = (
             risk_score * self.weights['risk'] +
             med_score * self.weights['med_severity'] +
             symptom_score * self.weights['symptom_severity']
         )
-        
+
         priority = "Low"
-        if final_score > 0.8:
-            priority = "Critical"
-        elif final_score > 0.6:
-            priority = "High"
-        elif final_score > 0.4:
-            priority = "Medium"
-            
+        for tier, threshold in self.config['thresholds']:
+            if final_score > threshold:
+                priority = tier
+                break
+
+        limits = self.config['reason_thresholds']
         reasons = []
-        if risk_score > 0.7:
-            reasons.append("High deterioration risk detected.")
-        if med_score > 0.5:
-            reasons.append("Significant medication interactions found.")
-        if symptom_score > 0.8:
-            reasons.append("Critical symptoms reported.")
-            
+        if risk_score > limits['risk']:
+            reasons.append(REASONS['risk'])
+        if med_score > limits['med_severity']:
+            reasons.append(REASONS['med_severity'])
+        if symptom_score > limits['symptom_severity']:
+            reasons.append(REASONS['symptom_severity'])
+        if self.borderline(final_score, risk_json.get('uncertainty')):
+            reasons.append(self.config['uncertainty']['reason'])
+
         return {
             "priority": priority,
             "score": round(final_score, 2),
             "reasons": reasons
         }
+
+    def has_critical_alert(self, alerts):
+        codes = self.config['critical_alerts']['codes']
+        return any(a.get('code') in codes for a in alerts or [])
+
+    def fast_path(self, alerts):
+        """Priority from the deterministic rules alone, or None unless a critical alert fired."""
+        if not self.has_critical_alert(alerts):
+            return None
+        rule = self.config['critical_alerts']
+        return {"priority": rule['priority'], "score": None, "reasons": [rule['reason']]}
+
+    def escalate(self, priority_out, alerts):
+        # Escalate if clinical rule alerts fired
+        rule = self.config['escalation']
+        if alerts and priority_out['priority'] not in rule['exempt']:
+            priority_out['priority'] = rule['priority']
+            priority_out['reasons'].append(rule['reason'])
+        # Optional policy: a critical alert is a floor under the full chain's decision
+        critical = self.config['critical_alerts']
+        if critical['floor'] and self.has_critical_alert(alerts) and priority_out['priority'] != critical['priority']:
+            priority_out['priority'] = critical['priority']
+            priority_out['reasons'].append(critical['reason'])
+        return priority_out
+
+    def decide_batch(self, risk_scores, med_scores, symptom_scores, alert_counts=None, critical_alerts=None,
+                     uncertainties=None):
+        """
+        Vectorized decide + escalate over a cohort. Takes per-patient arrays
+        (symptom_scores from symptom_score(), critical_alerts from
+        has_critical_alert(), uncertainties from RiskAgent) and returns the
+        same list of dicts the scalar path would.
+        """
+        risk = np.asarray(risk_scores, dtype=float)
+        med = np.asarray(med_scores, dtype=float)
+        symptom = np.asarray(symptom_scores, dtype=float)
+
+        # Same operation order as decide() so scores match bit for bit
+        final = (
+            risk * self.weights['risk'] +
+            med * self.weights['med_severity'] +
+            symptom * self.weights['symptom_severity']
+        )
+
+        tiers = [tier for tier, _ in self.config['thresholds']]
+        conditions = [final > threshold for _, threshold in self.config['thresholds']]
+        priority = np.select(conditions, tiers, default="Low").astype(object)
+
+        limits = self.config['reason_thresholds']
+        flags = [
+            (risk > limits['risk'], REASONS['risk']),
+            (med > limits['med_severity'], REASONS['med_severity']),
+            (symptom > limits['symptom_severity'], REASONS['symptom_severity']),
+        ]
+        if uncertainties is not None:
+            rule = self.config['uncertainty']
+            uncertainty = np.array([np.nan if u is None else u for u in uncertainties], dtype=float)
+            near = np.zeros(len(final), dtype=bool)
+            for _, threshold in self.config['thresholds']:
+                near |= np.abs(final - threshold) <= rule['margin']
+            flags.append((near & (uncertainty >= rule['threshold']), rule['reason']))
+
+        escalated = np.zeros(len(final), dtype=bool)
+        if alert_counts is not None:
+            rule = self.config['escalation']
+            escalated = (np.asarray(alert_counts) > 0) & ~np.isin(priority, rule['exempt'])
+            priority[escalated] = rule['priority']
+            flags.append((escalated, rule['reason']))
+        critical = self.config['critical_alerts']
+        if critical['floor'] and critical_alerts is not None:
+            floored = np.asarray(critical_alerts, dtype=bool) & (priority != critical['priority'])
+            priority[floored] = critical['priority']
+            flags.append((floored, critical['reason']))
+
+        masks = np.column_stack([mask for mask, _ in flags])
+        texts = [text for _, text in flags]
+        # Python round() per element, as np.round differs on some half-way cases
+        return [
+            {"priority": p, "score": round(s, 2), "reasons": [t for t, on in zip(texts, row) if on]}
+            for p, s, row in zip(priority.tolist(), final.tolist(), masks.tolist())
+        ]
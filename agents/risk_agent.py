@@ -1,66 +1,126 @@
+import numpy as np
 import pandas as pd
 import joblib
 import os
 import json
+from agents.risk_attribution import TreePathAttributor
+from feature_store import TimeseriesFeatureStore, FEATURE_COLUMNS
 
 class RiskAgent:
-    def __init__(self, model_path='models/risk_model.pkl'):
+    def __init__(self, model_path='models/risk_model.pkl', model=None, feature_store=None,
+                 feature_store_dir='data/feature_store'):
         self.model_path = model_path
         self.pipeline = None
+        self.attributor = None
         self.feature_importances = {}
-        self.load_model()
+        self.feature_store = feature_store
+        self.feature_store_dir = feature_store_dir
+        if model is not None:
+            # In-memory model (e.g. evaluation harness); nothing is read from disk
+            self.set_model(model)
+        else:
+            self.load_model()
 
     def load_model(self):
         if os.path.exists(self.model_path):
             try:
-                self.pipeline = joblib.load(self.model_path)
+                model = joblib.load(self.model_path)
                 # Load feature importances if available
                 if os.path.exists('evidence/feature_importances.json'):
                     with open('evidence/feature_importances.json', 'r') as f:
                         self.feature_importances = json.load(f)
             except Exception as e:
                 print(f"Error loading model: {e}")
+                return
+            self.set_model(model)
         else:
             print(f"Model file not found at {self.model_path}")
 
+    def set_model(self, model):
+        self.pipeline = model
+        self.attributor = None
+        try:
+            self.attributor = TreePathAttributor.from_model(model)
+        except Exception as e:
+            print(f"Per-patient attributions unavailable: {e}")
+
+        # Models trained with --features read the precomputed timeseries features by patient
+        if self.uses_timeseries_features() and self.feature_store is None:
+            if self.feature_store_dir and os.path.exists(os.path.join(self.feature_store_dir, 'features.csv')):
+                self.feature_store = TimeseriesFeatureStore.load(self.feature_store_dir)
+            else:
+                print(f"Feature store not found at {self.feature_store_dir}; timeseries features will be imputed")
+
+    def uses_timeseries_features(self):
+        return bool(set(FEATURE_COLUMNS) & set(getattr(self.pipeline, 'feature_names_in_', [])))
+
+    def _frame(self, samples):
+        input_data = pd.DataFrame(samples)
+
+        # Ensure columns
+        required_cols = ['hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr', 'age', 'sex', 'chronic_conditions']
+        for col in required_cols:
+            if col not in input_data.columns:
+                input_data[col] = 0 if col != 'chronic_conditions' and col != 'sex' else 'None'
+
+        if self.feature_store is not None:
+            input_data = self.feature_store.join(input_data)
+        elif self.uses_timeseries_features():
+            for col in FEATURE_COLUMNS:
+                input_data[col] = float('nan')
+        return input_data
+
+    def predict_scores(self, samples):
+        """Probabilities only (no attributions), for cheap screening of a whole cohort."""
+        if not self.pipeline:
+            return np.zeros(len(samples))
+        try:
+            return self.pipeline.predict_proba(self._frame(samples))[:, 1]
+        except Exception as e:
+            print(f"Prediction error: {e}")
+            return np.zeros(len(samples))
+
     def predict(self, sample_dict):
+        return self.predict_batch([sample_dict])[0]
+
+    def predict_batch(self, samples):
         if not self.pipeline:
-            return {"risk_score": 0.0, "risk_level": "Unknown", "top_features": []}
+            return [{"risk_score": 0.0, "risk_level": "Unknown", "top_features": []} for _ in samples]
 
         try:
-            input_data = pd.DataFrame([sample_dict])
-            
-            # Ensure columns
-            required_cols = ['hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr', 'age', 'sex', 'chronic_conditions']
-            for col in required_cols:
-                if col not in input_data.columns:
-                    input_data[col] = 0 if col != 'chronic_conditions' and col != 'sex' else 'None'
-            
+            input_data = self._frame(samples)
+
             # Predict Proba (Calibrated if pipeline is calibrated)
-            prediction = self.pipeline.predict_proba(input_data)[:, 1][0]
-            
-            # Uncertainty (Mock if not ensemble)
-            uncertainty = 0.05 # Placeholder
-            
-            risk_level = "Low"
-            if prediction > 0.7:
-                risk_level = "High"
-            elif prediction > 0.4:
-                risk_level = "Medium"
-
-            # Top Features (Global importance fallback if local not available)
-            # In a real scenario, use SHAP here. For now, return top global features.
-            top_features = sorted(self.feature_importances.items(), key=lambda x: x[1], reverse=True)[:3]
-            top_features_list = [f"{k} ({v:.2f})" for k, v in top_features]
-
-            return {
-                "risk_score": float(prediction),
-                "risk_level": risk_level,
-                "uncertainty": uncertainty,
-                "top_features": top_features_list,
-                "calibrated_score": float(prediction)
-            }
-            
+            predictions = self.pipeline.predict_proba(input_data)[:, 1]
+
+            # Per-patient tree-path attributions (in risk_score units for a calibrated model) and per-tree
+            # spread (uncertainty) share one transform; global importance fallback and unknown uncertainty
+            # for other model types
+            if self.attributor is not None:
+                Xt = self.attributor.transform(input_data)
+                top_features = self.attributor.top_features(self.attributor.contributions(input_data, Xt))
+                uncertainties = self.attributor.uncertainty(input_data, Xt).tolist()
+            else:
+                top_global = sorted(self.feature_importances.items(), key=lambda x: x[1], reverse=True)[:3]
+                top_features = [[f"{k} ({v:.2f})" for k, v in top_global]] * len(samples)
+                uncertainties = [None] * len(samples)
+
+            outputs = []
+            for prediction, features, uncertainty in zip(predictions, top_features, uncertainties):
+                risk_level = "Low"
+                if prediction > 0.7:
+                    risk_level = "High"
+                elif prediction > 0.4:
+                    risk_level = "Medium"
+                outputs.append({
+                    "risk_score": float(prediction),
+                    "risk_level": risk_level,
+                    "uncertainty": uncertainty,
+                    "top_features": list(features),
+                    "calibrated_score": float(prediction)
+                })
+            return outputs
+
         except Exception as e:
             print(f"Prediction error: {e}")
-            return {"risk_score": 0.0, "risk_level": "Error", "top_features": []}
+            return [{"risk_score": 0.0, "risk_level": "Error", "top_features": []} for _ in samples]
@@ -0,0 +1,220 @@
+import numpy as np
+from scipy import sparse
+
+
+def _unwrap_pipeline(model):
+    # (preprocessor, forest) of a Pipeline ending in a tree ensemble, else (None, None)
+    if not hasattr(model, 'steps') and hasattr(model, 'estimator'):
+        model = model.estimator  # FrozenEstimator
+    if not hasattr(model, 'steps'):
+        return None, None
+    forest = model.steps[-1][1]
+    if not hasattr(forest, 'estimators_') or not hasattr(forest.estimators_[0], 'tree_'):
+        return None, None
+    return model[:-1], forest
+
+
+def unwrap_forests(model):
+    """
+    (preprocessor, forest, calibrator) for each random forest inside a model:
+    one per CalibratedClassifierCV fold (predict_proba averages their calibrated
+    probabilities), with that fold's probability map; or a plain Pipeline's own
+    forest with calibrator None. Empty if the model is not a tree ensemble.
+    """
+    if not hasattr(model, 'calibrated_classifiers_'):
+        preprocessor, forest = _unwrap_pipeline(model)
+        return [] if forest is None else [(preprocessor, forest, None)]
+    members = []
+    for fold in model.calibrated_classifiers_:
+        preprocessor, forest = _unwrap_pipeline(fold.estimator)
+        calibrators = getattr(fold, 'calibrators', [])
+        if forest is None or len(calibrators) != 1:
+            return []
+        members.append((preprocessor, forest, calibrators[0]))
+    return members
+
+
+def output_columns(preprocessor, n_outputs):
+    """Original input column for each column the preprocessor emits."""
+    transformer = preprocessor.steps[-1][1] if hasattr(preprocessor, 'steps') else preprocessor
+    if not hasattr(transformer, 'transformers_'):
+        return list(preprocessor.get_feature_names_out())
+
+    columns = [None] * n_outputs
+    for name, trans, cols in transformer.transformers_:
+        out = transformer.output_indices_[name]
+        width = out.stop - out.start
+        if trans == 'drop' or width == 0:
+            continue
+        cols = list(cols) if not isinstance(cols, str) else [cols]
+        if width == len(cols):
+            mapped = cols
+        else:
+            # One-hot style: each input column expands to one output per category
+            encoder = trans.steps[-1][1] if hasattr(trans, 'steps') else trans
+            sizes = [len(c) for c in encoder.categories_]
+            drop_idx = getattr(encoder, 'drop_idx_', None)
+            if drop_idx is not None:
+                sizes = [s - (d is not None) for s, d in zip(sizes, drop_idx)]
+            mapped = [c for c, s in zip(cols, sizes) for _ in range(s)]
+        columns[out.start:out.stop] = mapped
+    return columns
+
+
+class _Attributor:
+    # Shared formatting over contributions(); subclasses set feature_names
+
+    def top_features(self, contributions, k=3):
+        # Largest contributions by magnitude, formatted like the global fallback
+        order = np.argsort(-np.abs(contributions), axis=1)[:, :k]
+        return [[f"{self.feature_names[j]} ({row[j]:+.2f})" for j in idx] for row, idx in zip(contributions, order)]
+
+    def global_importance(self, X):
+        return dict(zip(self.feature_names, np.abs(self.contributions(X)).mean(axis=0)))
+
+
+class TreePathAttributor(_Attributor):
+    """
+    Per-patient feature contributions for a random forest by decomposing each
+    tree's prediction along its decision path: every split credits its feature
+    with the change in positive-class probability from parent to child. Summed
+    contributions plus the forest's root value equal predict_proba.
+
+    The per-node deltas are precomputed into one sparse (nodes x features)
+    matrix, so a whole batch costs one decision_path call and one sparse
+    product, comparable to predict_proba itself.
+    """
+
+    def __init__(self, preprocessor, forest, calibrator=None):
+        self.preprocessor = preprocessor
+        self.forest = forest
+        self.calibrator = calibrator
+        positive = list(forest.classes_).index(1) if 1 in list(forest.classes_) else len(forest.classes_) - 1
+        n_trees = len(forest.estimators_)
+
+        rows, cols, vals = [], [], []
+        probas, offsets = [], []
+        bias = 0.0
+        offset = 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            value = tree.value[:, 0, :]
+            proba = value[:, positive] / value.sum(axis=1)
+            probas.append(proba)
+            offsets.append(offset)
+            bias += proba[0]
+            internal = np.where(tree.children_left >= 0)[0]
+            for children in (tree.children_left[internal], tree.children_right[internal]):
+                rows.append(offset + children)
+                cols.append(tree.feature[internal])
+                vals.append((proba[children] - proba[internal]) / n_trees)
+            offset += tree.node_count
+
+        self.bias = bias / n_trees
+        # Every tree's node probabilities end to end, so per-tree predictions are one gather
+        self.node_proba = np.concatenate(probas)
+        self.tree_offsets = np.array(offsets)
+        self.deltas = sparse.csr_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(offset, forest.n_features_in_)
+        )
+        # Fold encoded columns (e.g. one-hot categories) back onto the original inputs
+        columns = output_columns(preprocessor, forest.n_features_in_)
+        self.feature_names = list(dict.fromkeys(columns))
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        self.fold = sparse.csr_matrix(
+            (np.ones(len(columns)), (np.arange(len(columns)), [index[c] for c in columns])),
+            shape=(len(columns), len(self.feature_names))
+        )
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        Attributor for a plain forest Pipeline (contributions in forest probability)
+        or a CalibratedClassifierCV over one (in calibrated probability, see
+        CalibratedForestAttributor); None for other model types.
+        """
+        members = unwrap_forests(model)
+        if not members:
+            return None
+        if members[0][2] is None:
+            return cls(*members[0])
+        return CalibratedForestAttributor([cls(*member) for member in members])
+
+    def transform(self, X):
+        return self.preprocessor.transform(X)
+
+    def contributions(self, X, Xt=None):
+        """(n_samples x n_original_features) array of contributions to the positive-class probability."""
+        Xt = self.preprocessor.transform(X) if Xt is None else Xt
+        indicator, _ = self.forest.decision_path(Xt)
+        return np.asarray((indicator @ self.deltas @ self.fold).todense())
+
+    def tree_probabilities(self, X, Xt=None):
+        """(n_samples x n_trees) uncalibrated positive-class probability of each tree's leaf."""
+        Xt = self.preprocessor.transform(X) if Xt is None else Xt
+        leaves = self.forest.apply(Xt)
+        return self.node_proba[leaves + self.tree_offsets]
+
+    def uncertainty(self, X, Xt=None):
+        """
+        Disagreement between trees: the standard deviation of their uncalibrated
+        leaf probabilities, 0 when every tree agrees and at most 0.5. With fully
+        grown trees the leaves are (near) pure, so this is sqrt(q(1 - q)) for the
+        fraction q of trees voting positive: it measures how split the forest
+        is, not an error bar on risk_score, and is not independent of it.
+        Calibration is left out because the sigmoid map would squash the 0/1
+        votes to two values and hide how many trees disagree.
+        """
+        return self.tree_probabilities(X, Xt).std(axis=1)
+
+    def calibrated_contributions(self, X, Xt=None):
+        """
+        contributions() rescaled per patient to the calibrated probability: each
+        feature keeps its share of the forest's move away from the root value,
+        and the total becomes calibrator(forest) - calibrator(root value).
+        """
+        contributions = self.contributions(X, Xt)
+        moved = contributions.sum(axis=1)
+        calibrated = self.calibrator.predict(moved + self.bias) - self.calibrated_bias
+        # Where the forest did not move, the slope of the map at the root value
+        h = 1e-6
+        slope = (self.calibrator.predict(np.array([self.bias + h]))[0]
+                 - self.calibrator.predict(np.array([self.bias - h]))[0]) / (2 * h)
+        scale = np.full(len(moved), slope)
+        np.divide(calibrated, moved, out=scale, where=np.abs(moved) > 1e-12)
+        return contributions * scale[:, None]
+
+    @property
+    def calibrated_bias(self):
+        return self.calibrator.predict(np.array([self.bias]))[0]
+
+
+class CalibratedForestAttributor(_Attributor):
+    """
+    Attributions for a CalibratedClassifierCV over forest Pipelines, in the
+    units of its predict_proba (RiskAgent's risk_score): the mean over folds of
+    each fold's calibrated_contributions(). Summed contributions plus `bias`
+    (the folds' mean calibrated root value) equal predict_proba. Uncertainty is
+    the spread of every fold's tree votes together.
+    """
+
+    def __init__(self, members):
+        self.members = members
+        self.feature_names = members[0].feature_names
+        self.bias = float(np.mean([m.calibrated_bias for m in members]))
+
+    def transform(self, X):
+        return [m.transform(X) for m in self.members]
+
+    def contributions(self, X, Xt=None):
+        Xt = self.transform(X) if Xt is None else Xt
+        return np.mean([m.calibrated_contributions(X, t) for m, t in zip(self.members, Xt)], axis=0)
+
+    def tree_probabilities(self, X, Xt=None):
+        Xt = self.transform(X) if Xt is None else Xt
+        return np.hstack([m.tree_probabilities(X, t) for m, t in zip(self.members, Xt)])
+
+    def uncertainty(self, X, Xt=None):
+        # Same reading as TreePathAttributor.uncertainty, over all folds' trees
+        return self.tree_probabilities(X, Xt).std(axis=1)
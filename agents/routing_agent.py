@@ -1,11 +1,17 @@
-import random
-import csv
-import datetime
-import os
-from utils import ensure_dirs
+import zlib
+from collections import OrderedDict
+from audit_store import AuditStore
 
 class RoutingAgent:
-    def __init__(self):
+    """
+    Routes patients to a team and clinician. The clinician is picked from the
+    team rota by a stable hash of the patient id, so a resumed run names the
+    same clinician the audit trail recorded. The last decision per patient is
+    kept, so a re-evaluation that leaves priority, team and alert set unchanged
+    keeps the same clinician and writes no audit row; only transitions are logged.
+    """
+
+    def __init__(self, audit_store=None, max_patients=10000):
         self.rota = {
             "Cardiology": ["Dr. Smith", "Dr. Heart"],
             "Respiratory": ["Dr. Lung", "Dr. Breath"],
@@ -13,12 +19,32 @@ class RoutingAgent:
             "Critical Care": ["Dr. Patel", "Dr. Critical"],
             "General": ["Dr. Doe", "Dr. Ray"]
         }
-        self.audit_file = 'evidence/routing_log.csv'
-        ensure_dirs(['evidence'])
-        if not os.path.exists(self.audit_file):
-            with open(self.audit_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'patient_id', 'priority', 'reason', 'assigned_to', 'team', 'escalated_by'])
+        self.audit_store = audit_store or AuditStore()
+        self.run_id = None
+        self._already_routed = set()
+        self.max_patients = max_patients
+        # patient_id -> ((priority, team, alert codes), decision)
+        self._last = OrderedDict()
+
+    def begin_run(self, run_id, already_routed=()):
+        # already_routed: patients audited by an interrupted attempt of this run whose results were lost
+        self.run_id = run_id
+        self._already_routed = set(already_routed)
+        # Every patient gets one audit row per run
+        self._last.clear()
+
+    def forget(self, patient_id):
+        self._last.pop(patient_id, None)
+
+    def resize(self, max_patients):
+        # Evict the least recently routed patients down to the new cap
+        self.max_patients = max_patients
+        while len(self._last) > max_patients:
+            self._last.popitem(last=False)
+
+    def clinician(self, team, patient_id):
+        rota = self.rota.get(team, self.rota["General"])
+        return rota[zlib.crc32(str(patient_id).encode()) % len(rota)]
 
     def route(self, priority_out, patient_id, alerts=None):
         priority = priority_out.get('priority', 'Low')
@@ -47,26 +73,34 @@ class RoutingAgent:
         if priority in ['High', 'Critical'] or (alerts and len(alerts) > 0):
             escalated = True
             team = specialty
-            assigned_to = random.choice(self.rota.get(team, self.rota["General"]))
+
+        # Unchanged decision: same clinician, no audit row
+        state = (priority, team, specialty, frozenset(a.get('code') for a in alerts or []))
+        last = self._last.get(patient_id)
+        if last is not None and last[0] == state:
+            self._last.move_to_end(patient_id)
+            return dict(last[1])
+
+        if escalated:
+            assigned_to = self.clinician(team, patient_id)
             action = "Immediate Review"
             
         # Audit Log
-        with open(self.audit_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.datetime.now().isoformat(),
-                patient_id,
-                priority,
-                "; ".join(reasons),
-                assigned_to,
-                team,
-                "System"
-            ])
+        if patient_id in self._already_routed:
+            self._already_routed.discard(patient_id)
+        else:
+            self.audit_store.log_routing(patient_id, priority, "; ".join(reasons), assigned_to, team, "System",
+                                         run_id=self.run_id)
             
-        return {
+        decision = {
             "assigned_to": assigned_to,
             "team": team,
             "escalated": escalated,
             "action": action,
             "reason": f"Priority: {priority}. {specialty} indicated."
         }
+        self._last[patient_id] = (state, decision)
+        self._last.move_to_end(patient_id)
+        while len(self._last) > self.max_patients:
+            self._last.popitem(last=False)
+        return dict(decision)
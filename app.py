@@ -2,16 +2,16 @@ import streamlit as st
 import pandas as pd
 import json
 import datetime
+import hashlib
 import os
-import csv
-from agents.symptom_agent import SymptomAgent
-from agents.med_safety_agent import MedicationSafetyAgent
-from agents.risk_agent import RiskAgent
-from agents.priority_agent import PriorityAgent
-from agents.explanation_agent import ExplanationAgent
+from collections import OrderedDict
 from agents.routing_agent import RoutingAgent
-from rules.clinical_alerts import check_clinical_rules
-from utils import ensure_dirs
+from audit_store import AuditStore
+from cohort import (SORT_COLUMNS, list_results_files, load_results, build_cohort_frame, filter_cohort,
+                    sort_cohort, paginate, analysis_from_record)
+from charts import VITAL_CHARTS, WINDOWS, prepare_series, chart_data
+from triage import TriageGraph
+from utils import load_json
 
 st.set_page_config(page_title="Patient Safety Guardian", layout="wide")
 
@@ -60,73 +60,262 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def load_audit_store():
+    return AuditStore()
+
 def log_action(patient_id, action, user="Clinician", reason=None):
-    ensure_dirs(['evidence'])
-    file_path = 'evidence/actions_log.csv'
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'patient_id', 'action', 'user', 'reason'])
-    with open(file_path, 'a', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([datetime.datetime.now().isoformat(), patient_id, action, user, reason])
+    load_audit_store().log_action(patient_id, action, user, reason)
+
+@st.cache_resource
+def load_triage_graph():
+    # Shared across reruns so unchanged inputs are not re-analysed
+    return TriageGraph(routing_agent=RoutingAgent(audit_store=load_audit_store()))
 
 def run_analysis(sample):
-    symptom_agent = SymptomAgent()
-    med_agent = MedicationSafetyAgent()
-    risk_agent = RiskAgent()
-    priority_agent = PriorityAgent()
-    routing_agent = RoutingAgent()
-    explanation_agent = ExplanationAgent()
-
-    symptom_out = symptom_agent.extract(sample.get('clinical_note', ''))
-    
-    meds_input = sample.get('medications', '')
-    if not meds_input:
-        meds_input = symptom_out['medications_mentioned']
+    return load_triage_graph().evaluate(sample)
+
+@st.cache_data
+def load_samples(path='data/test_samples.json'):
+    return load_json(path)
+
+TIMESERIES_PATH = 'data/patient_data_timeseries.csv'
+
+@st.cache_resource(max_entries=2)
+def load_timeseries(path, mtime):
+    # Keyed on mtime like load_cohort, so appended readings are picked up
+    if mtime is None:
+        return pd.DataFrame(), {}
+    ts_all = pd.read_csv(path)
+    return ts_all, ts_all.groupby('patient_id').indices
+
+def patient_timeseries(patient_id, path=TIMESERIES_PATH):
+    ts_all, index = load_timeseries(path, os.path.getmtime(path) if os.path.exists(path) else None)
+    if patient_id not in index:
+        return pd.DataFrame()
+    return ts_all.iloc[index[patient_id]]
+
+@st.cache_resource(max_entries=2)
+def load_cohort(path, mtime):
+    # Keyed on mtime so a rewritten results file is reloaded; frame is shared read-only across reruns
+    records = load_results(path)
+    return records, build_cohort_frame(records)
+
+def input_hash(sample):
+    return hashlib.sha1(json.dumps(sample, sort_keys=True, default=str).encode()).hexdigest()
+
+def series_hash(timeseries_df):
+    # The cached vitals and charts come from the series, so new or corrected readings need a new key
+    if timeseries_df.empty:
+        return None
+    return hashlib.sha1(pd.util.hash_pandas_object(timeseries_df, index=False).values.tobytes()).hexdigest()
+
+def vitals_chart_data(prepared, window_name, chart_cache=None):
+    # Downsampled series and summary stats per window, kept with the session's cached analysis
+    if chart_cache is not None and window_name in chart_cache:
+        return chart_cache[window_name]
+    data = chart_data(prepared, WINDOWS[window_name], target_points=CHART_POINTS)
+    if chart_cache is not None:
+        chart_cache[window_name] = data
+    return data
+
+SESSION_CACHE_SIZE = 20
+CHART_POINTS = 200
+
+def cached_analysis(sample, timeseries_df, key):
+    # Per-session results keyed by (patient, input hash, series hash); reruns from action buttons, tabs
+    # and the popover render from here instead of re-running the agents
+    cache = st.session_state.setdefault('analysis_cache', OrderedDict())
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    with st.spinner("Analyzing..."):
+        entry = {
+            "results": run_analysis(sample),
+            "vitals": prepare_series(timeseries_df) if not timeseries_df.empty else timeseries_df,
+            "charts": {},
+        }
+    cache[key] = entry
+    while len(cache) > SESSION_CACHE_SIZE:
+        cache.popitem(last=False)
+    return entry
+
+def render_analysis(results, patient_id, timeseries_df, vitals_df=None, chart_cache=None):
+    # Alerts Banner
+    if results['alerts']:
+        for alert in results['alerts']:
+            st.markdown(f"<div class='alert-box'><strong>{alert['code']}</strong>: {alert['rationale']}</div>", unsafe_allow_html=True)
+
+    # KPIs with Icons
+    c1, c2, c3, c4 = st.columns(4)
+    uncertainty = results['risk_out'].get('uncertainty')
+    spread = f" (tree spread {uncertainty:.2f})" if uncertainty is not None else ""
+    c1.metric("⚠️ Risk Level", results['risk_out']['risk_level'], f"Score: {results['risk_out']['risk_score']:.2f}{spread}")
+    c2.metric("🚑 Priority", results['priority_out']['priority'])
+    c3.metric("💊 Interactions", len(results['med_out']['interactions']))
+    c4.metric("🩺 Symptoms", len(results['symptom_out']['symptoms']))
     
-    # Ensure list for agent
-    if isinstance(meds_input, str):
-        meds_list = [m.strip() for m in meds_input.split(',') if m.strip()]
-    elif isinstance(meds_input, list):
-        meds_list = [str(m).strip() for m in meds_input if str(m).strip()]
-    else:
-        meds_list = []
+    # Vitals Trend
+    if not timeseries_df.empty:
+        st.divider()
+        prepared = vitals_df if vitals_df is not None else prepare_series(timeseries_df)
+        h1, h2 = st.columns([3, 1])
+        window_name = h2.selectbox("Window", list(WINDOWS), key="vitals_window")
+        h1.subheader(f"Vitals Trend ({'Last ' + window_name if WINDOWS[window_name] else 'Full Stay'})")
+        data = vitals_chart_data(prepared, window_name, chart_cache)
 
-    med_out = med_agent.check(meds_list)
-    risk_out = risk_agent.predict(sample)
+        # x axis: hours before the latest reading
+        for col, (vital, caption) in zip(st.columns(len(VITAL_CHARTS)), VITAL_CHARTS):
+            with col:
+                st.caption(caption)
+                st.line_chart(data['series'][vital].set_index('hours')[vital], height=120)
+                stats = data['summary'][vital]
+                st.markdown(f"**Min:** {stats['min']:g} | **Max:** {stats['max']:g} | **Last:** {stats['last']:g}")
+
+    st.divider()
     
-    # Clinical Alerts
-    vitals = {k: sample.get(k) for k in ['hr', 'sbp', 'spo2', 'temp', 'rr']}
-    alerts = check_clinical_rules(vitals)
+    # Routing Badge
+    routing = results['routing_out']
+    badge_color = "#dc3545" if routing['escalated'] else "#0d6efd"
+    st.markdown(f"""
+    <div style='margin-bottom:10px;'>
+        <span style='background-color:{badge_color}; color:white; padding:8px 12px; border-radius:5px; font-weight:bold;'>
+            Assigned to: {routing['assigned_to']} ({routing['team']})
+        </span>
+    </div>
+    """, unsafe_allow_html=True)
     
-    priority_out = priority_agent.decide(symptom_out, med_out, risk_out)
+    # Explanation Card
+    card_class = "clinical-card"
+    if results['risk_out']['risk_level'] == "High": card_class += " high-risk"
+    elif results['risk_out']['risk_level'] == "Medium": card_class += " medium-risk"
     
-    # Escalate priority if alerts exist
-    if alerts and priority_out['priority'] not in ['High', 'Critical']:
-        priority_out['priority'] = 'High'
-        priority_out['reasons'].append("Clinical Rule Alert Triggered")
-        
-    routing_out = routing_agent.route(priority_out, sample.get('patient_id'), alerts)
+    st.markdown(f"""
+    <div class="{card_class}">
+        <h4 style='margin-top:0; border-bottom:1px solid #ddd; padding-bottom:10px;'>Clinical Summary</h4>
+        {results['explanation'].replace(chr(10), '<br>')}
+    </div>
+    """, unsafe_allow_html=True)
     
-    explanation = explanation_agent.generate(
-        sample.get('patient_id', 'Unknown'), 
-        sample.get('timestamp', datetime.datetime.now().isoformat()),
-        symptom_out, med_out, risk_out, priority_out, routing_out
-    )
+    # Clinician Actions
+    st.markdown("### Clinician Actions")
+    c1, c2, c3 = st.columns(3)
+    if c1.button("Acknowledge", use_container_width=True):
+        log_action(patient_id, "Acknowledged")
+        st.toast("Assignment logged ✓")
+    if c2.button("Assign to Me", use_container_width=True):
+        log_action(patient_id, "Assigned to Self")
+        st.toast("Assignment logged ✓")
+        
+    with c3:
+        with st.popover("Override Routing", use_container_width=True):
+            reason = st.text_input("Reason for override")
+            if st.button("Confirm Override"):
+                if reason:
+                    log_action(patient_id, "Override Routing", reason=reason)
+                    st.toast("Override logged ✓")
+                else:
+                    st.error("Reason required")
+
+    st.divider()
+
+    # Tabs
+    st.subheader("Agent Breakdown")
+    t1, t2, t3, t4, t5 = st.tabs(["Symptoms", "Med Safety", "Risk Model", "Priority", "Audit Trail"])
     
-    return {
-        "symptom_out": symptom_out,
-        "med_out": med_out,
-        "risk_out": risk_out,
-        "priority_out": priority_out,
-        "routing_out": routing_out,
-        "explanation": explanation,
-        "alerts": alerts
-    }
+    with t1:
+        st.dataframe(pd.DataFrame(results['symptom_out']['symptoms'], columns=["Symptom"]), use_container_width=True, hide_index=True)
+        
+    with t2:
+        interactions = results['med_out']['interactions']
+        if interactions:
+            # Flatten for display
+            flat_ints = []
+            for i in interactions:
+                flat_ints.append({
+                    "Drug A": i['pair'][0],
+                    "Drug B": i['pair'][1],
+                    "Severity": i['severity'],
+                    "Mechanism": i.get('mechanism', 'Unknown'),
+                    "Recommended Action": i.get('recommended_action', 'N/A'),
+                    "Source": i.get('source', 'Unknown')
+                })
+            st.dataframe(pd.DataFrame(flat_ints), use_container_width=True, hide_index=True)
+        else:
+            st.info("No clinically significant interactions identified.")
+            
+    with t3:
+        c1, c2 = st.columns([1, 2])
+        with c1:
+            st.metric("Risk Score", f"{results['risk_out']['risk_score']:.4f}")
+            st.metric("Risk Level", results['risk_out']['risk_level'])
+        with c2:
+            st.write("Top Features:")
+            st.dataframe(pd.DataFrame(results['risk_out']['top_features'], columns=["Feature"]), use_container_width=True, hide_index=True)
+            
+    with t4:
+        p_out = results['priority_out']
+        st.write(f"**Priority:** {p_out['priority']}")
+        st.write("**Reasons:**")
+        st.dataframe(pd.DataFrame(p_out.get('reasons', []), columns=["Reason"]), use_container_width=True, hide_index=True)
+
+    with t5:
+        history = load_audit_store().patient_history(patient_id)
+        if history:
+            st.dataframe(pd.DataFrame(history), use_container_width=True, hide_index=True)
+        else:
+            st.info("No audit events recorded for this patient.")
+
+def render_cohort_page():
+    results_files = list_results_files()
+    if not results_files:
+        st.info("No batch results found. Run pipeline.py first.")
+        return
+
+    with st.sidebar:
+        st.header("Cohort")
+        results_path = st.selectbox("Results File", results_files, format_func=os.path.basename)
+        records, frame = load_cohort(results_path, os.path.getmtime(results_path))
+        priorities = st.multiselect("Priority", ['Critical', 'High', 'Medium', 'Low'])
+        risk_levels = st.multiselect("Risk Level", list(frame['risk_level'].cat.categories))
+        teams = st.multiselect("Team", list(frame['team'].cat.categories))
+        alerts_only = st.checkbox("Alerts only")
+        search = st.text_input("Patient ID contains")
+        sort_by = st.selectbox("Sort By", list(SORT_COLUMNS))
+        descending = st.checkbox("Descending", value=True)
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+    view = sort_cohort(filter_cohort(frame, priorities, risk_levels, teams, alerts_only, search), sort_by, descending)
+
+    counts = view['priority'].value_counts()
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Patients", f"{len(view):,}")
+    c2.metric("🚨 Critical", f"{counts.get('Critical', 0):,}")
+    c3.metric("🚑 High", f"{counts.get('High', 0):,}")
+    c4.metric("Medium", f"{counts.get('Medium', 0):,}")
+    c5.metric("⚠️ With Alerts", f"{int((view['n_alerts'] > 0).sum()):,}")
+
+    n_pages = max(1, -(-len(view) // page_size))
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1)
+    page_df, _ = paginate(view, page, page_size)
+    st.dataframe(page_df.drop(columns=['priority_rank', 'record']), use_container_width=True, hide_index=True)
+
+    if page_df.empty:
+        return
+    st.divider()
+    selected = st.selectbox("Open Patient", page_df['record'].tolist(),
+                            format_func=lambda r: f"{records[r]['patient_id']} ({records[r]['priority']})")
+    record = records[selected]
+    # Drill-down reuses the stored result; no agents are re-run
+    render_analysis(analysis_from_record(record), record['patient_id'], patient_timeseries(record['patient_id']))
 
 st.title("🏥 Patient Safety Guardian")
 
+page_view = st.sidebar.radio("View", ["Patient Analysis", "Cohort Overview"])
+if page_view == "Cohort Overview":
+    render_cohort_page()
+    st.stop()
+
 # Layout: Sidebar (Narrow) + Main (Wide)
 with st.sidebar:
     st.header("Input Data")
@@ -137,16 +326,13 @@ with st.sidebar:
 
     if input_mode == "Load Sample":
         try:
-            with open('data/test_samples.json', 'r') as f:
-                samples = json.load(f)
+            samples = load_samples()
             sample_ids = [s['patient_id'] for s in samples]
             selected_id = st.selectbox("Select Patient", sample_ids)
             sample_data = next(s for s in samples if s['patient_id'] == selected_id)
             
             # Load Time Series
-            if os.path.exists('data/patient_data_timeseries.csv'):
-                ts_all = pd.read_csv('data/patient_data_timeseries.csv')
-                timeseries_df = ts_all[ts_all['patient_id'] == selected_id]
+            timeseries_df = patient_timeseries(selected_id)
                 
         except FileNotFoundError:
             st.error("Data not found. Run data_generator.py first.")
@@ -177,143 +363,16 @@ with st.sidebar:
     run_btn = st.button("Run Analysis", type="primary")
 
 # Main Content
-if run_btn:
-    with st.spinner("Analyzing..."):
-        results = run_analysis(sample_data)
-        
-        # Alerts Banner
-        if results['alerts']:
-            for alert in results['alerts']:
-                st.markdown(f"<div class='alert-box'><strong>{alert['code']}</strong>: {alert['rationale']}</div>", unsafe_allow_html=True)
-
-        # KPIs with Icons
-        c1, c2, c3, c4 = st.columns(4)
-        c1.metric("⚠️ Risk Level", results['risk_out']['risk_level'], f"Score: {results['risk_out']['risk_score']:.2f}")
-        c2.metric("🚑 Priority", results['priority_out']['priority'])
-        c3.metric("💊 Interactions", len(results['med_out']['interactions']))
-        c4.metric("🩺 Symptoms", len(results['symptom_out']['symptoms']))
-        
-        # Vitals Trend
-        if not timeseries_df.empty:
-            st.divider()
-            st.subheader("Vitals Trend (Last 12h)")
-            
-            df_vitals = timeseries_df.copy()
-            df_vitals['timestamp'] = pd.to_datetime(df_vitals['timestamp'])
-            df_vitals = df_vitals.sort_values('timestamp')
-            
-            # Relative Time Labels
-            last_time = df_vitals['timestamp'].max()
-            # Create readable labels like "-4h"
-            df_vitals['Time Label'] = df_vitals['timestamp'].apply(lambda x: f"{int((x - last_time).total_seconds() / 3600)}h" if (x - last_time).total_seconds() != 0 else "Now")
-            
-            # Downsample if too many points (take last 8)
-            if len(df_vitals) > 8:
-                df_vitals = df_vitals.tail(8)
-            
-            c1, c2, c3 = st.columns(3)
-            
-            with c1:
-                st.caption("Heart Rate (bpm)")
-                st.line_chart(df_vitals.set_index('Time Label')['hr'], height=120)
-                curr = df_vitals['hr'].iloc[-1]
-                st.markdown(f"**Min:** {df_vitals['hr'].min()} | **Max:** {df_vitals['hr'].max()} | **Last:** {curr}")
-                
-            with c2:
-                st.caption("Systolic BP (mmHg)")
-                st.line_chart(df_vitals.set_index('Time Label')['sbp'], height=120)
-                curr = df_vitals['sbp'].iloc[-1]
-                st.markdown(f"**Min:** {df_vitals['sbp'].min()} | **Max:** {df_vitals['sbp'].max()} | **Last:** {curr}")
-                
-            with c3:
-                st.caption("SpO2 (%)")
-                st.line_chart(df_vitals.set_index('Time Label')['spo2'], height=120)
-                curr = df_vitals['spo2'].iloc[-1]
-                st.markdown(f"**Min:** {df_vitals['spo2'].min()} | **Max:** {df_vitals['spo2'].max()} | **Last:** {curr}")
-
-        st.divider()
-        
-        # Routing Badge
-        routing = results['routing_out']
-        badge_color = "#dc3545" if routing['escalated'] else "#0d6efd"
-        st.markdown(f"""
-        <div style='margin-bottom:10px;'>
-            <span style='background-color:{badge_color}; color:white; padding:8px 12px; border-radius:5px; font-weight:bold;'>
-                Assigned to: {routing['assigned_to']} ({routing['team']})
-            </span>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Explanation Card
-        card_class = "clinical-card"
-        if results['risk_out']['risk_level'] == "High": card_class += " high-risk"
-        elif results['risk_out']['risk_level'] == "Medium": card_class += " medium-risk"
-        
-        st.markdown(f"""
-        <div class="{card_class}">
-            <h4 style='margin-top:0; border-bottom:1px solid #ddd; padding-bottom:10px;'>Clinical Summary</h4>
-            {results['explanation'].replace(chr(10), '<br>')}
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Clinician Actions
-        st.markdown("### Clinician Actions")
-        c1, c2, c3 = st.columns(3)
-        if c1.button("Acknowledge", use_container_width=True):
-            log_action(sample_data['patient_id'], "Acknowledged")
-            st.toast("Assignment logged ✓")
-        if c2.button("Assign to Me", use_container_width=True):
-            log_action(sample_data['patient_id'], "Assigned to Self")
-            st.toast("Assignment logged ✓")
-            
-        with c3:
-            with st.popover("Override Routing", use_container_width=True):
-                reason = st.text_input("Reason for override")
-                if st.button("Confirm Override"):
-                    if reason:
-                        log_action(sample_data['patient_id'], "Override Routing", reason=reason)
-                        st.toast("Override logged ✓")
-                    else:
-                        st.error("Reason required")
-
-        st.divider()
+if sample_data:
+    analysis_key = (sample_data['patient_id'], input_hash(sample_data), series_hash(timeseries_df))
+    if run_btn:
+        cached_analysis(sample_data, timeseries_df, analysis_key)
+        st.session_state['active_analysis'] = analysis_key
 
-        # Tabs
-        st.subheader("Agent Breakdown")
-        t1, t2, t3, t4 = st.tabs(["Symptoms", "Med Safety", "Risk Model", "Priority"])
-        
-        with t1:
-            st.dataframe(pd.DataFrame(results['symptom_out']['symptoms'], columns=["Symptom"]), use_container_width=True, hide_index=True)
-            
-        with t2:
-            interactions = results['med_out']['interactions']
-            if interactions:
-                # Flatten for display
-                flat_ints = []
-                for i in interactions:
-                    flat_ints.append({
-                        "Drug A": i['pair'][0],
-                        "Drug B": i['pair'][1],
-                        "Severity": i['severity'],
-                        "Mechanism": i.get('mechanism', 'Unknown'),
-                        "Recommended Action": i.get('recommended_action', 'N/A'),
-                        "Source": i.get('source', 'Unknown')
-                    })
-                st.dataframe(pd.DataFrame(flat_ints), use_container_width=True, hide_index=True)
-            else:
-                st.info("No clinically significant interactions identified.")
-                
-        with t3:
-            c1, c2 = st.columns([1, 2])
-            with c1:
-                st.metric("Risk Score", f"{results['risk_out']['risk_score']:.4f}")
-                st.metric("Risk Level", results['risk_out']['risk_level'])
-            with c2:
-                st.write("Top Features:")
-                st.dataframe(pd.DataFrame(results['risk_out']['top_features'], columns=["Feature"]), use_container_width=True, hide_index=True)
-                
-        with t4:
-            p_out = results['priority_out']
-            st.write(f"**Priority:** {p_out['priority']}")
-            st.write("**Reasons:**")
-            st.dataframe(pd.DataFrame(p_out.get('reasons', []), columns=["Reason"]), use_container_width=True, hide_index=True)
+    # Patients already analysed this session with the same inputs re-render from cache
+    entry = st.session_state.get('analysis_cache', {}).get(analysis_key)
+    if entry is not None:
+        st.session_state['active_analysis'] = analysis_key
+        render_analysis(entry['results'], sample_data['patient_id'], timeseries_df, entry['vitals'], entry['charts'])
+    elif st.session_state.get('active_analysis'):
+        st.info("Inputs changed since the last analysis. Click Run Analysis to update.")
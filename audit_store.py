@@ -0,0 +1,206 @@
+import argparse
+import csv
+import datetime
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from utils import ensure_dirs
+
+ROUTING_COLUMNS = ['timestamp', 'patient_id', 'priority', 'reason', 'assigned_to', 'team', 'escalated_by']
+ACTION_COLUMNS = ['timestamp', 'patient_id', 'action', 'user', 'reason']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS routing_log (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    priority TEXT,
+    reason TEXT,
+    assigned_to TEXT,
+    team TEXT,
+    escalated_by TEXT,
+    run_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_routing_patient_ts ON routing_log (patient_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_routing_ts ON routing_log (timestamp);
+CREATE INDEX IF NOT EXISTS idx_routing_team_ts ON routing_log (team, timestamp);
+CREATE INDEX IF NOT EXISTS idx_routing_run ON routing_log (run_id, patient_id);
+
+CREATE TABLE IF NOT EXISTS actions_log (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    action TEXT,
+    user TEXT,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_actions_patient_ts ON actions_log (patient_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_actions_ts ON actions_log (timestamp);
+"""
+
+
+class AuditStore:
+    """
+    Embedded SQLite (WAL) store for routing decisions and clinician actions.
+    Writes are committed immediately unless made inside batch(), where they are
+    buffered and inserted with executemany every batch_size rows.
+    """
+
+    def __init__(self, db_path='evidence/audit.db', batch_size=500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        if db_path != ':memory:' and os.path.dirname(db_path):
+            ensure_dirs([os.path.dirname(db_path)])
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(routing_log)").fetchall()]
+        if columns and 'run_id' not in columns:
+            self.conn.execute("ALTER TABLE routing_log ADD COLUMN run_id TEXT")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._pending = {'routing_log': [], 'actions_log': []}
+        self._batch_depth = 0
+
+    def _insert(self, table, columns, rows):
+        placeholders = ", ".join("?" for _ in columns)
+        self.conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+    def _queue(self, table, row):
+        with self._lock:
+            self._pending[table].append(row)
+            if not self._batch_depth or len(self._pending[table]) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not any(self._pending.values()):
+                return
+            with self.conn:
+                if self._pending['routing_log']:
+                    self._insert('routing_log', ROUTING_COLUMNS + ['run_id'], self._pending['routing_log'])
+                if self._pending['actions_log']:
+                    self._insert('actions_log', ACTION_COLUMNS, self._pending['actions_log'])
+            self._pending = {'routing_log': [], 'actions_log': []}
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self.flush()
+
+    def log_routing(self, patient_id, priority, reason, assigned_to, team, escalated_by="System", timestamp=None, run_id=None):
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        self._queue('routing_log', (timestamp, patient_id, priority, reason, assigned_to, team, escalated_by, run_id))
+
+    def log_action(self, patient_id, action, user="Clinician", reason=None, timestamp=None):
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        self._queue('actions_log', (timestamp, patient_id, action, user, reason))
+
+    def _query(self, sql, params):
+        with self._lock:
+            self.flush()
+            return [dict(r) for r in self.conn.execute(sql, params).fetchall()]
+
+    def routing_history(self, patient_id=None, team=None, since=None, until=None, limit=None):
+        clauses, params = [], []
+        for column, op, value in (('patient_id', '=', patient_id), ('team', '=', team),
+                                  ('timestamp', '>=', since), ('timestamp', '<', until)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        sql = "SELECT " + ", ".join(ROUTING_COLUMNS) + " FROM routing_log"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql, params)
+
+    def routed_patients(self, run_id):
+        rows = self._query("SELECT DISTINCT patient_id FROM routing_log WHERE run_id = ?", [run_id])
+        return {r['patient_id'] for r in rows}
+
+    def action_history(self, patient_id, since=None, until=None):
+        sql = "SELECT " + ", ".join(ACTION_COLUMNS) + " FROM actions_log WHERE patient_id = ?"
+        params = [patient_id]
+        if since is not None:
+            sql += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND timestamp < ?"
+            params.append(until)
+        return self._query(sql + " ORDER BY timestamp DESC", params)
+
+    def patient_history(self, patient_id, since=None, until=None):
+        # Routing decisions and clinician actions for one patient, newest first
+        events = [dict(r, event='routing') for r in self.routing_history(patient_id, since=since, until=until)]
+        events += [dict(r, event='action') for r in self.action_history(patient_id, since=since, until=until)]
+        return sorted(events, key=lambda e: e['timestamp'], reverse=True)
+
+    def _import_rows(self, table, columns, path, jitter_seconds):
+        if not path or not os.path.exists(path):
+            return 0
+        content = [c for c in columns if c != 'timestamp']
+        placeholders = ", ".join("?" for _ in columns)
+        # Same content within the jitter window (patient_id first, so the (patient_id, timestamp) index is used)
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) SELECT {placeholders} "
+               f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE patient_id = ? AND timestamp BETWEEN ? AND ? AND "
+               + " AND ".join(f"{c} IS ?" for c in content if c != 'patient_id') + ")")
+        window = datetime.timedelta(seconds=jitter_seconds)
+        count = 0
+        with open(path, newline='') as f, self._lock, self.conn:
+            for row in csv.DictReader(f):
+                values = [row.get(c) or None for c in columns]
+                record = dict(zip(columns, values))
+                try:
+                    ts = datetime.datetime.fromisoformat(record['timestamp'])
+                    low, high = (ts - window).isoformat(), (ts + window).isoformat()
+                except (TypeError, ValueError):
+                    low = high = record['timestamp']
+                params = [record['patient_id'], low, high] + [record[c] for c in content if c != 'patient_id']
+                cur = self.conn.execute(sql, values + params)
+                count += cur.rowcount
+        return count
+
+    def import_csv(self, routing_csv='evidence/routing_log.csv', actions_csv='evidence/actions_log.csv',
+                   jitter_seconds=1.0):
+        """
+        Import legacy CSV logs. A row is skipped if one with the same content
+        (every column but the timestamp) is already stored within
+        jitter_seconds of it: re-imports, and the near-identical rows the old
+        logger wrote when a page re-ran. Identical decisions further apart
+        (e.g. separate runs) are kept as separate events.
+        """
+        self.flush()
+        return {
+            "routing_log": self._import_rows('routing_log', ROUTING_COLUMNS, routing_csv, jitter_seconds),
+            "actions_log": self._import_rows('actions_log', ACTION_COLUMNS, actions_csv, jitter_seconds)
+        }
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import legacy CSV audit logs into the SQLite audit store.")
+    parser.add_argument('--db', type=str, default='evidence/audit.db')
+    parser.add_argument('--routing_csv', type=str, default='evidence/routing_log.csv')
+    parser.add_argument('--actions_csv', type=str, default='evidence/actions_log.csv')
+    parser.add_argument('--jitter_seconds', type=float, default=1.0,
+                        help="Rows with the same content this close together are imported once")
+    args = parser.parse_args()
+    store = AuditStore(args.db)
+    counts = store.import_csv(args.routing_csv, args.actions_csv, args.jitter_seconds)
+    store.close()
+    print(f"Imported {counts['routing_log']} routing rows and {counts['actions_log']} action rows into {args.db}")
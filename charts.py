@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+VITAL_CHARTS = [('hr', "Heart Rate (bpm)"), ('sbp', "Systolic BP (mmHg)"), ('spo2', "SpO2 (%)")]
+WINDOWS = {"12h": 12, "24h": 24, "72h": 72, "All": None}
+
+
+def prepare_series(timeseries_df):
+    """Sort once and add hours relative to the latest reading plus display labels, all vectorized."""
+    df = timeseries_df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    hours = (df['timestamp'] - df['timestamp'].iloc[-1]) / pd.Timedelta(hours=1) if len(df) else pd.Series(dtype=float)
+    df['hours'] = hours.to_numpy(dtype=float)
+    # "-4h" / "-3.5h", minutes inside the last hour ("-20m"), and "Now" for the latest reading
+    minutes = np.round(df['hours'].to_numpy() * 60).astype(int)
+    hour_labels = df['hours'].round(1).map('{:g}h'.format).to_numpy()
+    minute_labels = np.char.add(minutes.astype(str), 'm')
+    df['Time Label'] = np.where(minutes == 0, "Now", np.where(minutes > -60, minute_labels, hour_labels))
+    return df
+
+
+def window(prepared, hours=None):
+    if hours is None or prepared.empty:
+        return prepared
+    return prepared[prepared['hours'].to_numpy() >= -hours]
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last points and, per
+    bucket, the point forming the largest triangle with the previously kept
+    point and the next bucket's mean, so peaks and troughs survive.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:nhi].mean()
+        avg_y = y[hi:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return np.unique(out)
+
+
+def minmax_indices(y, n_out):
+    """Min and max of each of n_out/2 equal buckets (plus the endpoints), in time order."""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(int)
+    keep = [0, n - 1]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi > lo:
+            keep.extend((lo + int(np.argmin(y[lo:hi])), lo + int(np.argmax(y[lo:hi]))))
+    return np.unique(keep)
+
+
+def downsample(prepared, column, target_points=200, method='lttb'):
+    values = prepared[column].to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    frame = prepared.loc[valid, ['hours', 'Time Label', column]]
+    if method == 'minmax':
+        idx = minmax_indices(values[valid], target_points)
+    else:
+        idx = lttb_indices(frame['hours'].to_numpy(), values[valid], target_points)
+    return frame.iloc[idx]
+
+
+def summarize(prepared, columns):
+    # One aggregation over all vitals instead of a min/max/last pass per chart
+    if prepared.empty:
+        return {}
+    stats = prepared[columns].agg(['min', 'max'])
+    last = prepared[columns].iloc[-1]
+    return {c: {"min": stats.at['min', c], "max": stats.at['max', c], "last": last[c]} for c in columns}
+
+
+def chart_data(prepared, window_hours=None, target_points=200, method='lttb', columns=None):
+    columns = columns or [c for c, _ in VITAL_CHARTS]
+    frame = window(prepared, window_hours)
+    return {
+        "series": {c: downsample(frame, c, target_points, method) for c in columns},
+        "summary": summarize(frame, columns),
+        "n_points": len(frame),
+    }
@@ -0,0 +1,102 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+from agents.explanation_agent import ExplanationAgent
+from utils import load_json
+from worklist import PRIORITY_RANK
+
+SORT_COLUMNS = {
+    "Priority": ['priority_rank', 'priority_score', 'risk_score'],
+    "Risk Score": ['risk_score'],
+    "Alerts": ['n_alerts', 'priority_rank'],
+    "Interactions": ['n_interactions', 'priority_rank'],
+    "Patient ID": ['patient_id'],
+}
+
+
+def list_results_files(evidence_dir='evidence'):
+    # Newest first; file names carry the run timestamp
+    return sorted(glob.glob(os.path.join(evidence_dir, 'results_*.json')), reverse=True)
+
+
+def load_results(path):
+    return load_json(path)
+
+
+def build_cohort_frame(records):
+    # One flat row per stored pipeline result; 'record' indexes back into records
+    routing = [r.get('routing') or {} for r in records]
+    alerts = [r.get('alerts') or [] for r in records]
+    priority = [r.get('priority', 'Low') for r in records]
+    frame = pd.DataFrame({
+        "patient_id": [r.get('patient_id', 'Unknown') for r in records],
+        "priority": pd.Categorical(priority, categories=['Critical', 'High', 'Medium', 'Low']),
+        "priority_rank": np.array([PRIORITY_RANK.get(p, 0) for p in priority], dtype=np.int8),
+        "priority_score": np.array([r.get('priority_score') or 0.0 for r in records], dtype=float),
+        "risk_score": np.array([r.get('risk_score') or 0.0 for r in records], dtype=float),
+        "risk_level": pd.Categorical([r.get('risk_level', 'Unknown') for r in records]),
+        "n_alerts": np.array([len(a) for a in alerts], dtype=np.int16),
+        "alerts": [", ".join(a['code'] for a in al) for al in alerts],
+        "team": pd.Categorical([rt.get('team', 'General Ward') for rt in routing]),
+        "assigned_to": [rt.get('assigned_to', 'Routine Queue') for rt in routing],
+        "n_interactions": np.array([len(r.get('interactions') or []) for r in records], dtype=np.int16),
+        "record": np.arange(len(records)),
+    })
+    return frame
+
+
+def filter_cohort(frame, priorities=None, risk_levels=None, teams=None, alerts_only=False, search=None):
+    mask = np.ones(len(frame), dtype=bool)
+    if priorities:
+        mask &= frame['priority'].isin(priorities).to_numpy()
+    if risk_levels:
+        mask &= frame['risk_level'].isin(risk_levels).to_numpy()
+    if teams:
+        mask &= frame['team'].isin(teams).to_numpy()
+    if alerts_only:
+        mask &= frame['n_alerts'].to_numpy() > 0
+    if search:
+        mask &= frame['patient_id'].str.contains(search, case=False, regex=False).to_numpy()
+    return frame[mask]
+
+
+def sort_cohort(frame, by="Priority", descending=True):
+    return frame.sort_values(SORT_COLUMNS.get(by, SORT_COLUMNS["Priority"]), ascending=not descending, kind='stable')
+
+
+def paginate(frame, page, page_size):
+    n_pages = max(1, -(-len(frame) // page_size))
+    page = min(max(1, page), n_pages)
+    start = (page - 1) * page_size
+    return frame.iloc[start:start + page_size], n_pages
+
+
+def explanation_for_record(record, explanation_agent=None):
+    if record.get('explanation'):
+        return record['explanation']
+    if record.get('explanation_deferred'):
+        return (explanation_agent or ExplanationAgent()).from_result(record)
+    return "Explanation was not generated for this patient in this run."
+
+
+def analysis_from_record(record):
+    # Shape a stored pipeline result like TriageGraph.evaluate output so the UI can render it without recomputing
+    return {
+        "symptom_out": {"symptoms": record.get('symptoms', []), "medications_mentioned": []},
+        "med_out": {"interactions": record.get('interactions', [])},
+        "meds_list": record.get('medications_mentioned', []),
+        "risk_out": {
+            "risk_score": record.get('risk_score', 0.0),
+            "risk_level": record.get('risk_level', 'Unknown'),
+            "top_features": record.get('top_features', [])
+        },
+        "priority_out": {
+            "priority": record.get('priority', 'Low'),
+            "score": record.get('priority_score'),
+            "reasons": record.get('reasons', [])
+        },
+        "routing_out": record.get('routing', {}),
+        "explanation": explanation_for_record(record),
+        "alerts": record.get('alerts', [])
+    }
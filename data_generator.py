@@ -5,9 +5,9 @@ import random
 import json
 from utils import seed_everything, ensure_dirs
 
-def generate_data(n_samples, seed, realistic=True):
+def generate_frames(n_samples, seed, realistic=True):
+    # In-memory cohort: (summary DataFrame, timeseries DataFrame, test sample dicts)
     seed_everything(seed)
-    ensure_dirs(['data'])
 
     # Constants
     MEDICATIONS = [
@@ -94,6 +94,7 @@ def generate_data(n_samples, seed, realistic=True):
             base_rr += 2
 
         patient_ts = []
+        deterioration_onset = None
         
         current_hr = base_hr
         current_sbp = base_sbp
@@ -115,6 +116,8 @@ def generate_data(n_samples, seed, realistic=True):
             
             # Apply Deterioration Trend in last few steps
             if is_deteriorating and t > num_steps // 2:
+                if deterioration_onset is None:
+                    deterioration_onset = timestamp.isoformat()
                 if deterioration_type == 'sepsis':
                     current_hr += random.randint(2, 5)
                     current_temp += random.uniform(0.1, 0.3)
@@ -176,18 +179,26 @@ def generate_data(n_samples, seed, realistic=True):
             'rr': last_reading['rr'],
             'deterioration_label': 1 if is_deteriorating else 0,
             'deterioration_type': deterioration_type if is_deteriorating else 'None',
+            # First reading with the deterioration trend applied (empty for stable patients)
+            'deterioration_onset': deterioration_onset,
             'timestamp': last_reading['timestamp']
         })
 
-    # Save Files
-    pd.DataFrame(summary_data).to_csv('data/patient_summary.csv', index=False)
-    pd.DataFrame(timeseries_data).to_csv('data/patient_data_timeseries.csv', index=False)
-    
-    # Generate Test Samples JSON for Pipeline (subset)
+    # Test Samples for Pipeline (subset)
     test_samples = []
     for i in range(min(10, n_samples)):
         row = summary_data[i].copy()
         test_samples.append(row)
+
+    return pd.DataFrame(summary_data), pd.DataFrame(timeseries_data), test_samples
+
+def generate_data(n_samples, seed, realistic=True):
+    summary_df, timeseries_df, test_samples = generate_frames(n_samples, seed, realistic)
+    ensure_dirs(['data'])
+
+    # Save Files
+    summary_df.to_csv('data/patient_summary.csv', index=False)
+    timeseries_df.to_csv('data/patient_data_timeseries.csv', index=False)
     
     with open('data/test_samples.json', 'w') as f:
         json.dump(test_samples, f, indent=4)
@@ -0,0 +1,196 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+TS_VITALS = ['hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr']
+# Hours spent under these levels inside the window (qSOFA SBP and the desaturation alert level)
+LOW_THRESHOLDS = {'sbp': 100, 'spo2': 94}
+WINDOW = 6
+
+FEATURE_COLUMNS = (
+    [f'{v}_slope' for v in TS_VITALS] +
+    [f'{v}_delta' for v in TS_VITALS] +
+    [f'{v}_std' for v in TS_VITALS] +
+    [f'{v}_hours_below_{t}' for v, t in LOW_THRESHOLDS.items()]
+)
+
+
+def _window_sums(values, group_start, window):
+    # Trailing-window sums within each patient from one cumulative sum: O(rows), no Python loop
+    cum = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+    idx = np.arange(len(values))
+    lo = np.maximum(idx - window + 1, group_start)
+    return cum[idx + 1] - cum[lo], (idx - lo + 1).astype(float)
+
+
+def compute_features(readings, window=WINDOW, baseline=None, origin=None):
+    """
+    Windowed features for every (patient_id, timestamp) reading in one grouped pass.
+    baseline / origin (indexed by patient_id) override each patient's first
+    reading and first timestamp, so an appended chunk is featurized exactly as
+    it would be inside the full history.
+    """
+    df = readings.sort_values(['patient_id', 'timestamp'], kind='stable').reset_index(drop=True)
+    pids = df['patient_id'].to_numpy()
+    ts = pd.to_datetime(df['timestamp'])
+    n = len(df)
+    starts = np.r_[True, pids[1:] != pids[:-1]] if n else np.zeros(0, dtype=bool)
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0)) if n else np.zeros(0, dtype=int)
+
+    y = df[TS_VITALS].to_numpy(dtype=float)
+    first = pd.DataFrame(y[group_start], columns=TS_VITALS)
+    if baseline is not None:
+        known = pd.Series(pids).isin(baseline.index).to_numpy()
+        first.loc[known, TS_VITALS] = baseline.loc[pids[known], TS_VITALS].to_numpy(dtype=float)
+    t0 = ts.to_numpy()[group_start]
+    if origin is not None:
+        known = pd.Series(pids).isin(origin.index).to_numpy()
+        t0[known] = pd.to_datetime(origin.loc[pids[known]]).to_numpy()
+    hours = (ts.to_numpy() - t0) / np.timedelta64(1, 'h')
+    dt = np.where(starts, 0.0, np.diff(hours, prepend=0.0))
+
+    # Centre on the baseline so the running sums stay small and the variance does not cancel
+    delta = y - first.to_numpy()
+    x = hours[:, None]
+    sx, count = _window_sums(x, group_start, window)
+    sy, _ = _window_sums(delta, group_start, window)
+    sxx, _ = _window_sums(x * x, group_start, window)
+    sxy, _ = _window_sums(x * delta, group_start, window)
+    syy, _ = _window_sums(delta * delta, group_start, window)
+    c = count[:, None]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denom = c * sxx - sx * sx
+        slope = np.where(denom > 1e-12, (c * sxy - sx * sy) / denom, 0.0)
+        var = np.where(c > 1, (syy - sy * sy / c) / (c - 1), 0.0)
+
+    out = pd.DataFrame({'patient_id': pids, 'timestamp': df['timestamp'].to_numpy()})
+    for j, v in enumerate(TS_VITALS):
+        out[f'{v}_slope'] = slope[:, j]
+    for j, v in enumerate(TS_VITALS):
+        out[f'{v}_delta'] = delta[:, j]
+    for j, v in enumerate(TS_VITALS):
+        out[f'{v}_std'] = np.sqrt(np.clip(var[:, j], 0.0, None))
+    for v, threshold in LOW_THRESHOLDS.items():
+        below = (df[v].to_numpy(dtype=float) < threshold) * dt
+        out[f'{v}_hours_below_{threshold}'] = _window_sums(below[:, None], group_start, window)[0][:, 0]
+    return out
+
+
+class TimeseriesFeatureStore:
+    """
+    Windowed vitals features keyed by (patient_id, timestamp). The full history
+    is featurized once; append() only featurizes the new readings, using the
+    last `window` readings and the baseline kept per patient.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.features = pd.DataFrame(columns=['patient_id', 'timestamp'] + FEATURE_COLUMNS)
+        self._tail = pd.DataFrame(columns=['patient_id', 'timestamp'] + TS_VITALS)
+        self._baseline = pd.DataFrame(columns=['timestamp'] + TS_VITALS)
+        self._latest = {}
+
+    @classmethod
+    def build(cls, readings, window=WINDOW):
+        store = cls(window)
+        store.append(readings)
+        return store
+
+    def append(self, readings):
+        readings = readings[['patient_id', 'timestamp'] + TS_VITALS]
+        if not len(readings):
+            return self.features.iloc[0:0]
+        # Readings are expected in time order per patient; anything not newer than what is stored is skipped
+        last = readings['patient_id'].map(self._tail.groupby('patient_id')['timestamp'].max())
+        readings = readings[last.isna() | (readings['timestamp'] > last)]
+
+        history = self._tail[self._tail['patient_id'].isin(readings['patient_id'])]
+        combined = pd.concat([history, readings], ignore_index=True) if len(history) else readings
+        new = compute_features(combined, self.window, self._baseline[TS_VITALS], self._baseline['timestamp'])
+        new = new[new.set_index(['patient_id', 'timestamp']).index.isin(
+            readings.set_index(['patient_id', 'timestamp']).index)]
+
+        firsts = readings.sort_values('timestamp').groupby('patient_id').head(1)
+        firsts = firsts[~firsts['patient_id'].isin(self._baseline.index)].set_index('patient_id')
+        self._baseline = pd.concat([self._baseline, firsts[['timestamp'] + TS_VITALS]]) if len(self._baseline) else firsts[['timestamp'] + TS_VITALS]
+
+        tail = pd.concat([self._tail, readings], ignore_index=True) if len(self._tail) else readings
+        self._tail = tail.sort_values(['patient_id', 'timestamp']).groupby('patient_id').tail(self.window).reset_index(drop=True)
+
+        self.features = pd.concat([self.features, new], ignore_index=True) if len(self.features) else new.reset_index(drop=True)
+        self._latest = {}
+        return new
+
+    def _index(self):
+        if not self._latest and len(self.features):
+            ordered = self.features.sort_values(['patient_id', 'timestamp'])
+            self.features = ordered.reset_index(drop=True)
+            groups = self.features.groupby('patient_id', sort=False).indices
+            self._latest = {pid: (idx, self.features['timestamp'].to_numpy()[idx]) for pid, idx in groups.items()}
+        return self._latest
+
+    def lookup(self, patient_id, timestamp=None):
+        """Features of the patient's latest reading at or before timestamp (None if unknown)."""
+        entry = self._index().get(patient_id)
+        if entry is None:
+            return None
+        idx, stamps = entry
+        pos = len(stamps) if timestamp is None else int(np.searchsorted(stamps, str(timestamp), side='right'))
+        if pos == 0:
+            return None
+        return self.features.iloc[idx[pos - 1]][FEATURE_COLUMNS].to_dict()
+
+    def join(self, frame):
+        """Add FEATURE_COLUMNS to a frame with patient_id (and optionally timestamp) columns, as of each row's time."""
+        frame = frame.drop(columns=[c for c in FEATURE_COLUMNS if c in frame.columns])
+        if 'patient_id' not in frame.columns or not len(self.features):
+            return frame.assign(**{c: np.nan for c in FEATURE_COLUMNS})
+        # Rows without a timestamp take the patient's latest features
+        stamps = frame['timestamp'] if 'timestamp' in frame.columns else pd.Series(None, index=frame.index)
+        left = pd.DataFrame({
+            'patient_id': frame['patient_id'].astype(str).to_numpy(),
+            '_at': pd.to_datetime(stamps, errors='coerce').fillna(pd.Timestamp.max).to_numpy(),
+            '_row': np.arange(len(frame)),
+        }).sort_values('_at', kind='stable')
+        right = self.features.assign(
+            patient_id=self.features['patient_id'].astype(str),
+            _at=pd.to_datetime(self.features['timestamp'])
+        ).sort_values('_at', kind='stable')[['patient_id', '_at'] + FEATURE_COLUMNS]
+        merged = pd.merge_asof(left, right, on='_at', by='patient_id', direction='backward').sort_values('_row')
+        values = merged[FEATURE_COLUMNS].astype(float).set_axis(frame.index)
+        return pd.concat([frame, values], axis=1)
+
+    def save(self, store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+        self.features.to_csv(os.path.join(store_dir, 'features.csv'), index=False)
+        self._tail.to_csv(os.path.join(store_dir, 'tail.csv'), index=False)
+        self._baseline.rename_axis('patient_id').reset_index().to_csv(os.path.join(store_dir, 'baseline.csv'), index=False)
+
+    @classmethod
+    def load(cls, store_dir, window=WINDOW):
+        store = cls(window)
+        store.features = pd.read_csv(os.path.join(store_dir, 'features.csv'))
+        store._tail = pd.read_csv(os.path.join(store_dir, 'tail.csv'))
+        store._baseline = pd.read_csv(os.path.join(store_dir, 'baseline.csv')).set_index('patient_id')
+        return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the timeseries feature store.")
+    parser.add_argument('--timeseries', type=str, default='data/patient_data_timeseries.csv')
+    parser.add_argument('--store', type=str, default='data/feature_store')
+    parser.add_argument('--append', action='store_true', help="Add only readings newer than the stored ones")
+    args = parser.parse_args()
+
+    readings = pd.read_csv(args.timeseries)
+    if args.append and os.path.exists(os.path.join(args.store, 'features.csv')):
+        store = TimeseriesFeatureStore.load(args.store)
+        added = store.append(readings)
+        print(f"Appended features for {len(added)} new readings")
+    else:
+        store = TimeseriesFeatureStore.build(readings)
+        print(f"Built features for {len(store.features)} readings of {store.features['patient_id'].nunique()} patients")
+    store.save(args.store)
+    print(f"Feature store saved to {args.store}")
@@ -0,0 +1,249 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+from agents.symptom_agent import SymptomAgent
+from agents.med_safety_agent import MedicationSafetyAgent
+from agents.risk_agent import RiskAgent
+from agents.priority_agent import PriorityAgent
+from agents.explanation_agent import ExplanationAgent
+from agents.routing_agent import RoutingAgent
+from pipeline import build_result
+from triage import TriageGraph, EXPLANATION_POLICIES
+from utils import ensure_dirs
+
+WARMUP_SAMPLE = {
+    "patient_id": "warmup", "clinical_note": "Patient has chest pain. Taking Aspirin.", "medications": "Aspirin, Warfarin",
+    "hr": 80, "sbp": 120, "dbp": 80, "spo2": 98, "temp": 37.0, "rr": 16, "age": 60, "sex": "F", "chronic_conditions": "None"
+}
+
+
+def shared_agents():
+    return dict(
+        symptom_agent=SymptomAgent(), med_agent=MedicationSafetyAgent(), risk_agent=RiskAgent(),
+        priority_agent=PriorityAgent(), explanation_agent=ExplanationAgent(), routing_agent=RoutingAgent(),
+    )
+
+
+class IngestDaemon:
+    """
+    Watches an inbox for one-JSON-file-per-update drops and triages them as they arrive.
+
+    inbox/*.json -> inbox/processing/ (claimed) -> inbox/done/ or inbox/failed/
+
+    A file whose name is already taken in the target directory (the same
+    name submitted again) gets a numeric suffix rather than replacing it.
+
+    The scanner claims settled files oldest first and hands them to per-worker
+    queues of at most queue_size items, keyed by patient so one patient's updates
+    stay in order on one worker (and in that worker's incremental graph). A full
+    queue blocks the scanner, so a burst waits on disk rather than in memory.
+    Results are appended to ingest_results.jsonl as each file finishes, before
+    the file is moved to done/. On shutdown the scanner stops claiming and
+    workers drain what was already claimed; anything left in processing/ after
+    a crash (or a failed move out of it) is put back in the inbox on the next
+    start (at-least-once).
+    """
+
+    def __init__(self, inbox, out_dir='evidence', workers=2, queue_size=64, poll_interval=1.0,
+                 settle_seconds=0.5, agents=None, explanations='all', worklist=None):
+        self.inbox = inbox
+        self.processing = os.path.join(inbox, 'processing')
+        self.done = os.path.join(inbox, 'done')
+        self.failed = os.path.join(inbox, 'failed')
+        ensure_dirs([inbox, self.processing, self.done, self.failed, out_dir])
+        self.results_path = os.path.join(out_dir, 'ingest_results.jsonl')
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.explanations = explanations
+
+        # Pre-warmed workers: agents (model, rules) load once and are shared; each worker owns a graph
+        agents = agents or shared_agents()
+        agents['risk_agent'].predict(WARMUP_SAMPLE)
+        agents['symptom_agent'].extract(WARMUP_SAMPLE['clinical_note'])
+        agents['med_agent'].check(WARMUP_SAMPLE['medications'])
+        self.graphs = [TriageGraph(explanation_policy=explanations, worklist=worklist, **agents) for _ in range(workers)]
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+
+        self.stop_event = threading.Event()
+        self._results_lock = threading.Lock()
+        self._move_lock = threading.Lock()
+        self.stats = {"processed": 0, "failed": 0}
+
+    def recover(self):
+        # Files claimed by a previous process that never finished go back to the inbox
+        for path in sorted(glob.glob(os.path.join(self.processing, '*.json'))):
+            self._move(path, self.inbox)
+
+    def pending_files(self):
+        now = time.time()
+        files = []
+        for path in glob.glob(os.path.join(self.inbox, '*.json')):
+            try:
+                mtime = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            # Skip files the upstream system may still be writing
+            if now - mtime >= self.settle_seconds:
+                files.append((mtime, path))
+        return [path for _, path in sorted(files)]
+
+    def _move(self, path, directory):
+        # Never replace an earlier file of the same name (a resubmission, or one still in flight): suffix .1, .2, ...
+        stem, ext = os.path.splitext(os.path.basename(path))
+        with self._move_lock:
+            target = os.path.join(directory, stem + ext)
+            n = 0
+            while os.path.exists(target):
+                n += 1
+                target = os.path.join(directory, f"{stem}.{n}{ext}")
+            os.replace(path, target)
+        return target
+
+    def _fail(self, path, error):
+        name = os.path.basename(path)
+        with self._results_lock:
+            self.stats['failed'] += 1
+        print(f"Failed {name}: {error}")
+        try:
+            target = self._move(path, self.failed)
+            with open(target + '.error.txt', 'w') as f:
+                f.write(f"{type(error).__name__}: {error}\n")
+        except OSError as e:
+            # Stays in processing/ and is retried on the next start
+            print(f"Could not move {name} to failed/: {e}")
+
+    def scan_once(self):
+        claimed = 0
+        for path in self.pending_files():
+            if self.stop_event.is_set():
+                break
+            try:
+                target = self._move(path, self.processing)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(target) as f:
+                    sample = json.load(f)
+                if not isinstance(sample, dict):
+                    raise ValueError("expected one JSON object per file")
+            except (ValueError, OSError) as e:
+                self._fail(target, e)
+                continue
+            pid = str(sample.get('patient_id', 'Unknown'))
+            worker_queue = self.queues[zlib.crc32(pid.encode()) % len(self.queues)]
+            # Blocks while the worker is behind (backpressure); the claimed file is already safe on disk
+            worker_queue.put((target, sample))
+            claimed += 1
+        return claimed
+
+    def _scan_loop(self):
+        while not self.stop_event.is_set():
+            if not self.scan_once():
+                self.stop_event.wait(self.poll_interval)
+
+    def _work(self, graph, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is None:
+                return
+            path, sample = item
+            # Nothing may end the thread: the scanner would block forever on this worker's full queue
+            try:
+                self._process(graph, path, sample)
+            except Exception as e:
+                print(f"Worker error on {os.path.basename(path)}: {e}")
+
+    def _process(self, graph, path, sample):
+        # Each file is counted once: failed if no result was written, else processed
+        try:
+            pid = sample.get('patient_id', 'Unknown')
+            analysis = graph.evaluate(sample)
+            result = build_result(pid, analysis, sample, self.explanations)
+            line = json.dumps({"file": os.path.basename(path), "patient_id": pid, "result": result})
+            with self._results_lock:
+                with open(self.results_path, 'a') as out:
+                    out.write(line + "\n")
+                    out.flush()
+                    os.fsync(out.fileno())
+                self.stats['processed'] += 1
+        except Exception as e:
+            self._fail(path, e)
+            return
+        try:
+            self._move(path, self.done)
+        except OSError as e:
+            # The result is written; the file stays in processing/ and is re-run on the next start
+            print(f"Could not move {os.path.basename(path)} to done/: {e}")
+
+    def _start_workers(self):
+        self._workers = [threading.Thread(target=self._work, args=(g, q), daemon=True)
+                         for g, q in zip(self.graphs, self.queues)]
+        for t in self._workers:
+            t.start()
+
+    def _drain_workers(self):
+        for q in self.queues:
+            q.put(None)
+        for t in self._workers:
+            t.join()
+
+    def start(self):
+        self.recover()
+        self._start_workers()
+        self._scanner = threading.Thread(target=self._scan_loop, daemon=True)
+        self._scanner.start()
+        return self
+
+    def stop(self):
+        # Stop claiming new files, then let workers finish everything already claimed
+        self.stop_event.set()
+        self._scanner.join()
+        self._drain_workers()
+
+    def run_once(self):
+        """Process the current inbox contents and return (for cron-style use and tests)."""
+        self.settle_seconds = 0
+        self.recover()
+        self._start_workers()
+        self.scan_once()
+        self._drain_workers()
+        return self.stats
+
+    def run_forever(self):
+        self.start()
+        print(f"Watching {self.inbox} with {len(self.graphs)} workers (Ctrl+C to stop)...")
+        signal.signal(signal.SIGTERM, lambda *_: self.stop_event.set())
+        try:
+            while not self.stop_event.is_set():
+                self.stop_event.wait(1.0)
+        except KeyboardInterrupt:
+            pass
+        print("Shutting down; finishing claimed files...")
+        self.stop()
+        print(f"Processed {self.stats['processed']}, failed {self.stats['failed']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a directory for per-patient JSON updates and triage them.")
+    parser.add_argument('--inbox', type=str, default='inbox')
+    parser.add_argument('--out_dir', type=str, default='evidence')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue_size', type=int, default=64, help="Claimed-but-unprocessed files allowed per worker")
+    parser.add_argument('--poll_interval', type=float, default=1.0)
+    parser.add_argument('--explanations', choices=EXPLANATION_POLICIES, default='all')
+    parser.add_argument('--once', action='store_true', help="Process what is in the inbox now and exit")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.inbox, args.out_dir, args.workers, args.queue_size, args.poll_interval,
+                          explanations=args.explanations)
+    if args.once:
+        stats = daemon.run_once()
+        print(f"Processed {stats['processed']}, failed {stats['failed']}")
+    else:
+        daemon.run_forever()
@@ -0,0 +1,147 @@
+import argparse
+import pandas as pd
+from agents.med_safety_agent import MedicationSafetyAgent, rule_pairs
+from agents.symptom_agent import SymptomAgent
+from triage import parse_medications
+
+
+def _comparable(row):
+    # NaN never equals itself, so blank fields would otherwise always look edited
+    return None if row is None else {k: None if pd.isna(v) else v for k, v in row.items()}
+
+
+def changed_pairs(old_rules, new_rules):
+    """Pairs added, removed or edited between two rule tables (as pair_key tuples)."""
+    old, new = rule_pairs(old_rules), rule_pairs(new_rules)
+    return {k for k in old.keys() | new.keys() if _comparable(old.get(k)) != _comparable(new.get(k))}
+
+
+class MedicationIndex:
+    """
+    Inverted index from canonical drug (lower case) to the patients currently on
+    it, kept current with update()/remove(). "Who is on both A and B" is a set
+    intersection, and a rules change only touches patients on a changed pair.
+    Like TriageGraph, a patient with no medications field is indexed on the
+    medications mentioned in their clinical note.
+    """
+
+    def __init__(self, med_agent=None, symptom_agent=None):
+        self.med_agent = med_agent or MedicationSafetyAgent()
+        self._symptom_agent = symptom_agent
+        self._patients = {}
+        self._raw = {}
+        self._drugs = {}
+
+    @classmethod
+    def build(cls, summary, med_agent=None, symptom_agent=None):
+        """From a patient_summary frame (or CSV path) with patient_id, medications and clinical_note."""
+        if isinstance(summary, str):
+            summary = pd.read_csv(summary, usecols=['patient_id', 'medications', 'clinical_note'])
+        index = cls(med_agent, symptom_agent)
+        raw = {pid: index._medications(meds, note)
+               for pid, meds, note in zip(summary['patient_id'], summary['medications'], summary['clinical_note'])}
+        index.med_agent.canonicalize_batch({m for meds in raw.values() for m in meds})
+        for pid, meds in raw.items():
+            index.update(pid, meds)
+        return index
+
+    def _medications(self, medications, clinical_note=None):
+        # Same list TriageGraph._med_list checks: the field, else the note's mentioned medications
+        if not isinstance(medications, (str, list)) or not medications:
+            if not isinstance(clinical_note, str) or not clinical_note:
+                return []
+            if self._symptom_agent is None:
+                self._symptom_agent = SymptomAgent()
+            medications = self._symptom_agent.extract(clinical_note)['medications_mentioned']
+        return parse_medications(medications)
+
+    def _canonical(self, raw):
+        return frozenset(self.med_agent.canonicalize(m).lower() for m in raw)
+
+    def update(self, patient_id, medications, clinical_note=None):
+        """Set a patient's current medication list; returns True if their canonical drugs changed."""
+        raw = self._medications(medications, clinical_note)
+        self._raw[patient_id] = raw
+        return self._set(patient_id, self._canonical(raw))
+
+    def _set(self, patient_id, drugs):
+        old = self._drugs.get(patient_id, frozenset())
+        if drugs == old and patient_id in self._drugs:
+            return False
+        for drug in old - drugs:
+            patients = self._patients[drug]
+            patients.discard(patient_id)
+            if not patients:
+                del self._patients[drug]
+        for drug in drugs - old:
+            self._patients.setdefault(drug, set()).add(patient_id)
+        self._drugs[patient_id] = drugs
+        return True
+
+    def remove(self, patient_id):
+        self._set(patient_id, frozenset())
+        self._drugs.pop(patient_id, None)
+        self._raw.pop(patient_id, None)
+
+    def drugs_for(self, patient_id):
+        return self._drugs.get(patient_id, frozenset())
+
+    def patients_on(self, *drugs):
+        """Patients on every one of `drugs` (names are canonicalized first)."""
+        sets = sorted((self._patients.get(self.med_agent.canonicalize(d).lower(), set()) for d in drugs), key=len)
+        if not sets:
+            return set()
+        # Smallest set first keeps every intersection step small
+        return set(sets[0]).intersection(*sets[1:])
+
+    def patients_on_pairs(self, pairs):
+        affected = set()
+        for a, b in pairs:
+            affected |= self.patients_on(a, b)
+        return affected
+
+    def apply_rules(self, rules):
+        """
+        Swap in a new rule table. Returns the patients whose interaction check may
+        have changed: those on an added/removed/edited pair, plus anyone whose
+        drugs resolve differently under the new vocabulary.
+        """
+        pairs = changed_pairs(self.med_agent.rules, rules)
+        vocabulary = self.med_agent.known_drugs
+        affected = self.patients_on_pairs(pairs)
+        self.med_agent.set_rules(rules)
+        if self.med_agent.known_drugs != vocabulary:
+            self.med_agent.canonicalize_batch({m for raw in self._raw.values() for m in raw})
+            for pid, raw in self._raw.items():
+                if self._set(pid, self._canonical(raw)):
+                    affected.add(pid)
+            affected |= self.patients_on_pairs(pairs)
+        return affected
+
+    def recheck(self, patient_ids):
+        return {pid: self.med_agent.check(self._raw.get(pid, [])) for pid in patient_ids}
+
+    def __len__(self):
+        return len(self._drugs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query patients by medication and find who a rules change affects.")
+    parser.add_argument('--summary', type=str, default='data/patient_summary.csv')
+    parser.add_argument('--rules', type=str, default='data/med_rules.csv')
+    parser.add_argument('--on', type=str, nargs='+', default=None, metavar='DRUG', help="List patients on all of these drugs")
+    parser.add_argument('--new_rules', type=str, default=None,
+                        help="Re-check only the patients affected by the differences from --rules to this file")
+    args = parser.parse_args()
+
+    index = MedicationIndex.build(args.summary, MedicationSafetyAgent(args.rules))
+    print(f"Indexed {len(index)} patients")
+    if args.on:
+        patients = sorted(index.patients_on(*args.on))
+        print(f"{len(patients)} patients on {' + '.join(args.on)}: {', '.join(patients)}")
+    if args.new_rules:
+        affected = index.apply_rules(pd.read_csv(args.new_rules))
+        print(f"{len(affected)} patients affected by the rules change")
+        for pid, result in sorted(index.recheck(affected).items()):
+            pairs = [f"{' + '.join(i['pair'])} ({i['severity']})" for i in result['interactions']]
+            print(f"  {pid}: {', '.join(pairs) or 'no interactions'}")
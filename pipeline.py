@@ -1,108 +1,42 @@
 import argparse
+import glob
 import json
+import os
+import time
+import numpy as np
 import pandas as pd
 import datetime
-from agents.symptom_agent import SymptomAgent
-from agents.med_safety_agent import MedicationSafetyAgent
-from agents.risk_agent import RiskAgent
-from agents.priority_agent import PriorityAgent
+from contextlib import nullcontext
 from agents.explanation_agent import ExplanationAgent
-from agents.routing_agent import RoutingAgent
-from rules.clinical_alerts import check_clinical_rules
+from triage import TriageGraph, EXPLANATION_POLICIES, parse_medications
+from profiling import StageProfiler, MemoryBudget
+from rules.clinical_alerts import screen_severity
 from utils import ensure_dirs, save_json, load_json
 
-def run_pipeline(samples_path, out_dir):
-    ensure_dirs([out_dir])
-    
-    # Load Agents
-    symptom_agent = SymptomAgent()
-    med_agent = MedicationSafetyAgent()
-    risk_agent = RiskAgent()
-    priority_agent = PriorityAgent()
-    routing_agent = RoutingAgent()
-    explanation_agent = ExplanationAgent()
-    
-    # Load Samples
-    try:
-        samples = load_json(samples_path)
-    except FileNotFoundError:
-        print(f"Samples file {samples_path} not found.")
-        return
+def build_result(pid, analysis, sample=None, explanation_policy='all'):
+    result = {
+        "patient_id": pid,
+        "timestamp": analysis.get('timestamp') or (sample or {}).get('timestamp'),
+        "symptoms": analysis['symptom_out']['symptoms'],
+        "medications_mentioned": analysis['meds_list'],
+        "interactions": analysis['med_out']['interactions'],
+        "risk_score": analysis['risk_out']['risk_score'],
+        "risk_level": analysis['risk_out']['risk_level'],
+        "risk_uncertainty": analysis['risk_out'].get('uncertainty'),
+        "top_features": analysis['risk_out'].get('top_features', []),
+        "priority": analysis['priority_out']['priority'],
+        "priority_score": analysis['priority_out'].get('score'),
+        "reasons": analysis['priority_out'].get('reasons', []),
+        "routing": analysis['routing_out'],
+        "explanation": analysis['explanation'],
+        "alerts": analysis['alerts']
+    }
+    if explanation_policy == 'lazy':
+        result['explanation_deferred'] = True
+    return result
 
-    results = []
-    
-    print(f"Running pipeline on {len(samples)} samples...")
-    
-    for sample in samples:
-        pid = sample.get('patient_id', 'Unknown')
-        print(f"Processing {pid}...")
-        
-        # 1. Symptom Extraction
-        symptom_out = symptom_agent.extract(sample.get('clinical_note', ''))
-        
-        # 2. Med Safety
-        # Ensure list of strings
-        meds_input = sample.get('medications', '')
-        if not meds_input:
-            meds_input = symptom_out['medications_mentioned']
-        
-        # If string, split it. If list, keep it.
-        if isinstance(meds_input, str):
-            meds_list = [m.strip() for m in meds_input.split(',') if m.strip()]
-        elif isinstance(meds_input, list):
-            meds_list = [str(m).strip() for m in meds_input if str(m).strip()]
-        else:
-            meds_list = []
-            
-        med_out = med_agent.check(meds_list)
-        
-        # 3. Risk Prediction
-        risk_out = risk_agent.predict(sample)
-        
-        # 4. Clinical Alerts
-        vitals = {k: sample.get(k) for k in ['hr', 'sbp', 'spo2', 'temp', 'rr']}
-        alerts = check_clinical_rules(vitals)
-        
-        # 5. Priority
-        priority_out = priority_agent.decide(symptom_out, med_out, risk_out)
-        
-        # Escalate if alerts
-        if alerts and priority_out['priority'] not in ['High', 'Critical']:
-            priority_out['priority'] = 'High'
-            priority_out['reasons'].append("Clinical Rule Alert Triggered")
-        
-        # 6. Routing
-        routing_out = routing_agent.route(priority_out, pid, alerts)
-        
-        # 7. Explanation
-        explanation = explanation_agent.generate(
-            pid, 
-            sample.get('timestamp', datetime.datetime.now().isoformat()),
-            symptom_out, med_out, risk_out, priority_out, routing_out
-        )
-        
-        result = {
-            "patient_id": pid,
-            "symptoms": symptom_out['symptoms'],
-            "medications_mentioned": meds_list,
-            "interactions": med_out['interactions'],
-            "risk_score": risk_out['risk_score'],
-            "risk_level": risk_out['risk_level'],
-            "priority": priority_out['priority'],
-            "routing": routing_out,
-            "explanation": explanation,
-            "alerts": alerts
-        }
-        results.append(result)
-        
-    # Save Consolidated Results
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_json = f"{out_dir}/results_{timestamp}.json"
-    save_json(results, out_json)
-    print(f"Results saved to {out_json}")
-    
-    # Generate Markdown Report
-    report_path = f"{out_dir}/report_{timestamp}.md"
+def write_report(results, report_path, timestamp, render_deferred=False):
+    explanation_agent = ExplanationAgent()
     with open(report_path, 'w') as f:
         f.write(f"# Patient Safety Guardian Report - {timestamp}\n\n")
         for res in results:
@@ -116,14 +50,339 @@ def run_pipeline(samples_path, out_dir):
                     f.write(f"- {a['code']}: {a['rationale']}\n")
             f.write(f"**Symptoms:** {', '.join(res['symptoms'])}\n")
             f.write(f"**Interactions:** {len(res['interactions'])}\n")
-            f.write("### Clinical Explanation\n")
-            f.write(f"{res['explanation']}\n")
+            explanation = res.get('explanation')
+            if not explanation and render_deferred and res.get('explanation_deferred'):
+                explanation = explanation_agent.from_result(res)
+            if explanation:
+                f.write("### Clinical Explanation\n")
+                f.write(f"{explanation}\n")
             f.write("---\n")
+
+# Checkpointing
+# Results stream to results_<run_id>.partial.jsonl as {"index", "patient_id", "result"} lines.
+# checkpoint_<run_id>.json records how many bytes of that file hold durable, completed
+# results; anything past that offset is discarded and recomputed on --resume.
+
+def checkpoint_path(out_dir, run_id):
+    return f"{out_dir}/checkpoint_{run_id}.json"
+
+def partial_path(out_dir, run_id):
+    return f"{out_dir}/results_{run_id}.partial.jsonl"
+
+def find_checkpoint(out_dir, samples_path, run_id=None):
+    if run_id:
+        path = checkpoint_path(out_dir, run_id)
+        return load_json(path) if os.path.exists(path) else None
+    for path in sorted(glob.glob(f"{out_dir}/checkpoint_*.json"), reverse=True):
+        checkpoint = load_json(path)
+        if checkpoint.get('samples_path') == samples_path:
+            return checkpoint
+    return None
+
+def read_partial(path, offset=None):
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'rb') as f:
+        data = f.read() if offset is None else f.read(offset)
+    for line in data.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            completed[record['index']] = record
+    return completed
+
+def write_checkpoint(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def export_report(results_path, report_path=None):
+    # Full Markdown export of a stored run, rendering any deferred explanations
+    results = load_json(results_path)
+    report_path = report_path or results_path.replace('results_', 'report_').replace('.json', '.md')
+    write_report(results, report_path, os.path.basename(results_path)[len('results_'):-len('.json')], render_deferred=True)
     print(f"Report saved to {report_path}")
+    return report_path
+
+def fast_path_path(out_dir, run_id):
+    return f"{out_dir}/fast_path_{run_id}.jsonl"
+
+def run_fast_path(graph, samples, indices, path):
+    """
+    Route patients with critical rule alerts before any expensive agent runs.
+    Preliminary results are appended to `path` as they are routed; returns
+    {sample index: ms after the pass started} in routing order, so the main
+    pass can enrich them first.
+    """
+    start = time.perf_counter()
+    routed = {}
+    with open(path, 'a') as f:
+        for i in indices:
+            sample = samples[i]
+            fast = graph.fast_route(sample)
+            if fast is None:
+                continue
+            routed[i] = round((time.perf_counter() - start) * 1000, 3)
+            pid = sample.get('patient_id', 'Unknown')
+            f.write(json.dumps({
+                "index": i, "patient_id": pid, "timestamp": sample.get('timestamp'),
+                "priority": fast['priority_out']['priority'], "routing": fast['routing_out'], "alerts": fast['alerts'],
+                "routed_after_ms": routed[i]
+            }) + "\n")
+            f.flush()
+            print(f"FAST PATH {pid}: {fast['priority_out']['priority']} -> {fast['routing_out']['assigned_to']} "
+                  f"({fast['routing_out']['team']})")
+    print(f"Fast path routed {len(routed)} critical patients in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return routed
+
+def fast_path_latency(routed, scheduled, seconds_per_patient):
+    """
+    What the fast path saved: each critical patient's routing time against an
+    estimate of when the full chain would have reached them in `scheduled`
+    order (their position times the run's mean seconds per patient).
+    """
+    position = {i: k for k, i in enumerate(scheduled)}
+    without = [(position[i] + 1) * seconds_per_patient * 1000 for i in routed]
+    return {"patients": len(routed), "fast_ms_max": max(routed.values()),
+            "full_chain_ms_median": float(np.median(without)), "full_chain_ms_max": max(without)}
+
+def severity_order(graph, samples, indices):
+    """
+    Screening pass for --schedule severity: vectorized vitals rules, then a
+    probability-only risk estimate. Returns the indices most urgent first
+    (highest alert severity, then risk; file order breaks ties).
+    """
+    if not indices:
+        return []
+    subset = pd.DataFrame([samples[i] for i in indices])
+    severity = screen_severity(subset)
+    risk = graph.risk_agent.predict_scores(subset)
+    ranked = np.lexsort((np.arange(len(indices)), -risk, -severity))
+    return [indices[k] for k in ranked]
+
+def shrink_caches(graph, minimum=100):
+    """
+    Halve what grows with the number of patients seen: the graph's and the
+    routing agent's per-patient LRUs and the medication name cache (not below
+    `minimum`). Returns False when everything was already at its floor.
+    """
+    before = (graph.max_patients, graph.routing_agent.max_patients, graph.med_agent.MAX_CACHED_NAMES)
+    graph.resize(max(minimum, min(graph.max_patients, len(graph)) // 2))
+    graph.routing_agent.resize(graph.max_patients)
+    med_agent = graph.med_agent
+    med_agent.resize_cache(max(minimum, min(med_agent.MAX_CACHED_NAMES, med_agent.cached_names) // 2))
+    return (graph.max_patients, graph.routing_agent.max_patients, med_agent.MAX_CACHED_NAMES) != before
+
+def run_pipeline(samples_path, out_dir, run_id=None, resume=False, checkpoint_every=100, graph=None,
+                 explanations='all', profile=False, memory_budget_mb=None, fast_path=False,
+                 schedule='file'):
+    ensure_dirs([out_dir])
+
+    # Load Agents
+    if graph is None:
+        graph = TriageGraph()
+    graph.explanation_policy = explanations
+    audit_store = graph.routing_agent.audit_store
+
+    # Load Samples
+    try:
+        samples = load_json(samples_path)
+    except FileNotFoundError:
+        print(f"Samples file {samples_path} not found.")
+        return
+
+    checkpoint = find_checkpoint(out_dir, samples_path, run_id) if resume else None
+    if checkpoint:
+        if checkpoint['n_samples'] != len(samples):
+            raise ValueError(f"Checkpoint {checkpoint['run_id']} was taken over {checkpoint['n_samples']} samples, "
+                             f"but {samples_path} now has {len(samples)}.")
+        run_id = checkpoint['run_id']
+        partial = partial_path(out_dir, run_id)
+        if not os.path.exists(partial) or os.path.getsize(partial) < checkpoint['partial_bytes']:
+            raise ValueError(f"Partial results {partial} are missing or shorter than checkpoint {run_id} records.")
+        # Drop results written after the last checkpoint; they are recomputed below
+        with open(partial, 'ab') as f:
+            f.truncate(checkpoint['partial_bytes'])
+        completed = read_partial(partial)
+        print(f"Resuming run {run_id}: {len(completed)}/{len(samples)} samples already completed.")
+    else:
+        if resume:
+            print("No checkpoint found; starting a new run.")
+        run_id = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        partial = partial_path(out_dir, run_id)
+        open(partial, 'wb').close()
+        completed = {}
+
+    # Patients the interrupted attempt already routed but whose results were lost keep their audit row
+    completed_ids = {r['patient_id'] for r in completed.values()}
+    graph.routing_agent.begin_run(run_id, audit_store.routed_patients(run_id) - completed_ids)
+
+    state = {
+        "run_id": run_id,
+        "samples_path": samples_path,
+        "n_samples": len(samples),
+        "n_completed": len(completed),
+        "partial_bytes": 0
+    }
+
+    # Opt-in profiling: time, allocations and RSS per agent stage (after loading, so only the run is measured)
+    profiler = StageProfiler().start() if profile else None
+    stage = profiler.stage if profiler else (lambda name: nullcontext())
+    graph_nodes = graph.nodes
+    if profiler:
+        profiler.wrap_graph(graph)
+    budget = MemoryBudget(memory_budget_mb) if memory_budget_mb else None
+    note = profiler.note if profiler else print
+    try:
+        print(f"Running pipeline on {len(samples)} samples...")
+
+        order = [i for i in range(len(samples)) if i not in completed]
+        if schedule == 'severity':
+            with stage('screen'):
+                order = severity_order(graph, samples, order)
+            print(f"Scheduled {len(order)} samples by severity screen")
+
+        # Critical rule alerts are routed first; the full chain below enriches them before everyone else
+        if fast_path:
+            with stage('fast_path'):
+                routed = run_fast_path(graph, samples, order, fast_path_path(out_dir, run_id))
+            scheduled = order
+            order = list(routed) + [i for i in order if i not in routed]
+
+        # Canonicalize each distinct medication string once for the whole cohort
+        with stage('med_prepass'):
+            graph.med_agent.canonicalize_batch({m for s in samples for m in parse_medications(s.get('medications', ''))})
+
+        # Audit rows are inserted in batches rather than one transaction per patient
+        with audit_store.batch(), open(partial, 'ab') as out:
+            def save_checkpoint():
+                audit_store.flush()
+                out.flush()
+                os.fsync(out.fileno())
+                state['partial_bytes'] = out.tell()
+                write_checkpoint(checkpoint_path(out_dir, run_id), state)
+
+            since_checkpoint = 0
+            since_shrink = 0
+            stopped = False
+            loop_start = time.perf_counter()
+            try:
+                for i in order:
+                    sample = samples[i]
+                    pid = sample.get('patient_id', 'Unknown')
+                    print(f"Processing {pid}...")
+
+                    analysis = graph.evaluate(sample)
+                    with stage('build_result'):
+                        record = {"index": i, "patient_id": pid, "result": build_result(pid, analysis, sample, explanations)}
+                        out.write((json.dumps(record) + "\n").encode())
+                        if schedule == 'severity':
+                            # Urgent results become readable as soon as they are written
+                            out.flush()
+                    # The result is on its way to disk; the sample is not needed again
+                    samples[i] = None
+                    state['n_completed'] += 1
+                    since_checkpoint += 1
+                    since_shrink += 1
+                    if since_checkpoint >= checkpoint_every:
+                        with stage('checkpoint'):
+                            save_checkpoint()
+                        since_checkpoint = 0
+
+                    if budget is not None and since_shrink >= checkpoint_every and budget.over():
+                        # Near the budget: flush buffered audit rows and results, then shrink chunks and caches
+                        save_checkpoint()
+                        since_checkpoint = since_shrink = 0
+                        if budget.relieve():
+                            continue
+                        shrunk = shrink_caches(graph)
+                        if not shrunk and checkpoint_every == 1:
+                            # Nothing left to give back: stop at the checkpoint rather than run into the OOM killer
+                            note(f"Memory budget: RSS still near {budget.budget_mb} MB at sample {i} with every "
+                                 f"cache at its minimum; stopped after {state['n_completed']}/{len(samples)} "
+                                 f"samples, rerun with --resume to continue")
+                            stopped = True
+                            break
+                        checkpoint_every = max(1, checkpoint_every // 2)
+                        audit_store.batch_size = max(1, audit_store.batch_size // 2)
+                        note(f"Memory budget: RSS near {budget.budget_mb} MB at sample {i}; chunk size now "
+                             f"{checkpoint_every}, audit batch {audit_store.batch_size}, cached patients "
+                             f"{graph.max_patients}, cached medication names {graph.med_agent.MAX_CACHED_NAMES}")
+            except BaseException:
+                # Persist whatever finished so --resume can pick up from here, without masking the original error
+                try:
+                    save_checkpoint()
+                except Exception as e:
+                    print(f"Could not save checkpoint for run {run_id}: {e}")
+                raise
+            save_checkpoint()
+
+        if stopped:
+            results = None
+        elif fast_path and routed:
+            latency = fast_path_latency(routed, scheduled, (time.perf_counter() - loop_start) / max(len(order), 1))
+            print(f"Fast path routed {latency['patients']} critical patients within {latency['fast_ms_max']:.1f} ms; "
+                  f"the full chain alone would have reached them after ~{latency['full_chain_ms_median']:.0f} ms "
+                  f"(median, max ~{latency['full_chain_ms_max']:.0f} ms)")
+
+        if not stopped:
+            with stage('finalize'):
+                results = [r['result'] for _, r in sorted(read_partial(partial).items())]
+
+                # Save Consolidated Results
+                out_json = f"{out_dir}/results_{run_id}.json"
+                save_json(results, out_json)
+                print(f"Results saved to {out_json}")
+
+                # Generate Markdown Report
+                report_path = f"{out_dir}/report_{run_id}.md"
+                write_report(results, report_path, run_id)
+                print(f"Report saved to {report_path}")
+
+                os.remove(partial)
+                os.remove(checkpoint_path(out_dir, run_id))
+    except BaseException:
+        if profiler:
+            profiler.stop()
+        raise
+    finally:
+        graph.nodes = graph_nodes
+
+    if profiler:
+        profiler.stop()
+        profile_path = f"{out_dir}/profile_{run_id}.json"
+        profiler.write(profile_path)
+        profiler.print_summary()
+        print(f"Profile saved to {profile_path}")
+    return results
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--samples', type=str, default='data/test_samples.json')
     parser.add_argument('--out_dir', type=str, default='evidence')
+    parser.add_argument('--run_id', type=str, default=None, help="Name for this run's outputs (default: start timestamp)")
+    parser.add_argument('--resume', action='store_true', help="Continue the latest interrupted run over --samples")
+    parser.add_argument('--checkpoint_every', type=int, default=100)
+    parser.add_argument('--explanations', choices=EXPLANATION_POLICIES, default='all',
+                        help="Which patients get explanation text; 'lazy' stores inputs and renders on demand")
+    parser.add_argument('--profile', action='store_true',
+                        help="Attribute time, allocations and peak RSS to each agent stage; writes profile_<run_id>.json")
+    parser.add_argument('--memory_budget_mb', type=float, default=None,
+                        help="Shrink chunks and caches instead of exceeding this RSS; stops at a checkpoint "
+                             "(continue with --resume) if that is not enough")
+    parser.add_argument('--fast_path', action='store_true',
+                        help="Route patients with critical rule alerts before running the other agents")
+    parser.add_argument('--schedule', choices=['file', 'severity'], default='file',
+                        help="'severity' screens all samples first and runs the most urgent patients first")
+    parser.add_argument('--export_report', type=str, default=None, metavar='RESULTS_JSON',
+                        help="Write a full Markdown report for a stored results file and exit")
     args = parser.parse_args()
-    run_pipeline(args.samples, args.out_dir)
+    if args.export_report:
+        export_report(args.export_report)
+    else:
+        run_pipeline(args.samples, args.out_dir, args.run_id, args.resume, args.checkpoint_every,
+                     explanations=args.explanations, profile=args.profile, memory_budget_mb=args.memory_budget_mb,
+                     fast_path=args.fast_path, schedule=args.schedule)
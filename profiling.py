@@ -0,0 +1,141 @@
+import gc
+import json
+import os
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_mb():
+    # Current resident set size; psutil when installed, /proc on Linux, else the peak from getrusage
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageProfiler:
+    """
+    Attributes wall time, Python allocations (tracemalloc) and RSS to named
+    stages. wrap_graph() instruments each TriageGraph node, so agent stages
+    (symptoms, risk, medications, ...) are reported separately. Stages must not
+    nest: each one resets the tracemalloc peak.
+    """
+
+    def __init__(self, top_n=10, frames=1):
+        self.top_n = top_n
+        self.frames = frames
+        self.stages = {}
+        self.events = []
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self.rss_start = rss_mb()
+        return self
+
+    def stop(self):
+        self.top_sites = self.allocation_sites()
+        self.rss_end = rss_mb()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        stats = self.stages.setdefault(name, {
+            "calls": 0, "seconds": 0.0, "allocated_mb": 0.0, "peak_alloc_mb": 0.0, "rss_peak_mb": 0.0, "rss_growth_mb": 0.0
+        })
+        rss_before = rss_mb()
+        current_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats["seconds"] += time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            rss_after = rss_mb()
+            stats["calls"] += 1
+            stats["allocated_mb"] += (current - current_before) / 2**20
+            stats["peak_alloc_mb"] = max(stats["peak_alloc_mb"], (peak - current_before) / 2**20)
+            stats["rss_peak_mb"] = max(stats["rss_peak_mb"], rss_after)
+            stats["rss_growth_mb"] += rss_after - rss_before
+
+    def wrap_graph(self, graph):
+        def timed(name, compute):
+            def run(sample, out):
+                with self.stage(name):
+                    return compute(sample, out)
+            return run
+        graph.nodes = [(name, fields, deps, timed(name, compute)) for name, fields, deps, compute in graph.nodes]
+        return graph
+
+    def note(self, message):
+        # Budget events keep the allocation sites live at that moment
+        self.events.append({"rss_mb": round(rss_mb(), 1), "message": message, "top_allocation_sites": self.allocation_sites()[:5]})
+        print(message)
+
+    def allocation_sites(self):
+        if not tracemalloc.is_tracing():
+            return []
+        stats = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]).statistics('lineno')
+        return [{"site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "size_mb": s.size / 2**20, "count": s.count}
+                for s in stats[:self.top_n]]
+
+    def report(self):
+        return {
+            "rss_start_mb": self.rss_start,
+            "rss_end_mb": getattr(self, 'rss_end', rss_mb()),
+            "rss_max_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "stages": self.stages,
+            "top_allocation_sites": getattr(self, 'top_sites', None) or self.allocation_sites(),
+            "events": self.events,
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+
+    def print_summary(self):
+        print(f"\n{'stage':<14}{'calls':>8}{'sec':>9}{'net MB':>9}{'peak MB':>9}{'RSS MB':>9}")
+        for name, s in sorted(self.stages.items(), key=lambda kv: -kv[1]['peak_alloc_mb']):
+            print(f"{name:<14}{s['calls']:>8}{s['seconds']:>9.2f}{s['allocated_mb']:>9.1f}"
+                  f"{s['peak_alloc_mb']:>9.1f}{s['rss_peak_mb']:>9.0f}")
+        for site in (getattr(self, 'top_sites', None) or [])[:5]:
+            print(f"  {site['size_mb']:8.1f} MB  {site['site']}")
+
+
+class MemoryBudget:
+    """
+    Soft RSS limit for a batch run. over() is true once RSS passes `headroom`
+    of the budget; the caller then flushes buffers and shrinks its chunks and
+    caches, stopping at a checkpoint if that is not enough (see run_pipeline),
+    instead of running into the OOM killer.
+    """
+
+    def __init__(self, budget_mb, headroom=0.85):
+        self.budget_mb = budget_mb
+        self.limit_mb = budget_mb * headroom
+
+    def over(self):
+        return rss_mb() > self.limit_mb
+
+    def relieve(self):
+        gc.collect()
+        return not self.over()
@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import yaml
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clinical_rules.yaml')
+SEVERITY_RANK = {"Critical": 2, "High": 1}
+OPS = {'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>=', 'eq': '==', 'ne': '!='}
+_NP_OPS = {'lt': np.less, 'lte': np.less_equal, 'gt': np.greater, 'gte': np.greater_equal, 'eq': np.equal,
+           'ne': np.not_equal}
+
+
+def _parse(spec, derived, fields, resolving=()):
+    """YAML condition -> hashable node: ('cmp', field, op, value), ('all'|'any', nodes), ('at_least', n, nodes)."""
+    if isinstance(spec, str):
+        if spec not in derived:
+            raise ValueError(f"Unknown derived condition '{spec}'")
+        if spec in resolving:
+            raise ValueError(f"Derived condition '{spec}' refers to itself")
+        return _parse(derived[spec], derived, fields, resolving + (spec,))
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError(f"Invalid condition: {spec!r}")
+    if 'all' in spec or 'any' in spec:
+        kind = 'all' if 'all' in spec else 'any'
+        return (kind, tuple(_parse(s, derived, fields, resolving) for s in spec[kind]))
+    if 'at_least' in spec:
+        return ('at_least', int(spec['at_least']), tuple(_parse(s, derived, fields, resolving) for s in spec['of']))
+
+    leaves = []
+    for field, ops in spec.items():
+        if field not in fields:
+            raise ValueError(f"Unknown field '{field}' (add it under defaults)")
+        for op, value in ops.items():
+            if op not in OPS or isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"Invalid comparison {field} {op} {value!r}")
+            leaves.append(('cmp', field, op, value))
+    return leaves[0] if len(leaves) == 1 else ('all', tuple(leaves))
+
+
+def _children(node):
+    return node[1] if node[0] in ('all', 'any') else node[2] if node[0] == 'at_least' else ()
+
+
+class RuleEngine:
+    """
+    Clinical alert rules loaded from YAML (see clinical_rules.yaml) and compiled
+    into two evaluators with identical results:
+
+    - evaluate(vitals): generated Python for one patient. Sub-conditions used
+      by more than one rule are computed once; inside all/any the condition
+      most likely to decide the outcome (by its hit rate on a reference cohort)
+      is tested first, so evaluation short-circuits early.
+    - evaluate_batch(frame) / severity(frame): numpy masks over a whole frame,
+      each distinct sub-condition computed once.
+
+    The file's mtime is checked at most every `check_interval` seconds and the
+    rules recompiled when it changes; a file that fails to load is reported and
+    the previous rules stay in force.
+    """
+
+    def __init__(self, path=RULES_PATH, reference='data/patient_summary.csv', check_interval=1.0):
+        self.path = path
+        self.reference = reference
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._mtime = None
+        self.load()
+
+    def load(self):
+        mtime = os.path.getmtime(self.path)
+        with open(self.path) as f:
+            spec = yaml.safe_load(f)
+        self._compile(spec)
+        self._mtime = mtime
+        self._checked = time.monotonic()
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return False
+        with self._lock:
+            self._checked = now
+            try:
+                if os.path.getmtime(self.path) == self._mtime:
+                    return False
+                self.load()
+            except (OSError, ValueError, KeyError, TypeError, yaml.YAMLError) as e:
+                print(f"Warning: could not reload clinical rules from {self.path}: {e}")
+                return False
+        print(f"Reloaded clinical rules from {self.path}")
+        return True
+
+    # Compilation
+
+    def _compile(self, spec):
+        defaults = dict(spec.get('defaults') or {})
+        for field in defaults:
+            if not field.isidentifier() or field.startswith('_'):
+                raise ValueError(f"Invalid field name '{field}'")
+        derived = spec.get('derived') or {}
+        rules = []
+        for rule in spec['rules']:
+            rules.append({
+                "code": str(rule['code']), "severity": str(rule['severity']), "rationale": str(rule['rationale']),
+                "node": _parse(rule['when'], derived, defaults),
+            })
+        selectivity = self._selectivity(rules, defaults)
+        # Published together so concurrent callers never see a half-built rule set
+        self._state = (defaults, rules, self._generate(rules, defaults, selectivity))
+
+    def _selectivity(self, rules, defaults):
+        # Share of reference patients for which each sub-condition holds
+        if not self.reference or not os.path.exists(self.reference):
+            return {}
+        try:
+            frame = pd.read_csv(self.reference, usecols=lambda c: c in defaults, nrows=10000)
+        except (OSError, ValueError):
+            return {}
+        cache = {}
+        values = self._arrays(frame, defaults)
+        for rule in rules:
+            self._mask(rule['node'], values, cache)
+        return {node: float(mask.mean()) for node, mask in cache.items()}
+
+    def _generate(self, rules, defaults, selectivity):
+        uses = {}
+
+        def count(node):
+            uses[node] = uses.get(node, 0) + 1
+            if uses[node] == 1:
+                for child in _children(node):
+                    count(child)
+
+        for rule in rules:
+            count(rule['node'])
+        shared = {}
+        hoisted = []
+
+        def expr(node):
+            if node in shared:
+                return shared[node]
+            kind = node[0]
+            if kind == 'cmp':
+                code = f"({node[1]} {OPS[node[2]]} {node[3]!r})"
+            elif kind == 'at_least':
+                # int() so numpy booleans (vitals from a DataFrame row) add up rather than OR together
+                code = f"(({' + '.join(f'int({expr(c)})' for c in node[2])}) >= {node[1]})"
+            else:
+                # all: least likely to hold first; any: most likely first (file order without a reference)
+                ordered = sorted(node[1], key=lambda c: selectivity.get(c, 0.5), reverse=(kind == 'any'))
+                code = "(" + f" {'and' if kind == 'all' else 'or'} ".join(expr(c) for c in ordered) + ")"
+            if uses[node] > 1:
+                name = f"_s{len(shared)}"
+                hoisted.append(f"    {name} = {code}")
+                shared[node] = name
+                return name
+            return code
+
+        fields = list(defaults)
+        lines = ["def evaluate(vitals):"]
+        for field in fields:
+            lines.append(f"    {field} = vitals.get({field!r})")
+            lines.append(f"    if {field} is None or {field} != {field}:")
+            lines.append(f"        {field} = _defaults[{field!r}]")
+        body = ["    alerts = []"]
+        namespace = {"_defaults": defaults}
+        for i, rule in enumerate(rules):
+            condition = expr(rule['node'])
+            namespace[f"_rule{i}"] = rule
+            values = ", ".join(f"{f}={f}" for f in fields)
+            body.append(f"    if {condition}:")
+            body.append(f"        alerts.append({{'code': _rule{i}['code'], 'severity': _rule{i}['severity'], "
+                        f"'rationale': _rule{i}['rationale'].format({values})}})")
+        source = "\n".join(lines + hoisted + body + ["    return alerts"])
+        exec(compile(source, f"<clinical rules {self.path}>", 'exec'), namespace)
+        self.source = source
+        return namespace['evaluate']
+
+    # Evaluation
+
+    @staticmethod
+    def _arrays(frame, defaults):
+        n = len(frame)
+        return {f: pd.to_numeric(frame[f], errors='coerce').fillna(d).to_numpy(dtype=float) if f in frame
+                else np.full(n, d, dtype=float) for f, d in defaults.items()}
+
+    def _mask(self, node, values, cache):
+        if node in cache:
+            return cache[node]
+        kind = node[0]
+        if kind == 'cmp':
+            mask = _NP_OPS[node[2]](values[node[1]], node[3])
+        elif kind == 'all':
+            mask = np.logical_and.reduce([self._mask(c, values, cache) for c in node[1]])
+        elif kind == 'any':
+            mask = np.logical_or.reduce([self._mask(c, values, cache) for c in node[1]])
+        else:
+            mask = np.sum([self._mask(c, values, cache) for c in node[2]], axis=0) >= node[1]
+        cache[node] = mask
+        return mask
+
+    def evaluate(self, vitals):
+        self.maybe_reload()
+        return self._state[2](vitals)
+
+    def _masks(self, frame):
+        self.maybe_reload()
+        defaults, rules, _ = self._state
+        values, cache = self._arrays(frame, defaults), {}
+        return {rule['code']: self._mask(rule['node'], values, cache) for rule in rules}, rules
+
+    def masks(self, frame):
+        """{code: boolean array} for every rule over a frame of vitals."""
+        return self._masks(frame)[0]
+
+    def severity(self, frame):
+        """Highest alert severity per row as a SEVERITY_RANK value (0 when no rule fires)."""
+        masks, rules = self._masks(frame)
+        rank = np.zeros(len(frame), dtype=int)
+        for rule in rules:
+            rank = np.where(masks[rule['code']], np.maximum(rank, SEVERITY_RANK.get(rule['severity'], 0)), rank)
+        return rank
+
+    def evaluate_batch(self, frame):
+        """Alerts per row, as evaluate() would return them; rationales are only formatted for rows that fire."""
+        masks, rules = self._masks(frame)
+        defaults = self._state[0]
+        out = [[] for _ in range(len(frame))]
+        fired = np.flatnonzero(np.logical_or.reduce([masks[r['code']] for r in rules])) if rules else []
+        records = frame.iloc[fired].to_dict('records') if len(fired) else []
+        for row, record in zip(fired, records):
+            vitals = {f: d if record.get(f) is None or record.get(f) != record.get(f) else record[f]
+                      for f, d in defaults.items()}
+            for rule in rules:
+                if masks[rule['code']][row]:
+                    out[row].append({"code": rule['code'], "severity": rule['severity'],
+                                     "rationale": rule['rationale'].format(**vitals)})
+        return out
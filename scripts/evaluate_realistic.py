@@ -1,25 +1,156 @@
-import os
-import subprocess
-import pandas as pd
+import argparse
+import datetime
 import json
+import os
+import sys
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import roc_auc_score, precision_score, recall_score, f1_score
+from sklearn.model_selection import StratifiedKFold, train_test_split
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_generator import generate_frames
+from train_model import split_features, fit_model
+from agents.symptom_agent import SymptomAgent
+from agents.med_safety_agent import MedicationSafetyAgent
+from agents.risk_agent import RiskAgent
+from agents.priority_agent import PriorityAgent
+from rules.clinical_alerts import check_clinical_rules
+from triage import VITAL_FIELDS, parse_medications
+
+MED_RULES = os.path.join(ROOT, 'data', 'med_rules.csv')
+PRIORITY_CONFIG = os.path.join(ROOT, 'data', 'priority_config.json')
+
+
+def triage_cohort(df, model):
+    """Run the decision agents (no routing or explanations) over a whole cohort; returns priorities and risk scores."""
+    samples = df.to_dict('records')
+    symptom_agent = SymptomAgent()
+    med_agent = MedicationSafetyAgent(MED_RULES)
+    priority_agent = PriorityAgent(PRIORITY_CONFIG)
+
+    med_agent.canonicalize_batch({m for s in samples for m in parse_medications(s.get('medications', ''))})
+    risk_outs = RiskAgent(model=model).predict_batch(samples)
+    med_scores, symptom_scores, alert_counts, critical_alerts = [], [], [], []
+    for sample in samples:
+        symptom_out = symptom_agent.extract(sample.get('clinical_note', ''))
+        med_out = med_agent.check(parse_medications(sample.get('medications') or symptom_out['medications_mentioned']))
+        med_scores.append(med_out.get('severity_score', 0.0))
+        symptom_scores.append(priority_agent.symptom_score(symptom_out.get('symptoms', [])))
+        alerts = check_clinical_rules({k: sample.get(k) for k in VITAL_FIELDS})
+        alert_counts.append(len(alerts))
+        critical_alerts.append(priority_agent.has_critical_alert(alerts))
+
+    risk_scores = np.array([r.get('risk_score', 0.0) for r in risk_outs])
+    priority_outs = priority_agent.decide_batch(risk_scores, med_scores, symptom_scores, alert_counts, critical_alerts,
+                                                uncertainties=[r.get('uncertainty') for r in risk_outs])
+    return np.array([p['priority'] for p in priority_outs]), risk_scores
+
+
+def score_fold(train_df, test_df, seed):
+    timings = {}
+    start = time.perf_counter()
+    X_train, y_train = split_features(train_df)
+    # Hold part of the training fold out for calibration so the test fold stays unseen
+    X_fit, X_cal, y_fit, y_cal = train_test_split(X_train, y_train, test_size=0.25, random_state=seed, stratify=y_train)
+    _, model = fit_model(X_fit, y_fit, X_cal, y_cal, random_state=seed)
+    timings['train_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    priorities, risk_scores = triage_cohort(test_df, model)
+    timings['triage_s'] = time.perf_counter() - start
+
+    y = test_df['deterioration_label'].to_numpy()
+    escalated = np.isin(priorities, ['High', 'Critical']).astype(int)
+    negatives = max(int((y == 0).sum()), 1)
+    metrics = {
+        "risk_roc_auc": float(roc_auc_score(y, risk_scores)) if len(set(y)) > 1 else None,
+        "triage_sensitivity": float(recall_score(y, escalated, zero_division=0)),
+        "triage_specificity": float(((escalated == 0) & (y == 0)).sum() / negatives),
+        "triage_ppv": float(precision_score(y, escalated, zero_division=0)),
+        "triage_f1": float(f1_score(y, escalated, zero_division=0)),
+        "escalation_rate": float(escalated.mean()),
+        "priority_counts": {p: int((priorities == p).sum()) for p in ['Critical', 'High', 'Medium', 'Low']},
+    }
+    return {"seed": seed, "n_test": len(test_df), "metrics": metrics, "timings": timings}
+
+
+def score_seed(n, seed):
+    # Multi-seed mode: each worker generates its own cohort in memory
+    summary_df, _, _ = generate_frames(n, seed)
+    train_df, test_df = train_test_split(summary_df, test_size=0.3, random_state=seed,
+                                         stratify=summary_df['deterioration_label'])
+    return score_fold(train_df, test_df, seed)
+
+
+def summarize(runs):
+    summary = {}
+    for key, value in runs[0]['metrics'].items():
+        if isinstance(value, (int, float)):
+            values = [r['metrics'][key] for r in runs if r['metrics'][key] is not None]
+            summary[key] = {"mean": float(np.mean(values)), "std": float(np.std(values))}
+    return summary
+
+
+def run_evaluation(n=1000, seed=42, folds=5, seeds=None, n_jobs=-1, history_path='evidence/eval_history.jsonl'):
+    started = time.perf_counter()
+    timings = {}
+
+    if seeds:
+        print(f"Evaluating {len(seeds)} seeds x {n} patients in parallel...")
+        runs = Parallel(n_jobs=n_jobs)(delayed(score_seed)(n, s) for s in seeds)
+        mode = {"mode": "multi-seed", "seeds": list(seeds)}
+    else:
+        print(f"1. Generating {n} patients in memory...")
+        start = time.perf_counter()
+        summary_df, _, _ = generate_frames(n, seed)
+        timings['generate_s'] = time.perf_counter() - start
+
+        print(f"2. Training and scoring {folds} folds in parallel...")
+        splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+        splits = splitter.split(summary_df, summary_df['deterioration_label'])
+        runs = Parallel(n_jobs=n_jobs)(
+            delayed(score_fold)(summary_df.iloc[tr], summary_df.iloc[te], seed + i)
+            for i, (tr, te) in enumerate(splits)
+        )
+        mode = {"mode": "k-fold", "folds": folds, "seed": seed}
+
+    timings['total_s'] = time.perf_counter() - started
+    timings['train_s_mean'] = float(np.mean([r['timings']['train_s'] for r in runs]))
+    timings['triage_s_mean'] = float(np.mean([r['timings']['triage_s'] for r in runs]))
+
+    entry = dict(mode, timestamp=datetime.datetime.now().isoformat(), n=n,
+                 summary=summarize(runs), timings=timings, runs=runs)
+
+    previous = None
+    if os.path.exists(history_path):
+        with open(history_path) as f:
+            lines = [l for l in f if l.strip()]
+        previous = json.loads(lines[-1]) if lines else None
+    os.makedirs(os.path.dirname(history_path) or '.', exist_ok=True)
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+
+    print(f"\n{'metric':<22}{'mean':>8}{'std':>8}{'prev':>8}")
+    for key, stats in entry['summary'].items():
+        prev = previous['summary'].get(key, {}).get('mean') if previous else None
+        prev_str = f"{prev:>8.3f}" if prev is not None else f"{'-':>8}"
+        print(f"{key:<22}{stats['mean']:>8.3f}{stats['std']:>8.3f}{prev_str}")
+    print(f"\nWall clock: {timings['total_s']:.1f}s (train {timings['train_s_mean']:.1f}s, "
+          f"triage {timings['triage_s_mean']:.1f}s per fold). History appended to {history_path}")
+    return entry
 
-def run_evaluation():
-    print("1. Generating Realistic Data...")
-    subprocess.run(["python", "data_generator.py", "--n", "1000", "--realistic"])
-    
-    print("2. Training Model...")
-    subprocess.run(["python", "train_model.py"])
-    
-    print("3. Running Pipeline on Test Samples...")
-    subprocess.run(["python", "pipeline.py"])
-    
-    print("4. Verifying Outputs...")
-    if os.path.exists("evidence/feature_importances.json"):
-        print("Feature importances generated.")
-    if os.path.exists("models/risk_model.pkl"):
-        print("Model saved.")
-        
-    print("Evaluation Complete. Ready for UI.")
 
 if __name__ == "__main__":
-    run_evaluation()
+    parser = argparse.ArgumentParser(description="In-process evaluation of the risk model and triage outcomes.")
+    parser.add_argument('--n', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seeds', type=int, nargs='+', default=None, help="Multi-seed mode: one generated cohort per seed")
+    parser.add_argument('--n_jobs', type=int, default=-1)
+    parser.add_argument('--history', type=str, default='evidence/eval_history.jsonl')
+    args = parser.parse_args()
+    run_evaluation(args.n, args.seed, args.folds, args.seeds, args.n_jobs, args.history)
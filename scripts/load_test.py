@@ -0,0 +1,217 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_generator import generate_frames
+from agents.symptom_agent import SymptomAgent
+from agents.med_safety_agent import MedicationSafetyAgent
+from agents.risk_agent import RiskAgent
+from agents.priority_agent import PriorityAgent
+from agents.explanation_agent import ExplanationAgent
+from agents.routing_agent import RoutingAgent
+from audit_store import AuditStore
+from triage import TriageGraph
+
+PERCENTILES = [50, 95, 99]
+
+
+def load_samples(path=None, generate=None, seed=42):
+    if generate:
+        summary_df, _, _ = generate_frames(generate, seed)
+    else:
+        summary_df = pd.read_csv(path)
+    return summary_df.drop(columns=['deterioration_label', 'deterioration_type', 'deterioration_onset'], errors='ignore').to_dict('records')
+
+
+def build_graphs(n, audit_db):
+    # One graph per worker (TriageGraph.evaluate holds a per-graph lock); the agents themselves are shared
+    agents = dict(
+        symptom_agent=SymptomAgent(), med_agent=MedicationSafetyAgent(), risk_agent=RiskAgent(),
+        priority_agent=PriorityAgent(), explanation_agent=ExplanationAgent(),
+        routing_agent=RoutingAgent(audit_store=AuditStore(audit_db)),
+    )
+    return [TriageGraph(max_patients=1000, **agents) for _ in range(n)]
+
+
+def percentiles(values):
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(v) * 1000 for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def run_step(graphs, samples, rate, duration, drain_timeout, seed):
+    """
+    Open-loop step: requests arrive as a Poisson process at `rate` per second
+    regardless of how fast they are served, so queueing delay counts towards
+    latency (measured from scheduled arrival, not from dequeue).
+    """
+    rng = random.Random(seed)
+    requests = queue.Queue()
+    records = []
+    lock = threading.Lock()
+    counter = [0]
+    cancelled = threading.Event()
+
+    def worker(graph):
+        while True:
+            item = requests.get()
+            if item is None:
+                return
+            if cancelled.is_set():
+                # Past the drain deadline: left unserved, counted as dropped
+                continue
+            arrival, sample = item
+            started = time.perf_counter()
+            error = None
+            try:
+                graph.evaluate(sample)
+                stages = dict(graph.last_timings)
+            except Exception as e:
+                error = type(e).__name__
+                stages = {}
+            finished = time.perf_counter()
+            with lock:
+                records.append({"latency": finished - arrival, "queue": started - arrival,
+                                "stages": stages, "error": error})
+
+    threads = [threading.Thread(target=worker, args=(g,), daemon=True) for g in graphs]
+    for t in threads:
+        t.start()
+
+    start = time.perf_counter()
+    next_arrival = start
+    sent = 0
+    while next_arrival - start < duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sample = dict(samples[counter[0] % len(samples)])
+        # A fresh patient id per request so every agent runs (no incremental cache hits)
+        sample['patient_id'] = f"{sample.get('patient_id', 'P')}-{seed}-{counter[0]}"
+        counter[0] += 1
+        requests.put((next_arrival, sample))
+        sent += 1
+        next_arrival += rng.expovariate(rate)
+
+    for _ in threads:
+        requests.put(None)
+    deadline = time.perf_counter() + drain_timeout
+    for t in threads:
+        t.join(max(0.0, deadline - time.perf_counter()))
+    cancelled.set()
+    elapsed = time.perf_counter() - start
+
+    with lock:
+        done = list(records)
+    # Requests still in flight finish (uncounted) before the next step starts, so they
+    # neither compete with its requests nor land in its latencies
+    for t in threads:
+        t.join()
+    ok = [r for r in done if r['error'] is None]
+    stage_names = sorted({name for r in ok for name in r['stages']})
+    errors = {}
+    for r in done:
+        if r['error']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    return {
+        "offered_rate": rate,
+        "sent": sent,
+        "completed": len(ok),
+        "errors": errors,
+        "dropped": sent - len(done),
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": percentiles([r['latency'] for r in ok]),
+        "queue_ms": percentiles([r['queue'] for r in ok]),
+        "stages_ms": {name: percentiles([r['stages'][name] for r in ok if name in r['stages']]) for name in stage_names},
+    }
+
+
+def meets_slo(step, slo_p95_ms, slo_p99_ms, max_error_rate):
+    n = max(step['sent'], 1)
+    failed = sum(step['errors'].values()) + step['dropped']
+    lat = step['latency_ms']
+    return (lat['p95'] is not None and lat['p95'] <= slo_p95_ms and lat['p99'] <= slo_p99_ms
+            and failed / n <= max_error_rate)
+
+
+def run_load_test(samples, concurrency=(1, 2, 4), start_rate=5.0, ramp_factor=1.5, max_rate=1000.0,
+                  step_seconds=10.0, slo_p95_ms=250.0, slo_p99_ms=500.0, max_error_rate=0.01,
+                  audit_db=None, seed=42):
+    audit_db = audit_db or os.path.join(tempfile.mkdtemp(), 'load_test_audit.db')
+    runs = []
+    for workers in concurrency:
+        graphs = build_graphs(workers, audit_db)
+        # Warm-up so model loading and first-call costs do not land in the first step
+        for g in graphs:
+            g.evaluate(dict(samples[0], patient_id='warmup'))
+
+        print(f"\nConcurrency {workers}")
+        print(f"{'rate/s':>8}{'tput/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}  SLO")
+        steps = []
+        saturation = None
+        rate = start_rate
+        while rate <= max_rate:
+            step = run_step(graphs, samples, rate, step_seconds, drain_timeout=step_seconds, seed=seed + len(steps))
+            step['slo_met'] = meets_slo(step, slo_p95_ms, slo_p99_ms, max_error_rate)
+            steps.append(step)
+            lat = step['latency_ms']
+            fmt = lambda v: f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+            print(f"{rate:>8.1f}{step['throughput']:>8.1f}{fmt(lat['p50'])}{fmt(lat['p95'])}{fmt(lat['p99'])}"
+                  f"{sum(step['errors'].values()) + step['dropped']:>8}  {'ok' if step['slo_met'] else 'BROKEN'}")
+            if not step['slo_met']:
+                break
+            saturation = {"rate": rate, "throughput": step['throughput']}
+            rate *= ramp_factor
+        runs.append({"concurrency": workers, "steps": steps, "saturation": saturation})
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ramp Poisson arrivals through the full agent chain until latency SLOs break.")
+    parser.add_argument('--samples', type=str, default=os.path.join(ROOT, 'data', 'patient_summary.csv'))
+    parser.add_argument('--generate', type=int, default=None, help="Use a generated cohort of this size instead of --samples")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--start_rate', type=float, default=5.0, help="Arrivals per second in the first step")
+    parser.add_argument('--ramp_factor', type=float, default=1.5)
+    parser.add_argument('--max_rate', type=float, default=1000.0)
+    parser.add_argument('--step_seconds', type=float, default=10.0)
+    parser.add_argument('--slo_p95_ms', type=float, default=250.0)
+    parser.add_argument('--slo_p99_ms', type=float, default=500.0)
+    parser.add_argument('--max_error_rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', type=str, default=None, help="JSON output (default evidence/load_test_<timestamp>.json)")
+    args = parser.parse_args()
+
+    samples = load_samples(os.path.abspath(args.samples), args.generate, args.seed)
+    # Agents load their model and rules relative to the repository root
+    os.chdir(ROOT)
+    runs = run_load_test(samples, args.concurrency, args.start_rate, args.ramp_factor, args.max_rate,
+                         args.step_seconds, args.slo_p95_ms, args.slo_p99_ms, args.max_error_rate, seed=args.seed)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    out = args.out or f"evidence/load_test_{timestamp}.json"
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({
+            "timestamp": timestamp,
+            "host": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+            "config": vars(args),
+            "runs": runs,
+        }, f, indent=4)
+    print(f"\nSaturation: " + ", ".join(
+        f"c={r['concurrency']}: {r['saturation']['rate']:.1f}/s" if r['saturation'] else f"c={r['concurrency']}: below start rate"
+        for r in runs))
+    print(f"Results written to {out}")
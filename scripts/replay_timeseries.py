@@ -0,0 +1,219 @@
+import argparse
+import datetime
+import json
+import operator
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_generator import generate_frames
+from agents.symptom_agent import SymptomAgent
+from agents.med_safety_agent import MedicationSafetyAgent
+from agents.risk_agent import RiskAgent
+from agents.priority_agent import PriorityAgent
+from agents.explanation_agent import ExplanationAgent
+from agents.routing_agent import RoutingAgent
+from audit_store import AuditStore
+from triage import TriageGraph, EXPLANATION_POLICIES
+
+PERCENTILES = [50, 95, 99]
+ESCALATED = ['High', 'Critical']
+READING_COLUMNS = ['timestamp', 'hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr']
+LABEL_COLUMNS = ['deterioration_label', 'deterioration_type', 'deterioration_onset']
+# Single-vital early warning thresholds marking a reading abnormal. Deliberately more sensitive than
+# the clinical rules that escalate (rules/clinical_rules.yaml), so the delay between the two is measurable
+ABNORMAL = {'hr': ('gt', 90), 'sbp': ('lt', 100), 'spo2': ('lt', 95), 'temp': ('gt', 37.8), 'rr': ('gt', 20)}
+OPS = {'gt': operator.gt, 'lt': operator.lt}
+
+
+def load_cohort(summary_path=None, timeseries_path=None, generate=None, seed=42):
+    if generate:
+        summary_df, timeseries_df, _ = generate_frames(generate, seed)
+    else:
+        summary_df, timeseries_df = pd.read_csv(summary_path), pd.read_csv(timeseries_path)
+    if 'deterioration_onset' not in summary_df:
+        print("No deterioration_onset column (data generated before it was added); "
+              "events are tracked over each patient's whole series")
+    return summary_df, timeseries_df
+
+
+def interleave(summary_df, timeseries_df):
+    """
+    Every reading as a full triage sample (the patient's static fields plus that
+    reading's vitals), all patients merged in timestamp order.
+    """
+    static = summary_df.drop(columns=[c for c in READING_COLUMNS + LABEL_COLUMNS if c in summary_df])
+    readings = timeseries_df.merge(static, on='patient_id', how='inner')
+    readings['_time'] = pd.to_datetime(readings['timestamp'])
+    readings = readings.sort_values('_time', kind='stable').reset_index(drop=True)
+    offsets = (readings['_time'] - readings['_time'].iloc[0]).dt.total_seconds().to_numpy()
+    return readings.drop(columns=['_time']).to_dict('records'), offsets
+
+
+def deterioration_events(summary_df):
+    # Patients labelled as deteriorating -> onset timestamp (None when unknown)
+    labelled = summary_df[summary_df['deterioration_label'] == 1]
+    onsets = labelled['deterioration_onset'] if 'deterioration_onset' in labelled else [None] * len(labelled)
+    return {pid: {"patient_id": pid, "type": dtype, "onset": None if pd.isna(onset) else pd.Timestamp(onset)}
+            for pid, dtype, onset in zip(labelled['patient_id'], labelled['deterioration_type'], onsets)}
+
+
+def percentiles(values, scale=1.0):
+    if not len(values):
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(v) * scale for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def is_abnormal(sample):
+    return any(OPS[op](sample[field], limit) for field, (op, limit) in ABNORMAL.items()
+               if sample.get(field) is not None)
+
+
+def replay(graph, readings, offsets, events, speed=0.0):
+    """
+    Feed readings through the graph on a replay clock: reading i is due
+    offsets[i] / speed wall seconds after the start (speed 0 = as fast as
+    possible, due when reached). For each event, from the labelled onset on,
+    records the first abnormal reading (crossing an ABNORMAL threshold) and
+    the first reading routed High/Critical. Wall-clock delays run from when the
+    abnormal reading was due, so falling behind the clock counts towards them.
+    """
+    tracking = {pid: dict(event, abnormal=None, escalated=None) for pid, event in events.items()}
+    lags, stages = [], {}
+    start = time.perf_counter()
+    for sample, offset in zip(readings, offsets):
+        due = start + offset / speed if speed else time.perf_counter()
+        wait = due - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        lags.append(max(0.0, time.perf_counter() - due))
+        analysis = graph.evaluate(sample)
+        for name, seconds in graph.last_timings.items():
+            stages.setdefault(name, []).append(seconds)
+
+        event = tracking.get(sample['patient_id'])
+        if event is None or event['escalated'] is not None:
+            continue
+        reading_time = pd.Timestamp(sample['timestamp'])
+        if event['onset'] is not None and reading_time < event['onset']:
+            continue
+        if event['abnormal'] is None and is_abnormal(sample):
+            event['abnormal'] = (reading_time, due)
+        if analysis['priority_out']['priority'] in ESCALATED:
+            event['escalated'] = (reading_time, time.perf_counter())
+    elapsed = time.perf_counter() - start
+    return list(tracking.values()), lags, stages, elapsed
+
+
+def event_record(event):
+    record = {"patient_id": event['patient_id'], "type": event['type'],
+              "onset": event['onset'].isoformat() if event['onset'] is not None else None,
+              "first_abnormal": None, "escalated": None,
+              "sim_delay_s": None, "wall_delay_ms": None, "onset_to_escalation_s": None}
+    if event['abnormal'] is not None:
+        record['first_abnormal'] = event['abnormal'][0].isoformat()
+    if event['escalated'] is not None:
+        escalated_time, done = event['escalated']
+        record['escalated'] = escalated_time.isoformat()
+        if event['onset'] is not None:
+            record['onset_to_escalation_s'] = (escalated_time - event['onset']).total_seconds()
+        # Escalated at or after the abnormal reading (an escalation before it leaves both delays empty)
+        if event['abnormal'] is not None and event['abnormal'][0] <= escalated_time:
+            abnormal_time, due = event['abnormal']
+            record['sim_delay_s'] = (escalated_time - abnormal_time).total_seconds()
+            record['wall_delay_ms'] = (done - due) * 1000
+    return record
+
+
+def summarize(records, lags, stages, elapsed, n_readings):
+    escalated = [r for r in records if r['escalated'] is not None]
+    delayed = [r for r in escalated if r['sim_delay_s'] is not None]
+    return {
+        "readings": n_readings,
+        "elapsed_s": elapsed,
+        "readings_per_s": n_readings / elapsed if elapsed else 0.0,
+        "lag_ms": percentiles(lags, 1000),
+        # Per agent stage, over the readings where it was recomputed
+        "stages_ms": {name: percentiles(values, 1000) for name, values in sorted(stages.items())},
+        "events": len(records),
+        "abnormal": sum(r['first_abnormal'] is not None for r in records),
+        "escalated": len(escalated),
+        # Escalated before any vital crossed an ABNORMAL threshold (e.g. on risk or medications)
+        "escalated_before_abnormal": len(escalated) - len(delayed),
+        # Abnormal readings that never led to escalation before the replay ended
+        "missed": sum(r['first_abnormal'] is not None and r['escalated'] is None for r in records),
+        "sim_delay_s": percentiles([r['sim_delay_s'] for r in delayed]),
+        "wall_delay_ms": percentiles([r['wall_delay_ms'] for r in delayed]),
+        "onset_to_escalation_s": percentiles([r['onset_to_escalation_s'] for r in escalated
+                                              if r['onset_to_escalation_s'] is not None]),
+    }
+
+
+def build_graph(max_patients, audit_db, explanations='all'):
+    return TriageGraph(
+        symptom_agent=SymptomAgent(), med_agent=MedicationSafetyAgent(), risk_agent=RiskAgent(),
+        priority_agent=PriorityAgent(), explanation_agent=ExplanationAgent(),
+        routing_agent=RoutingAgent(audit_store=AuditStore(audit_db)),
+        max_patients=max_patients, explanation_policy=explanations,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay timeseries readings through the triage chain and "
+                                                 "measure deterioration detection latency and throughput.")
+    parser.add_argument('--summary', type=str, default=os.path.join(ROOT, 'data', 'patient_summary.csv'))
+    parser.add_argument('--timeseries', type=str, default=os.path.join(ROOT, 'data', 'patient_data_timeseries.csv'))
+    parser.add_argument('--generate', type=int, default=None, help="Replay a generated cohort of this size instead")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help="Simulated seconds per wall-clock second (1 = real time, 3600 = an hour per second, "
+                             "0 = as fast as possible)")
+    parser.add_argument('--explanations', choices=EXPLANATION_POLICIES, default='all')
+    parser.add_argument('--out', type=str, default=None, help="JSON output (default evidence/replay_<timestamp>.json)")
+    args = parser.parse_args()
+
+    summary_df, timeseries_df = load_cohort(os.path.abspath(args.summary), os.path.abspath(args.timeseries),
+                                            args.generate, args.seed)
+    readings, offsets = interleave(summary_df, timeseries_df)
+    events = deterioration_events(summary_df)
+    # Agents load their model and rules relative to the repository root
+    os.chdir(ROOT)
+    audit_db = os.path.join(tempfile.mkdtemp(), 'replay_audit.db')
+    graph = build_graph(len(summary_df), audit_db, args.explanations)
+    graph.evaluate(dict(readings[0], patient_id='warmup'))
+
+    print(f"Replaying {len(readings)} readings from {len(summary_df)} patients "
+          f"({offsets[-1] / 3600:.1f} simulated hours, {len(events)} deterioration events)...")
+    tracked, lags, stages, elapsed = replay(graph, readings, offsets, events, args.speed)
+    records = [event_record(e) for e in tracked]
+    summary = summarize(records, lags, stages, elapsed, len(readings))
+
+    fmt = lambda v, scale=1.0: f"{v * scale:.1f}" if v is not None else "-"
+    print(f"Throughput: {summary['readings_per_s']:.1f} readings/s over {elapsed:.1f}s "
+          f"(lag behind replay clock p95 {fmt(summary['lag_ms']['p95'])} ms)")
+    print(f"Events: {summary['events']}, abnormal {summary['abnormal']}, escalated {summary['escalated']} "
+          f"({summary['escalated_before_abnormal']} before any abnormal reading), missed {summary['missed']}")
+    for name, key, scale, unit in [("Abnormal -> escalation (simulated)", 'sim_delay_s', 1 / 60, 'min'),
+                                   ("Abnormal -> escalation (wall clock)", 'wall_delay_ms', 1.0, 'ms'),
+                                   ("Onset -> escalation (simulated)", 'onset_to_escalation_s', 1 / 60, 'min')]:
+        print(f"{name}: " + ", ".join(f"{p} {fmt(v, scale)}" for p, v in summary[key].items()) + f" {unit}")
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    out = args.out or f"evidence/replay_{timestamp}.json"
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({
+            "timestamp": timestamp,
+            "host": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+            "config": vars(args),
+            "summary": summary,
+            "events": records,
+        }, f, indent=4)
+    print(f"Results written to {out}")
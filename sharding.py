@@ -0,0 +1,293 @@
+import argparse
+import datetime
+import heapq
+import multiprocessing as mp
+import os
+import queue
+import tempfile
+import time
+import traceback
+import zlib
+from audit_store import AuditStore
+from pipeline import build_result, write_report
+from triage import EXPLANATION_POLICIES
+from utils import ensure_dirs, save_json, load_json
+from worklist import PRIORITY_RANK
+
+
+def shard_for(key, n_shards):
+    # Stable across processes and runs (unlike hash(), which is salted per interpreter)
+    return zlib.crc32(str(key).encode()) % n_shards
+
+
+def shard_audit_path(out_dir, index):
+    return os.path.join(out_dir, f"audit_shard{index}.db")
+
+
+def _shard_main(index, out_dir, explanations, inbox, outbox):
+    try:
+        _serve(index, out_dir, explanations, inbox, outbox)
+    except BaseException:
+        # Any failure (agent loading, a bad command) is reported so the coordinator does not wait forever
+        outbox.put(('error', index, traceback.format_exc()))
+        raise
+
+
+def _serve(index, out_dir, explanations, inbox, outbox):
+    # Everything a shard owns is built inside its own process
+    from agents.routing_agent import RoutingAgent
+    from triage import TriageGraph, parse_medications
+    from worklist import TriageWorklist
+
+    worklist = TriageWorklist()
+    graph = TriageGraph(routing_agent=RoutingAgent(audit_store=AuditStore(shard_audit_path(out_dir, index))),
+                        worklist=worklist, explanation_policy=explanations)
+    audit_store = graph.routing_agent.audit_store
+    outbox.put(('ready', index, None))
+    while True:
+        command, payload = inbox.get()
+        if command == 'evaluate':
+            graph.med_agent.canonicalize_batch({m for _, s in payload for m in parse_medications(s.get('medications', ''))})
+            out = []
+            with audit_store.batch():
+                for seq, sample in payload:
+                    pid = sample.get('patient_id', 'Unknown')
+                    try:
+                        out.append((seq, build_result(pid, graph.evaluate(sample), sample, explanations)))
+                    except Exception as e:
+                        out.append((seq, {"patient_id": pid, "error": f"{type(e).__name__}: {e}"}))
+            outbox.put(('results', index, out))
+        elif command == 'top':
+            outbox.put(('top', index, worklist.top(*payload)))
+        elif command == 'counts':
+            outbox.put(('counts', index, worklist.counts()))
+        elif command == 'stop':
+            audit_store.close()
+            outbox.put(('stopped', index, None))
+            return
+
+
+class ShardedTriage:
+    """
+    Triage runtime partitioned by a stable hash of patient_id (or another
+    sample field such as a ward). Each shard is a separate process owning its
+    agents, per-patient graph state, worklist and audit segment
+    (audit_shard<i>.db), so shards share no locks and scale with cores.
+    The coordinator batches updates to the owning shard and merges outputs.
+    A shard that reports an error or exits raises RuntimeError in the
+    coordinator instead of leaving it waiting.
+    """
+
+    def __init__(self, n_shards=4, out_dir='evidence', shard_key='patient_id', explanations='all', batch_size=64,
+                 poll_interval=1.0):
+        self.n_shards = n_shards
+        self.poll_interval = poll_interval
+        self.out_dir = out_dir
+        self.shard_key = shard_key
+        self.batch_size = batch_size
+        ensure_dirs([out_dir])
+        ctx = mp.get_context()
+        self.outbox = ctx.Queue()
+        self.inboxes = [ctx.Queue() for _ in range(n_shards)]
+        self.processes = [ctx.Process(target=_shard_main, args=(i, out_dir, explanations, q, self.outbox), daemon=True)
+                          for i, q in enumerate(self.inboxes)]
+        self._pending = [[] for _ in range(n_shards)]
+        self._in_flight = 0
+        self._results = {}
+        self._seq = 0
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+        self._wait('ready', self.n_shards)
+        return self
+
+    def _receive(self):
+        while True:
+            try:
+                reply = self.outbox.get(timeout=self.poll_interval)
+            except queue.Empty:
+                for i, p in enumerate(self.processes):
+                    if not p.is_alive():
+                        raise RuntimeError(f"Shard {i} exited unexpectedly (exit code {p.exitcode})")
+                continue
+            if reply[0] == 'error':
+                raise RuntimeError(f"Shard {reply[1]} failed:\n{reply[2]}")
+            return reply
+
+    def _wait(self, kind, n):
+        replies = []
+        while len(replies) < n:
+            reply_kind, index, payload = self._receive()
+            if reply_kind == 'results':
+                self._collect(payload)
+            if reply_kind == kind:
+                replies.append((index, payload))
+        return replies
+
+    def _collect(self, results):
+        self._in_flight -= 1
+        self._results.update(results)
+
+    def _send(self, shard):
+        if self._pending[shard]:
+            self.inboxes[shard].put(('evaluate', self._pending[shard]))
+            self._pending[shard] = []
+            self._in_flight += 1
+
+    def submit(self, sample):
+        """Queue one update for its owning shard; returns its sequence number."""
+        seq = self._seq
+        self._seq += 1
+        shard = shard_for(sample.get(self.shard_key, sample.get('patient_id', 'Unknown')), self.n_shards)
+        self._pending[shard].append((seq, sample))
+        if len(self._pending[shard]) >= self.batch_size:
+            self._send(shard)
+        return seq
+
+    def drain(self):
+        """Flush partial batches and wait for every submitted update; returns {seq: result}."""
+        for shard in range(self.n_shards):
+            self._send(shard)
+        while self._in_flight:
+            reply_kind, index, payload = self._receive()
+            if reply_kind == 'results':
+                self._collect(payload)
+        results, self._results = self._results, {}
+        return results
+
+    def process(self, samples):
+        seqs = [self.submit(s) for s in samples]
+        results = self.drain()
+        return [results[s] for s in seqs]
+
+    def top(self, k=10, team=None):
+        # Merge each shard's head: a patient lives in exactly one shard
+        for q in self.inboxes:
+            q.put(('top', (k, team)))
+        heads = [entries for _, entries in self._wait('top', self.n_shards)]
+        rank = lambda e: (-PRIORITY_RANK.get(e['priority'], 0), -(e.get('score') or 0.0))
+        return list(heapq.merge(*heads, key=rank))[:k]
+
+    def counts(self):
+        for q in self.inboxes:
+            q.put(('counts', None))
+        merged = {}
+        for _, counts in self._wait('counts', self.n_shards):
+            for team, by_priority in counts.items():
+                team_counts = merged.setdefault(team, {})
+                for priority, n in by_priority.items():
+                    team_counts[priority] = team_counts.get(priority, 0) + n
+        return merged
+
+    def routing_history(self, **filters):
+        # Read the shard audit segments side by side and merge newest first
+        rows = []
+        for i in range(self.n_shards):
+            store = AuditStore(shard_audit_path(self.out_dir, i))
+            rows.extend(store.routing_history(**filters))
+            store.close()
+        return sorted(rows, key=lambda r: r['timestamp'], reverse=True)
+
+    def close(self):
+        try:
+            for q in self.inboxes:
+                q.put(('stop', None))
+            self._wait('stopped', self.n_shards)
+            for p in self.processes:
+                p.join()
+        except BaseException:
+            self.terminate()
+            raise
+
+    def terminate(self):
+        for p in self.processes:
+            if p.pid is None:
+                continue
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
+    def __enter__(self):
+        try:
+            return self.start()
+        except BaseException:
+            self.terminate()
+            raise
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            # A shard may be dead or mid-batch; don't wait for a clean stop
+            self.terminate()
+
+
+def run_sharded(samples_path, out_dir, n_shards=4, run_id=None, shard_key='patient_id', explanations='all',
+                batch_size=64):
+    samples = load_json(samples_path)
+    run_id = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    print(f"Running {len(samples)} samples on {n_shards} shards...")
+    start = time.perf_counter()
+    with ShardedTriage(n_shards, out_dir, shard_key, explanations, batch_size) as runtime:
+        results = runtime.process(samples)
+        counts = runtime.counts()
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(results)} samples in {elapsed:.1f}s ({len(results) / elapsed:.1f}/s)")
+    for team, by_priority in sorted(counts.items()):
+        print(f"  {team}: {by_priority}")
+
+    out_json = f"{out_dir}/results_{run_id}.json"
+    save_json(results, out_json)
+    print(f"Results saved to {out_json}")
+    report_path = f"{out_dir}/report_{run_id}.md"
+    write_report([r for r in results if 'error' not in r], report_path, run_id)
+    print(f"Report saved to {report_path}")
+    return results
+
+
+def compare_shard_counts(samples, shard_counts=(1, 2, 4), explanations='all', batch_size=64, repeat=1):
+    """
+    Throughput of the same workload at each shard count. Every copy of a sample
+    gets a fresh patient id so no shard answers from its incremental cache, and
+    agent start-up is excluded from the timing.
+    """
+    workload = [dict(s, patient_id=f"{s.get('patient_id', 'P')}-{r}") for r in range(repeat) for s in samples]
+    rows = []
+    for n in shard_counts:
+        with ShardedTriage(n, tempfile.mkdtemp(prefix='shards'), explanations=explanations,
+                           batch_size=batch_size) as runtime:
+            start = time.perf_counter()
+            runtime.process(workload)
+            elapsed = time.perf_counter() - start
+        rows.append({"shards": n, "samples": len(workload), "seconds": elapsed, "throughput": len(workload) / elapsed})
+    for row in rows:
+        row['speedup'] = row['throughput'] / rows[0]['throughput']
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch triage partitioned across shard processes.")
+    parser.add_argument('--samples', type=str, default='data/test_samples.json')
+    parser.add_argument('--out_dir', type=str, default='evidence')
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--shard_key', type=str, default='patient_id', help="Sample field to partition by (e.g. a ward)")
+    parser.add_argument('--run_id', type=str, default=None)
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--explanations', choices=EXPLANATION_POLICIES, default='all')
+    parser.add_argument('--compare', type=int, nargs='+', default=None, metavar='N',
+                        help="Instead of a run, measure throughput at each of these shard counts")
+    parser.add_argument('--repeat', type=int, default=1, help="With --compare, replay the samples this many times")
+    args = parser.parse_args()
+    if args.compare:
+        rows = compare_shard_counts(load_json(args.samples), args.compare, args.explanations, args.batch_size, args.repeat)
+        print(f"{'shards':>7}{'samples':>9}{'seconds':>9}{'per s':>9}{'speedup':>9}   ({os.cpu_count()} CPUs)")
+        for row in rows:
+            print(f"{row['shards']:>7}{row['samples']:>9}{row['seconds']:>9.2f}{row['throughput']:>9.1f}{row['speedup']:>9.2f}")
+        ensure_dirs([args.out_dir])
+        out = os.path.join(args.out_dir, f"shard_scaling_{args.run_id or datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        save_json({"cpus": os.cpu_count(), "rows": rows}, out)
+        print(f"Saved to {out}")
+    else:
+        run_sharded(args.samples, args.out_dir, args.shards, args.run_id, args.shard_key, args.explanations,
+                    args.batch_size)
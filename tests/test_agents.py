@@ -4,6 +4,8 @@ import json
 from agents.symptom_agent import SymptomAgent
 from agents.med_safety_agent import MedicationSafetyAgent
 from agents.priority_agent import PriorityAgent
+from agents.routing_agent import RoutingAgent
+from audit_store import AuditStore
 
 def test_symptom_agent():
     agent = SymptomAgent()
@@ -44,3 +46,90 @@ def test_priority_agent():
         {"risk_score": 0.1}
     )
     assert res['priority'] == 'Low'
+
+def test_med_canonicalize_batch_matches_single():
+    if not os.path.exists('data/med_rules.csv'):
+        pytest.skip("Med rules not found")
+
+    raw = ['Warfarn', 'aspirin', 'LISINOPRIL', 'Metformn', 'unknowndrugxyz', 'aspirin']
+    batch = MedicationSafetyAgent().canonicalize_batch(raw)
+    single = MedicationSafetyAgent()
+    assert batch == {m: single.canonicalize(m) for m in raw}
+    assert batch['Warfarn'] == 'warfarin'
+
+def test_priority_batch_matches_scalar():
+    agent = PriorityAgent()
+    shock = {"code": "HYPOTENSION_SHOCK"}
+    cases = [
+        (0.9, 0.8, ["chest pain"], []),
+        (0.1, 0.0, [], [{}, {}]),
+        (0.5, 0.5, ["fever"], []),
+        (0.75, 0.0, ["Confusion"], [{}]),
+        (0.65, 1.0, [], []),
+        (0.1, 0.0, [], [shock]),
+        (0.65, 1.0, [], [shock, {}]),
+        (0.1, 0.0, [], [{}, shock]),
+    ]
+    for floor, expected in [(False, ['High', 'High', 'High']), (True, ['Critical', 'Critical', 'Critical'])]:
+        agent.config['critical_alerts']['floor'] = floor
+        scalar = [agent.escalate(agent.decide({"symptoms": s}, {"severity_score": m}, {"risk_score": r}), a)
+                  for r, m, s, a in cases]
+        batch = agent.decide_batch([c[0] for c in cases], [c[1] for c in cases],
+                                   [agent.symptom_score(c[2]) for c in cases], [len(c[3]) for c in cases],
+                                   [agent.has_critical_alert(c[3]) for c in cases])
+        assert batch == scalar
+        assert batch[1]['priority'] == 'High'
+        # With the floor on, critical alerts (and only they) lift a patient to Critical
+        assert [b['priority'] for b in batch[5:]] == expected
+    assert agent.fast_path([shock])['priority'] == 'Critical'
+    assert agent.fast_path([{"code": "DESATURATION"}]) is None
+
+def test_priority_flags_uncertain_borderline_scores():
+    agent = PriorityAgent()
+    reason = agent.config['uncertainty']['reason']
+    # (risk, uncertainty): scores 0.6 * risk land on or away from the 0.6 / 0.4 thresholds
+    cases = [(1.0, 0.45), (1.0, 0.1), (0.3, 0.45), (0.7, None), (0.68, 0.5)]
+    scalar = [agent.decide({"symptoms": []}, {"severity_score": 0.0}, {"risk_score": r, "uncertainty": u})
+              for r, u in cases]
+    assert [reason in s['reasons'] for s in scalar] == [True, False, False, False, True]
+    batch = agent.decide_batch([r for r, _ in cases], [0.0] * len(cases), [0.0] * len(cases),
+                               uncertainties=[u for _, u in cases])
+    assert batch == scalar
+
+def test_priority_config_override(tmp_path):
+    path = tmp_path / "priority.json"
+    path.write_text(json.dumps({"thresholds": [["Critical", 0.95], ["High", 0.2], ["Medium", 0.1]]}))
+    agent = PriorityAgent(config_path=str(path))
+    assert agent.weights['risk'] == 0.6
+    assert agent.decide({"symptoms": []}, {"severity_score": 0.0}, {"risk_score": 0.5})['priority'] == 'High'
+
+def test_routing_audits_only_transitions(tmp_path):
+    agent = RoutingAgent(audit_store=AuditStore(str(tmp_path / 'audit.db')))
+    high = {"priority": "High", "reasons": ["High risk score (0.91)"]}
+    hypoxemia = [{"code": "HYPOXEMIA", "rationale": "SpO2 < 90%"}]
+    first = agent.route(high, "P00000", hypoxemia)
+    for _ in range(3):
+        assert agent.route(dict(high, score=0.9), "P00000", hypoxemia) == first
+    assert len(agent.audit_store.routing_history(patient_id="P00000")) == 1
+
+    agent.route({"priority": "Critical", "reasons": ["Critical alert"]}, "P00000", hypoxemia)
+    agent.route(high, "P00000", [])
+    assert len(agent.audit_store.routing_history(patient_id="P00000")) == 3
+
+    # A new run audits every patient again
+    agent.begin_run("run2")
+    agent.route(high, "P00000", [])
+    assert len(agent.audit_store.routing_history(patient_id="P00000")) == 4
+
+def test_severity_screen_matches_scalar_rules():
+    import numpy as np
+    import pandas as pd
+    from rules.clinical_alerts import check_clinical_rules, screen_severity, SEVERITY_RANK
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        'hr': rng.integers(30, 150, 500), 'sbp': rng.integers(70, 150, 500), 'spo2': rng.integers(82, 100, 500),
+        'temp': rng.choice([35.5, 36.0, 37.0, 38.0, 38.5], 500), 'rr': rng.integers(10, 30, 500),
+    })
+    expected = [max([SEVERITY_RANK[a['severity']] for a in check_clinical_rules(row)] or [0])
+                for row in frame.to_dict('records')]
+    assert screen_severity(frame).tolist() == expected
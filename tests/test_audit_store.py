@@ -0,0 +1,34 @@
+import csv
+from audit_store import AuditStore, ROUTING_COLUMNS
+
+def test_batched_writes_and_patient_history(tmp_path):
+    store = AuditStore(str(tmp_path / 'audit.db'), batch_size=2)
+    with store.batch():
+        store.log_routing("P00001", "High", "High deterioration risk detected.", "Dr. Lung", "Respiratory",
+                          timestamp="2025-12-10T10:00:00")
+        store.log_routing("P00002", "Low", "", "Routine Queue", "General Ward", timestamp="2025-12-10T10:00:01")
+        store.log_routing("P00001", "Critical", "", "Dr. Lung", "Respiratory", timestamp="2025-12-11T10:00:00")
+    store.log_action("P00001", "Acknowledged", timestamp="2025-12-11T10:05:00")
+
+    history = store.patient_history("P00001", since="2025-12-11")
+    assert [e['event'] for e in history] == ['action', 'routing']
+    assert len(store.routing_history(team="Respiratory")) == 2
+    assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+def test_csv_import_is_idempotent(tmp_path):
+    routing_csv = tmp_path / 'routing_log.csv'
+    with open(routing_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ROUTING_COLUMNS)
+        writer.writerow(['2025-12-10T11:59:06.735990', 'P00000', 'High', 'x', 'Dr. Breath', 'Respiratory', 'System'])
+        writer.writerow(['2025-12-10T11:59:06.750857', 'P00001', 'Low', '', 'Routine Queue', 'General Ward', 'System'])
+        # The same decision logged again a fraction of a second later (a page re-run) ...
+        writer.writerow(['2025-12-10T11:59:07.139874', 'P00001', 'Low', '', 'Routine Queue', 'General Ward', 'System'])
+        # ... but a later run, or a different decision at the same moment, is a real event
+        writer.writerow(['2025-12-10T12:09:06.750857', 'P00001', 'Low', '', 'Routine Queue', 'General Ward', 'System'])
+        writer.writerow(['2025-12-10T11:59:06.750857', 'P00001', 'High', '', 'Dr. Jones', 'Internal Medicine', 'System'])
+    store = AuditStore(str(tmp_path / 'audit.db'))
+    assert store.import_csv(str(routing_csv), str(tmp_path / 'missing.csv')) == {"routing_log": 4, "actions_log": 0}
+    assert store.import_csv(str(routing_csv), None)["routing_log"] == 0
+    assert store.routing_history("P00000")[0]['assigned_to'] == 'Dr. Breath'
+    assert len(store.routing_history("P00001")) == 3
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from charts import prepare_series, chart_data
+
+
+def _minute_vitals(hours=72):
+    ts = pd.date_range('2025-12-10', periods=hours * 60, freq='min')
+    n = len(ts)
+    df = pd.DataFrame({
+        'timestamp': ts.astype(str), 'hr': 80 + np.sin(np.arange(n) / 50.0), 'sbp': np.full(n, 120.0), 'spo2': np.full(n, 97.0),
+    })
+    # A single-minute desaturation near the end of the stay
+    df.loc[n - n // 10, 'spo2'] = 82.0
+    return df.sample(frac=1, random_state=0)
+
+
+def test_labels_are_relative_to_latest_reading():
+    prepared = prepare_series(_minute_vitals(hours=3))
+    assert prepared['Time Label'].iloc[-1] == "Now"
+    assert prepared['Time Label'].iloc[-21] == "-20m"
+    assert prepared['Time Label'].iloc[-121] == "-2h"
+    assert prepared['hours'].is_monotonic_increasing
+
+
+def test_downsampling_keeps_spike_endpoints_and_summary():
+    prepared = prepare_series(_minute_vitals())
+    for method in ('lttb', 'minmax'):
+        data = chart_data(prepared, window_hours=24, target_points=200, method=method)
+        spo2 = data['series']['spo2']
+        assert len(spo2) <= 202
+        assert spo2['spo2'].min() == 82.0
+        assert spo2['hours'].iloc[-1] == 0.0
+        assert spo2['hours'].iloc[0] == -24.0
+    assert data['n_points'] == 24 * 60 + 1
+    assert data['summary']['spo2'] == {"min": 82.0, "max": 97.0, "last": 97.0}
+    assert len(chart_data(prepared)['series']['hr']) <= 202
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+import pandas as pd
+from rules.clinical_alerts import check_clinical_rules
+from rules.engine import RuleEngine, RULES_PATH
+
+
+def legacy_rules(vitals):
+    # The hand-written rules clinical_rules.yaml replaced
+    alerts = []
+    hr, sbp, spo2 = vitals.get('hr', 80), vitals.get('sbp', 120), vitals.get('spo2', 98)
+    temp, rr = vitals.get('temp', 37.0), vitals.get('rr', 16)
+    if sbp < 90 and hr > 100:
+        alerts.append({"code": "HYPOTENSION_SHOCK", "severity": "Critical",
+                       "rationale": f"Hypotension (SBP {sbp}) with Tachycardia (HR {hr}) suggests shock."})
+    if spo2 < 90:
+        alerts.append({"code": "HYPOXEMIA", "severity": "Critical", "rationale": f"SpO2 {spo2}% indicates respiratory failure."})
+    elif spo2 < 94:
+        alerts.append({"code": "DESATURATION", "severity": "High", "rationale": f"SpO2 {spo2}% requires monitoring."})
+    sirs = 0
+    if temp > 38.0 or temp < 36.0: sirs += 1
+    if hr > 90: sirs += 1
+    if rr > 20: sirs += 1
+    if sirs >= 2:
+        alerts.append({"code": "SEPSIS_SIRS", "severity": "High",
+                       "rationale": f"SIRS criteria met (Temp {temp}, HR {hr}, RR {rr}). Monitor for sepsis."})
+    if hr > 130:
+        alerts.append({"code": "TACHYCARDIA_SEVERE", "severity": "High", "rationale": f"HR {hr} bpm."})
+    elif hr < 40:
+        alerts.append({"code": "BRADYCARDIA_SEVERE", "severity": "High", "rationale": f"HR {hr} bpm."})
+    return alerts
+
+
+def _vitals(n=2000):
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        'hr': rng.integers(30, 150, n), 'sbp': rng.integers(70, 150, n), 'spo2': rng.integers(82, 100, n),
+        'temp': rng.choice([35.5, 36.0, 37.0, 38.0, 38.5], n), 'rr': rng.integers(10, 30, n),
+    })
+
+
+def test_compiled_rules_match_legacy_function():
+    frame = _vitals()
+    records = frame.to_dict('records')
+    expected = [legacy_rules(r) for r in records]
+    assert [check_clinical_rules(r) for r in records] == expected
+    assert RuleEngine().evaluate_batch(frame) == expected
+    # Missing vitals fall back to the defaults
+    assert check_clinical_rules({'spo2': 88}) == legacy_rules({'spo2': 88})
+
+
+def test_rules_reload_when_file_changes(tmp_path):
+    path = tmp_path / 'rules.yaml'
+    text = open(RULES_PATH).read()
+    path.write_text(text)
+    engine = RuleEngine(str(path), check_interval=0)
+    assert [a['code'] for a in engine.evaluate({'hr': 125})] == []
+
+    path.write_text(text.replace("when: {hr: {gt: 130}}", "when: {hr: {gt: 120}}"))
+    os.utime(path, (os.path.getmtime(path) + 5,) * 2)
+    assert [a['code'] for a in engine.evaluate({'hr': 125})] == ['TACHYCARDIA_SEVERE']
+    assert engine.severity(pd.DataFrame({'hr': [125, 80]})).tolist() == [1, 0]
+
+    # A broken edit keeps the last good rules
+    path.write_text(text.replace("when: {hr: {gt: 130}}", "when: {hr: {above: 120}}"))
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    assert [a['code'] for a in engine.evaluate({'hr': 125})] == ['TACHYCARDIA_SEVERE']
+
+
+def test_shared_condition_inside_at_least(tmp_path):
+    path = tmp_path / 'rules.yaml'
+    path.write_text("""
+defaults: {hr: 80, temp: 37.0, rr: 16}
+derived:
+  fever: {temp: {gt: 38.0}}
+rules:
+  - {code: FEVER, severity: High, when: fever, rationale: "Temp {temp}"}
+  - code: TWO_OF_THREE
+    severity: Critical
+    when: {at_least: 2, of: [fever, {hr: {gt: 90}}, {rr: {gt: 20}}]}
+    rationale: "HR {hr}"
+""")
+    engine = RuleEngine(str(path), reference=None)
+    # The shared condition is computed once, then used by both rules
+    assert '_s0 = (temp > 38.0)' in engine.source and 'int(_s0)' in engine.source
+
+    frame = pd.DataFrame({'hr': [95, 95, 80, 80], 'temp': [38.5, 37.0, 38.5, 37.0], 'rr': [16, 22, 22, 16]})
+    codes = [[a['code'] for a in alerts] for alerts in engine.evaluate_batch(frame)]
+    assert codes == [['FEVER', 'TWO_OF_THREE'], ['TWO_OF_THREE'], ['FEVER', 'TWO_OF_THREE'], []]
+    assert [[a['code'] for a in engine.evaluate(r)] for r in frame.to_dict('records')] == codes
+    assert engine.severity(frame).tolist() == [2, 2, 2, 0]
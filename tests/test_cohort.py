@@ -0,0 +1,26 @@
+from cohort import build_cohort_frame, filter_cohort, sort_cohort, paginate, analysis_from_record
+
+def record(pid, priority, risk, team="General Ward", alerts=()):
+    return {
+        "patient_id": pid, "priority": priority, "priority_score": risk, "risk_score": risk,
+        "risk_level": "High" if risk > 0.7 else "Low", "symptoms": [], "interactions": [],
+        "routing": {"team": team, "assigned_to": "Dr. Test"}, "explanation": "",
+        "alerts": [{"code": c, "rationale": c} for c in alerts]
+    }
+
+def test_filter_sort_and_paginate():
+    records = [record(f"P{i:05d}", "Low", i / 100) for i in range(60)]
+    records.append(record("P99998", "Critical", 0.9, "Respiratory", ["HYPOXEMIA"]))
+    records.append(record("P99999", "High", 0.5, "Cardiology"))
+    frame = build_cohort_frame(records)
+
+    ranked = sort_cohort(frame, "Priority")
+    assert list(ranked['patient_id'][:3]) == ["P99998", "P99999", "P00059"]
+    assert list(filter_cohort(frame, alerts_only=True)['patient_id']) == ["P99998"]
+    assert len(filter_cohort(frame, priorities=["Low"], teams=["General Ward"])) == 60
+
+    page, n_pages = paginate(ranked, 3, 25)
+    assert n_pages == 3 and len(page) == 12
+
+    analysis = analysis_from_record(records[page['record'].iloc[0]])
+    assert analysis['priority_out']['priority'] == "Low"
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from feature_store import TimeseriesFeatureStore, FEATURE_COLUMNS
+
+
+def _readings():
+    rows = []
+    start = pd.Timestamp('2025-12-10T00:00:00')
+    for p, (sbp0, drop) in enumerate([(130, 0), (120, 6), (110, 3)]):
+        for h in range(10):
+            rows.append({
+                'patient_id': f'P{p:05d}', 'timestamp': (start + pd.Timedelta(hours=h)).isoformat(),
+                'hr': 70 + h * (drop > 0), 'sbp': sbp0 - drop * h, 'dbp': 80, 'spo2': 97 - (h > 6) * 5,
+                'temp': 36.8 + 0.1 * (h % 2), 'rr': 16,
+            })
+    return pd.DataFrame(rows)
+
+
+def test_features_match_direct_computation():
+    store = TimeseriesFeatureStore.build(_readings(), window=6)
+    row = store.lookup('P00001')
+    assert row['sbp_slope'] == -6.0
+    assert row['sbp_delta'] == -54.0
+    assert row['hr_std'] == np.std([74, 75, 76, 77, 78, 79], ddof=1)
+    # SBP below 100 from hour 4 on (readings 4..9), window covers the last 6
+    assert row['sbp_hours_below_100'] == 6.0
+    assert store.lookup('P00000')['spo2_hours_below_94'] == 3.0
+
+
+def test_incremental_append_matches_full_build(tmp_path):
+    readings = _readings()
+    full = TimeseriesFeatureStore.build(readings)
+
+    early = readings.groupby('patient_id').cumcount() < 4
+    store = TimeseriesFeatureStore.build(readings[early])
+    store.save(tmp_path / 'fs')
+    store = TimeseriesFeatureStore.load(tmp_path / 'fs')
+    added = store.append(readings[~early])
+    assert len(added) == (~early).sum()
+    assert len(store.append(readings)) == 0
+
+    a = store.features.sort_values(['patient_id', 'timestamp'])[FEATURE_COLUMNS].to_numpy(float)
+    b = full.features.sort_values(['patient_id', 'timestamp'])[FEATURE_COLUMNS].to_numpy(float)
+    assert np.allclose(a, b, atol=1e-9)
+
+
+def test_join_is_as_of_each_row():
+    store = TimeseriesFeatureStore.build(_readings())
+    frame = pd.DataFrame({'patient_id': ['P00001', 'P00001', 'P99999'],
+                          'timestamp': ['2025-12-10T02:30:00', None, '2025-12-10T05:00:00']})
+    joined = store.join(frame)
+    assert joined.loc[0, 'sbp_delta'] == -12.0
+    assert joined.loc[1, 'sbp_delta'] == -54.0
+    assert joined.loc[2, FEATURE_COLUMNS].isna().all()
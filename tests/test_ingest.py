@@ -0,0 +1,92 @@
+import json
+import os
+import time
+from agents.risk_agent import RiskAgent
+from agents.routing_agent import RoutingAgent
+from audit_store import AuditStore
+from ingest import IngestDaemon, shared_agents
+
+SAMPLE = {
+    "clinical_note": "Patient has chest pain.", "medications": "Aspirin, Warfarin",
+    "hr": 80, "sbp": 120, "dbp": 80, "spo2": 98, "temp": 37.0, "rr": 16,
+    "age": 70, "sex": "F", "chronic_conditions": "None", "timestamp": "2025-12-10T11:00:00"
+}
+
+def make_daemon(tmp_path, **kwargs):
+    agents = shared_agents()
+    agents['risk_agent'] = RiskAgent(model_path=str(tmp_path / 'missing.pkl'))
+    agents['routing_agent'] = RoutingAgent(audit_store=AuditStore(str(tmp_path / 'audit.db')))
+    return IngestDaemon(str(tmp_path / 'inbox'), str(tmp_path / 'out'), agents=agents, **kwargs)
+
+def test_files_move_to_done_or_failed_with_results(tmp_path):
+    daemon = make_daemon(tmp_path, workers=2, queue_size=1)
+    inbox = tmp_path / 'inbox'
+    for i in range(6):
+        (inbox / f"update_{i}.json").write_text(json.dumps(dict(SAMPLE, patient_id=f"P{i % 3}")))
+    (inbox / "broken.json").write_text("{not json")
+    # Left behind by a crashed process: picked up again
+    (inbox / "processing" / "stale.json").write_text(json.dumps(dict(SAMPLE, patient_id="P9")))
+
+    stats = daemon.run_once()
+    assert stats == {"processed": 7, "failed": 1}
+    assert sorted(os.listdir(inbox / 'done')) == sorted([f"update_{i}.json" for i in range(6)] + ["stale.json"])
+    assert sorted(os.listdir(inbox / 'failed')) == ["broken.json", "broken.json.error.txt"]
+    assert os.listdir(inbox / 'processing') == []
+
+    lines = [json.loads(l) for l in open(tmp_path / 'out' / 'ingest_results.jsonl')]
+    assert len(lines) == 7
+    assert {l['patient_id'] for l in lines} == {"P0", "P1", "P2", "P9"}
+
+def test_resubmitted_file_names_do_not_overwrite_earlier_ones(tmp_path):
+    daemon = make_daemon(tmp_path, workers=1)
+    inbox = tmp_path / 'inbox'
+    for pid in ["P1", "P2"]:
+        (inbox / "update.json").write_text(json.dumps(dict(SAMPLE, patient_id=pid)))
+        daemon.run_once()
+    (inbox / "update.json").write_text("{not json")
+    (inbox / "failed" / "update.json").write_text("{older}")
+    daemon.run_once()
+
+    assert sorted(os.listdir(inbox / 'done')) == ["update.1.json", "update.json"]
+    assert {json.loads((inbox / 'done' / f).read_text())['patient_id'] for f in os.listdir(inbox / 'done')} == {"P1", "P2"}
+    assert sorted(os.listdir(inbox / 'failed')) == ["update.1.json", "update.1.json.error.txt", "update.json"]
+
+def test_daemon_drains_claimed_files_on_stop(tmp_path):
+    daemon = make_daemon(tmp_path, workers=1, queue_size=2, poll_interval=0.05, settle_seconds=0).start()
+    for i in range(8):
+        (tmp_path / 'inbox' / f"u{i}.json").write_text(json.dumps(dict(SAMPLE, patient_id=f"P{i}")))
+    deadline = time.time() + 10
+    while daemon.stats['processed'] < 3 and time.time() < deadline:
+        time.sleep(0.02)
+    daemon.stop()
+
+    inbox = tmp_path / 'inbox'
+    done = os.listdir(inbox / 'done')
+    # Nothing is stranded: every file is either finished or still waiting in the inbox
+    assert os.listdir(inbox / 'processing') == []
+    assert len(done) == daemon.stats['processed']
+    assert len(done) + len([f for f in os.listdir(inbox) if f.endswith('.json')]) == 8
+
+def test_workers_survive_move_errors_and_count_each_file_once(tmp_path):
+    import threading
+    daemon = make_daemon(tmp_path, workers=1, queue_size=1)
+    inbox = tmp_path / 'inbox'
+    for i in range(4):
+        (inbox / f"u{i}.json").write_text(json.dumps(dict(SAMPLE, patient_id=f"P{i}")))
+    (inbox / "bad.json").write_text(json.dumps(dict(SAMPLE, patient_id="P9", hr="fast")))
+    move = daemon._move
+    def flaky_move(path, directory):
+        if directory != daemon.processing and os.path.basename(path) in ("u1.json", "bad.json"):
+            raise OSError("disk full")
+        return move(path, directory)
+    daemon._move = flaky_move
+
+    # A dead worker would leave the scanner blocked on the full queue
+    runner = threading.Thread(target=daemon.run_once, daemon=True)
+    runner.start()
+    runner.join(timeout=30)
+    assert not runner.is_alive()
+    # u1's result was written before its move failed: processed, not also failed
+    assert daemon.stats == {"processed": 4, "failed": 1}
+    assert sorted(os.listdir(inbox / 'done')) == ["u0.json", "u2.json", "u3.json"]
+    assert sorted(os.listdir(inbox / 'processing')) == ["bad.json", "u1.json"]
@@ -0,0 +1,61 @@
+import pandas as pd
+from agents.med_safety_agent import MedicationSafetyAgent
+from agents.symptom_agent import SymptomAgent
+from med_index import MedicationIndex, changed_pairs
+
+SUMMARY = 'data/patient_summary.csv'
+
+
+def _checks(agent, summary):
+    # The list TriageGraph checks: the medications field, else the meds mentioned in the note
+    symptom_agent = SymptomAgent()
+    return {pid: agent.check(meds if isinstance(meds, str) else symptom_agent.extract(note)['medications_mentioned'])
+            for pid, meds, note in zip(summary['patient_id'], summary['medications'], summary['clinical_note'])}
+
+
+def test_patients_on_matches_scan_and_tracks_updates():
+    summary = pd.read_csv(SUMMARY)
+    index = MedicationIndex.build(summary)
+    agent = index.med_agent
+    expected = {pid for pid, meds in zip(summary['patient_id'], summary['medications'])
+                if isinstance(meds, str) and {'sildenafil', 'nitroglycerin'} <= {agent.canonicalize(m.strip()).lower() for m in meds.split(',')}}
+    assert index.patients_on('Sildenafil', 'nitroglycerin') == expected and expected
+
+    pid = sorted(expected)[0]
+    assert index.update(pid, "Sildenafil, Aspirin")
+    assert pid not in index.patients_on('sildenafil', 'nitroglycerin')
+    assert not index.update(pid, ["sildenafil", "aspirin"])
+    index.remove(pid)
+    assert pid not in index.patients_on('sildenafil')
+
+
+def test_blank_medications_fall_back_to_the_clinical_note():
+    summary = pd.DataFrame({'patient_id': ['P1', 'P2'], 'medications': [float('nan'), 'Metformin'],
+                            'clinical_note': ['Chest pain. Taking Aspirin and Warfarin.', 'Taking Aspirin.']})
+    index = MedicationIndex.build(summary)
+    assert index.drugs_for('P1') == {'aspirin', 'warfarin'}
+    assert index.patients_on('aspirin') == {'P1'}
+    assert index.update('P1', '', clinical_note='Taking Warfarin.')
+    assert index.drugs_for('P1') == {'warfarin'}
+
+
+def test_rules_change_only_touches_patients_on_changed_pairs():
+    summary = pd.read_csv(SUMMARY)
+    index = MedicationIndex.build(summary, MedicationSafetyAgent())
+    old_rules = index.med_agent.rules
+    before = _checks(MedicationSafetyAgent(), summary)
+
+    new_rules = old_rules.copy()
+    new_rules.loc[0, 'severity'] = 'High'
+    new_rules = pd.concat([new_rules, pd.DataFrame([{
+        'drug_a': 'omeprazole', 'drug_b': 'digoxin', 'severity': 'Medium', 'mechanism': 'Absorption',
+        'explanation': 'Raised digoxin levels.', 'recommended_action': 'Monitor digoxin levels', 'source': 'Test'
+    }])], ignore_index=True)
+    assert changed_pairs(old_rules, new_rules) == {('nitroglycerin', 'sildenafil'), ('digoxin', 'omeprazole')}
+
+    affected = index.apply_rules(new_rules)
+    after = _checks(index.med_agent, summary)
+    changed = {pid for pid in before if before[pid] != after[pid]}
+    assert changed and changed <= affected
+    assert affected == index.patients_on('sildenafil', 'nitroglycerin') | index.patients_on('digoxin', 'omeprazole')
+    assert index.recheck(affected) == {pid: after[pid] for pid in affected}
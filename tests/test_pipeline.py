@@ -0,0 +1,144 @@
+import json
+import pytest
+import pipeline
+from agents.risk_agent import RiskAgent
+from agents.routing_agent import RoutingAgent
+from audit_store import AuditStore
+from triage import TriageGraph
+
+class Crash(Exception):
+    pass
+
+def make_graph(tmp_path, crash_on=None):
+    graph = TriageGraph(risk_agent=RiskAgent(model_path=str(tmp_path / 'missing.pkl')),
+                        routing_agent=RoutingAgent(audit_store=AuditStore(str(tmp_path / 'audit.db'))))
+    if crash_on:
+        evaluate = graph.evaluate
+        def crashing(sample):
+            if sample['patient_id'] == crash_on:
+                raise Crash()
+            return evaluate(sample)
+        graph.evaluate = crashing
+    return graph
+
+def test_resume_matches_uninterrupted_run_without_duplicate_audit_rows(tmp_path):
+    samples = 'data/test_samples.json'
+    expected = pipeline.run_pipeline(samples, str(tmp_path / 'full'), run_id='full', graph=make_graph(tmp_path / 'full'))
+
+    out_dir = str(tmp_path / 'resumed')
+    (tmp_path / 'resumed').mkdir()
+    with pytest.raises(Crash):
+        pipeline.run_pipeline(samples, out_dir, run_id='r1', checkpoint_every=3,
+                              graph=make_graph(tmp_path / 'resumed', crash_on='P00007'))
+    assert pipeline.find_checkpoint(out_dir, samples)['n_completed'] == 7
+
+    graph = make_graph(tmp_path / 'resumed')
+    resumed = pipeline.run_pipeline(samples, out_dir, resume=True, graph=graph)
+    assert resumed == expected
+    rows = graph.routing_agent.audit_store.routing_history()
+    assert sorted(r['patient_id'] for r in rows) == sorted(r['patient_id'] for r in expected)
+    # The clinician in the results is the one the audit trail says was paged
+    paged = {r['patient_id']: r['assigned_to'] for r in rows}
+    assert all(r['routing']['assigned_to'] == paged[r['patient_id']] for r in resumed)
+    assert pipeline.find_checkpoint(out_dir, samples) is None
+
+def test_failed_checkpoint_does_not_mask_the_original_error(tmp_path, monkeypatch):
+    def disk_full(path, state):
+        raise OSError("disk full")
+    monkeypatch.setattr(pipeline, 'write_checkpoint', disk_full)
+    with pytest.raises(Crash):
+        pipeline.run_pipeline('data/test_samples.json', str(tmp_path), run_id='c',
+                              graph=make_graph(tmp_path, crash_on='P00003'))
+
+def test_lazy_explanations_render_identical_text(tmp_path):
+    from agents.explanation_agent import ExplanationAgent
+    samples = 'data/test_samples.json'
+    eager = pipeline.run_pipeline(samples, str(tmp_path / 'all'), run_id='all', graph=make_graph(tmp_path / 'all'))
+    lazy = pipeline.run_pipeline(samples, str(tmp_path / 'lazy'), run_id='lazy', graph=make_graph(tmp_path / 'lazy'),
+                                 explanations='lazy')
+    agent = ExplanationAgent()
+    for e, l in zip(eager, lazy):
+        assert l['explanation'] is None and l['explanation_deferred']
+        assert agent.from_result(l) == e['explanation']
+
+    # Without a sample timestamp the result stores the evaluation time the eager text used
+    untimed = tmp_path / 'untimed.json'
+    untimed.write_text(json.dumps([{k: v for k, v in s.items() if k != 'timestamp'} for s in pipeline.load_json(samples)]))
+    eager = pipeline.run_pipeline(str(untimed), str(tmp_path / 'untimed'), run_id='untimed',
+                                  graph=make_graph(tmp_path / 'untimed'))
+    assert all(e['timestamp'] and agent.from_result(dict(e, explanation=None)) == e['explanation'] for e in eager)
+
+def test_profile_and_memory_budget_shrink_then_stop_at_a_checkpoint(tmp_path):
+    samples = 'data/test_samples.json'
+    expected = pipeline.run_pipeline(samples, str(tmp_path / 'full'), run_id='full', graph=make_graph(tmp_path / 'full'))
+    graph = make_graph(tmp_path)
+    nodes = graph.nodes
+    # A 1 MB budget is always exceeded: every chunk shrinks chunks and caches until nothing is left, then the run stops
+    assert pipeline.run_pipeline(samples, str(tmp_path), run_id='p', checkpoint_every=4, graph=graph,
+                                 profile=True, memory_budget_mb=1) is None
+    assert graph.nodes is nodes
+    assert graph.max_patients == graph.routing_agent.max_patients == graph.med_agent.MAX_CACHED_NAMES == 100
+    assert pipeline.find_checkpoint(str(tmp_path), samples)['n_completed'] == 7
+
+    profile = pipeline.load_json(str(tmp_path / 'profile_p.json'))
+    assert profile['stages']['risk']['calls'] == 7
+    assert {'symptoms', 'medications', 'build_result'} <= set(profile['stages'])
+    messages = [e['message'] for e in profile['events']]
+    assert 'chunk size now 2' in messages[0] and 'chunk size now 1' in messages[1]
+    assert 'stopped after 7/10 samples' in messages[-1]
+
+    resumed = pipeline.run_pipeline(samples, str(tmp_path), resume=True, graph=make_graph(tmp_path))
+    assert resumed == expected
+
+def test_profiler_is_released_when_the_run_fails(tmp_path):
+    import tracemalloc
+    graph = make_graph(tmp_path, crash_on='P00003')
+    nodes = graph.nodes
+    assert pipeline.run_pipeline(str(tmp_path / 'missing.json'), str(tmp_path), graph=graph, profile=True) is None
+    with pytest.raises(Crash):
+        pipeline.run_pipeline('data/test_samples.json', str(tmp_path), run_id='c', graph=graph, profile=True)
+    assert not tracemalloc.is_tracing()
+    assert graph.nodes is nodes
+
+def test_fast_path_routes_critical_patients_first_with_same_results(tmp_path):
+    samples = 'data/test_samples.json'
+    expected = pipeline.run_pipeline(samples, str(tmp_path / 'full'), run_id='full', graph=make_graph(tmp_path / 'full'))
+
+    graph = make_graph(tmp_path / 'fast')
+    results = pipeline.run_pipeline(samples, str(tmp_path / 'fast'), run_id='fast', graph=graph, fast_path=True)
+    assert results == expected
+
+    fast = [json.loads(line) for line in open(pipeline.fast_path_path(str(tmp_path / 'fast'), 'fast'))]
+    assert [(f['patient_id'], f['priority']) for f in fast] == [('P00002', 'Critical')]
+    # Without the critical_alerts floor the full chain re-decides P00002 as High, logged as a second routing
+    assert next(r for r in results if r['patient_id'] == 'P00002')['priority'] == 'High'
+    history = graph.routing_agent.audit_store.routing_history(patient_id='P00002')
+    assert sorted(r['priority'] for r in history) == ['Critical', 'High']
+
+    # With the floor on, fast path or not, P00002 stays Critical and the enrichment keeps its routing
+    floored = {}
+    for name, fast_path in [('floor', False), ('floor_fast', True)]:
+        graph = make_graph(tmp_path / name)
+        graph.priority_agent.config['critical_alerts']['floor'] = True
+        floored[name] = pipeline.run_pipeline(samples, str(tmp_path / name), run_id=name, graph=graph,
+                                              fast_path=fast_path)
+    assert floored['floor'] == floored['floor_fast']
+    assert next(r for r in floored['floor_fast'] if r['patient_id'] == 'P00002')['priority'] == 'Critical'
+    assert len(graph.routing_agent.audit_store.routing_history(patient_id='P00002')) == 1
+
+    # P00002 is third in file order: at 0.5 s per patient the full chain alone would route it after 1.5 s
+    latency = pipeline.fast_path_latency({2: 0.4}, list(range(10)), 0.5)
+    assert latency == {"patients": 1, "fast_ms_max": 0.4, "full_chain_ms_median": 1500.0, "full_chain_ms_max": 1500.0}
+
+def test_severity_schedule_runs_urgent_patients_first(tmp_path):
+    samples = 'data/test_samples.json'
+    expected = pipeline.run_pipeline(samples, str(tmp_path / 'full'), run_id='full', graph=make_graph(tmp_path / 'full'))
+
+    graph = make_graph(tmp_path / 'sched')
+    seen = []
+    evaluate = graph.evaluate
+    graph.evaluate = lambda sample: seen.append(sample['patient_id']) or evaluate(sample)
+    results = pipeline.run_pipeline(samples, str(tmp_path / 'sched'), run_id='sched', graph=graph, schedule='severity')
+    assert results == expected
+    # Hypoxemia first, then the High-severity rule alerts in file order (no model, so no risk tie-break)
+    assert seen[:3] == ['P00002', 'P00001', 'P00007']
@@ -0,0 +1,91 @@
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+from agents.med_safety_agent import MedicationSafetyAgent
+from agents.priority_agent import PriorityAgent
+from agents.risk_agent import RiskAgent
+from agents.symptom_agent import SymptomAgent
+
+def train_small_model(path, n=300, cv='prefit'):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({
+        'hr': rng.integers(50, 140, n), 'sbp': rng.integers(80, 160, n), 'dbp': rng.integers(50, 100, n),
+        'spo2': rng.integers(85, 100, n), 'temp': rng.uniform(36, 39.5, n), 'rr': rng.integers(10, 30, n),
+        'age': rng.integers(18, 95, n), 'sex': rng.choice(['M', 'F'], n),
+        'chronic_conditions': rng.choice(['None', 'COPD', 'CKD'], n)
+    })
+    y = ((X['spo2'] < 92) | (X['sbp'] < 95)).astype(int)
+    pre = ColumnTransformer([('num', 'passthrough', ['hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr', 'age']),
+                             ('cat', OneHotEncoder(handle_unknown='ignore'), ['sex', 'chronic_conditions'])])
+    pipeline = Pipeline([('preprocessor', pre), ('classifier', RandomForestClassifier(n_estimators=20, random_state=0))])
+    if cv == 'prefit':
+        pipeline.fit(X, y)
+    model = CalibratedClassifierCV(pipeline, method='sigmoid', cv=cv).fit(X, y)
+    joblib.dump(model, path)
+    return X
+
+def test_per_patient_attributions_decompose_forest_prediction(tmp_path):
+    X = train_small_model(tmp_path / 'model.pkl')
+    agent = RiskAgent(model_path=str(tmp_path / 'model.pkl'))
+    attributor = agent.attributor
+    assert attributor.feature_names == list(X.columns)
+
+    # Each forest's path decomposition sums to its own probability
+    forest = attributor.members[0]
+    forest_proba = forest.forest.predict_proba(forest.preprocessor.transform(X))[:, 1]
+    np.testing.assert_allclose(forest.contributions(X).sum(axis=1) + forest.bias, forest_proba, atol=1e-9)
+
+    # The reported attributions are rescaled to the calibrated risk_score
+    risk_score = agent.pipeline.predict_proba(X)[:, 1]
+    np.testing.assert_allclose(attributor.contributions(X).sum(axis=1) + attributor.bias, risk_score, atol=1e-9)
+
+    outputs = agent.predict_batch(X.to_dict('records'))
+    assert len({tuple(o['top_features']) for o in outputs}) > 1
+    assert outputs[0] == agent.predict(X.iloc[0].to_dict())
+
+def test_attributions_cover_every_calibration_fold(tmp_path):
+    X = train_small_model(tmp_path / 'model.pkl', cv=3)
+    agent = RiskAgent(model_path=str(tmp_path / 'model.pkl'))
+    attributor = agent.attributor
+    assert len(attributor.members) == 3
+    risk_score = agent.pipeline.predict_proba(X)[:, 1]
+    np.testing.assert_allclose(attributor.contributions(X).sum(axis=1) + attributor.bias, risk_score, atol=1e-9)
+    assert attributor.tree_probabilities(X).shape == (len(X), 60)
+
+def test_uncertainty_is_spread_of_uncalibrated_tree_votes(tmp_path):
+    X = train_small_model(tmp_path / 'model.pkl')
+    agent = RiskAgent(model_path=str(tmp_path / 'model.pkl'))
+    forest = agent.attributor.members[0]
+    Xt = forest.preprocessor.transform(X)
+
+    per_tree = np.column_stack([tree.predict_proba(Xt)[:, 1] for tree in forest.forest.estimators_])
+    np.testing.assert_allclose(agent.attributor.tree_probabilities(X), per_tree, atol=1e-12)
+
+    outputs = agent.predict_batch(X.to_dict('records'))
+    np.testing.assert_allclose([o['uncertainty'] for o in outputs], per_tree.std(axis=1), atol=1e-12)
+    assert len({round(o['uncertainty'], 6) for o in outputs}) > 1
+
+def test_borderline_flag_fires_on_the_shipped_model_and_cohort():
+    summary = pd.read_csv('data/patient_summary.csv')
+    samples = summary.to_dict('records')
+    outputs = RiskAgent().predict_batch(samples)
+    priority_agent = PriorityAgent()
+    threshold = priority_agent.config['uncertainty']['threshold']
+    uncertainty = np.array([o['uncertainty'] for o in outputs])
+    # The threshold was set at the upper quartile of this cohort's tree spread
+    assert 0.2 < (uncertainty >= threshold).mean() < 0.3
+
+    symptom_agent, med_agent = SymptomAgent(), MedicationSafetyAgent()
+    reason = priority_agent.config['uncertainty']['reason']
+    flagged = 0
+    for sample, risk_out in zip(samples, outputs):
+        symptom_out = symptom_agent.extract(sample['clinical_note'])
+        meds = sample['medications'] if isinstance(sample['medications'], str) else symptom_out['medications_mentioned']
+        decision = priority_agent.decide(symptom_out, med_agent.check(meds), risk_out)
+        flagged += reason in decision['reasons']
+    assert 20 < flagged < 150
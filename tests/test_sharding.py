@@ -0,0 +1,38 @@
+import json
+import pytest
+from sharding import ShardedTriage, shard_for
+
+def test_shard_key_is_stable():
+    assert shard_for("P00042", 4) == shard_for("P00042", 4)
+    assert {shard_for(f"P{i:05d}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+def test_sharded_results_and_merged_outputs(tmp_path):
+    samples = json.load(open('data/test_samples.json'))
+    with ShardedTriage(n_shards=2, out_dir=str(tmp_path), batch_size=3) as runtime:
+        results = runtime.process(samples)
+        top = runtime.top(k=20)
+        counts = runtime.counts()
+
+    assert [r['patient_id'] for r in results] == [s['patient_id'] for s in samples]
+    assert len(top) == len(samples) == sum(n for team in counts.values() for n in team.values())
+    ranks = [({'Critical': 3, 'High': 2, 'Medium': 1, 'Low': 0}[e['priority']], e['score']) for e in top]
+    assert ranks == sorted(ranks, reverse=True)
+
+    assert (tmp_path / 'audit_shard0.db').exists() and (tmp_path / 'audit_shard1.db').exists()
+    history = runtime.routing_history()
+    assert sorted(r['patient_id'] for r in history) == sorted(s['patient_id'] for s in samples)
+
+def test_dead_or_failing_shard_raises_instead_of_hanging(tmp_path):
+    samples = json.load(open('data/test_samples.json'))
+    with pytest.raises(RuntimeError, match="Shard 0 failed"):
+        with ShardedTriage(n_shards=2, out_dir=str(tmp_path), poll_interval=0.1) as runtime:
+            # Malformed command: the shard reports the error and exits
+            runtime.inboxes[0].put(('top', None))
+            runtime.top()
+
+    with pytest.raises(RuntimeError, match="exited unexpectedly"):
+        with ShardedTriage(n_shards=2, out_dir=str(tmp_path), poll_interval=0.1) as runtime:
+            runtime.processes[1].kill()
+            runtime.processes[1].join()
+            runtime.process(samples)
+    assert not any(p.is_alive() for p in runtime.processes)
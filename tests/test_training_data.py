@@ -0,0 +1,40 @@
+import pandas as pd
+import train_model
+from training_data import read_chunks, load_frame, holdout_mask, Reservoir
+
+DATA = 'data/patient_summary.csv'
+
+
+def test_loader_reads_only_training_columns_with_compact_dtypes():
+    frame = load_frame(DATA, chunksize=300, with_keys=False)
+    assert 'clinical_note' not in frame and 'medications' not in frame and 'patient_id' not in frame
+    assert frame['hr'].dtype == 'float32'
+    assert frame['deterioration_label'].dtype == 'int8'
+    assert frame['chronic_conditions'].dtype == 'category'
+    full = pd.read_csv(DATA)
+    assert len(frame) == len(full)
+    assert sorted(frame['chronic_conditions'].cat.categories) == sorted(full['chronic_conditions'].dropna().unique())
+
+
+def test_holdout_and_reservoir_are_bounded_and_stable():
+    ids = pd.read_csv(DATA, usecols=['patient_id'])['patient_id'].to_numpy()
+    mask = holdout_mask(ids)
+    assert (mask == holdout_mask(ids[::-1])[::-1]).all()
+    assert 0.2 < mask.mean() < 0.4
+
+    reservoir = Reservoir(100)
+    for chunk in read_chunks(DATA, chunksize=128):
+        reservoir.add(chunk)
+    sample = reservoir.result()
+    assert len(sample) == 100 and reservoir.seen == len(ids)
+    assert sample['patient_id'].is_unique
+    # Drawn from the whole file, not just the first or last chunk
+    assert sample['patient_id'].str[1:].astype(int).between(0, 499).sum() in range(25, 76)
+
+
+def test_incremental_model_trains_over_chunks():
+    pipeline, calibrated, X_test, y_test = train_model.fit_incremental(DATA, max_rows=1000, chunksize=200)
+    proba = calibrated.predict_proba(X_test)[:, 1]
+    assert len(proba) == len(y_test) and ((proba >= 0) & (proba <= 1)).all()
+    importance = train_model.linear_importance(pipeline, X_test)
+    assert set(importance.index) == set(train_model.NUMERIC_FEATURES + train_model.CATEGORICAL_FEATURES)
@@ -0,0 +1,85 @@
+from agents.risk_agent import RiskAgent
+from agents.routing_agent import RoutingAgent
+from audit_store import AuditStore
+from triage import TriageGraph
+
+SAMPLE = {
+    "patient_id": "P00042", "clinical_note": "Patient has chest pain. Taking Aspirin.",
+    "medications": "Aspirin, Warfarin", "hr": 80, "sbp": 120, "dbp": 80, "spo2": 98,
+    "temp": 37.0, "rr": 16, "age": 70, "sex": "F", "chronic_conditions": "None",
+    "timestamp": "2025-12-10T11:00:00"
+}
+
+def make_graph(tmp_path, **kwargs):
+    routing_agent = RoutingAgent(audit_store=AuditStore(str(tmp_path / 'audit.db')))
+    return TriageGraph(risk_agent=RiskAgent(model_path=str(tmp_path / 'missing.pkl')),
+                       routing_agent=routing_agent, **kwargs)
+
+def test_vitals_update_skips_note_and_medication_nodes(tmp_path):
+    graph = make_graph(tmp_path)
+    first = graph.evaluate(SAMPLE)
+    assert graph.last_recomputed[0] == 'symptoms'
+
+    updated = graph.evaluate(dict(SAMPLE, spo2=85, timestamp="2025-12-10T12:00:00"))
+    assert 'symptoms' not in graph.last_recomputed
+    assert 'medications' not in graph.last_recomputed
+    assert 'alerts' in graph.last_recomputed
+    assert set(graph.last_timings) == set(graph.last_recomputed)
+    assert updated['med_out'] == first['med_out']
+    assert any(a['code'] == 'HYPOXEMIA' for a in updated['alerts'])
+
+    graph.evaluate(dict(SAMPLE, spo2=85, timestamp="2025-12-10T12:00:00"))
+    assert graph.last_recomputed == []
+
+def test_invalidate_recomputes_only_medications_and_dependents(tmp_path):
+    graph = make_graph(tmp_path)
+    graph.evaluate(SAMPLE)
+    graph.invalidate([SAMPLE['patient_id']])
+    graph.evaluate(SAMPLE)
+    # Same rules, same check: nothing downstream is touched
+    assert graph.last_recomputed == ['medications']
+
+    rules = graph.med_agent.rules.copy()
+    rules['explanation'] = 'Edited.'
+    graph.med_agent.set_rules(rules)
+    graph.invalidate([SAMPLE['patient_id']])
+    result = graph.evaluate(SAMPLE)
+    assert graph.last_recomputed[0] == 'medications'
+    assert set(graph.last_recomputed) <= {'medications', 'priority', 'routing', 'explanation'}
+    assert 'explanation' in graph.last_recomputed
+    assert all(i['explanation'] == 'Edited.' for i in result['med_out']['interactions'])
+
+def test_forget_drops_the_patient_from_the_worklist(tmp_path):
+    from worklist import TriageWorklist
+    graph = make_graph(tmp_path, worklist=TriageWorklist())
+    graph.evaluate(SAMPLE)
+    assert SAMPLE['patient_id'] in graph.worklist
+    graph.forget(SAMPLE['patient_id'])
+    assert SAMPLE['patient_id'] not in graph.worklist and len(graph) == 0
+
+def test_results_are_copies_of_the_memoized_outputs(tmp_path):
+    graph = make_graph(tmp_path)
+    first = graph.evaluate(SAMPLE)
+    first['priority_out']['priority'] = 'Critical'
+    first['med_out']['interactions'].clear()
+    second = graph.evaluate(SAMPLE)
+    assert graph.last_recomputed == []
+    assert second['priority_out']['priority'] != 'Critical' and second['med_out']['interactions']
+
+def test_patient_memo_is_bounded(tmp_path):
+    graph = make_graph(tmp_path, max_patients=2)
+    for i in range(3):
+        graph.evaluate(dict(SAMPLE, patient_id=f"P{i:05d}"))
+    assert len(graph) == 2
+
+def test_changing_explanation_policy_recomputes_cached_explanations(tmp_path):
+    graph = make_graph(tmp_path, explanation_policy='none')
+    assert graph.evaluate(SAMPLE)['explanation'] is None
+
+    graph.explanation_policy = 'all'
+    result = graph.evaluate(SAMPLE)
+    assert graph.last_recomputed == ['explanation']
+    assert result['explanation']
+
+    graph.explanation_policy = 'lazy'
+    assert graph.evaluate(SAMPLE)['explanation'] is None
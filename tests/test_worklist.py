@@ -0,0 +1,54 @@
+from worklist import TriageWorklist
+
+def routed(team):
+    return {"team": team, "assigned_to": "Dr. Test", "escalated": team != "General Ward"}
+
+def test_top_orders_by_tier_then_score():
+    wl = TriageWorklist()
+    wl.update("P1", {"priority": "High", "score": 0.3}, routed("Respiratory"))
+    wl.update("P2", {"priority": "Critical", "score": 0.9}, routed("Cardiology"))
+    wl.update("P3", {"priority": "High", "score": 0.65}, routed("Respiratory"))
+    wl.update("P4", {"priority": "Low", "score": 0.1}, routed("General Ward"))
+    assert [e['patient_id'] for e in wl.top(3)] == ["P2", "P3", "P1"]
+    assert [e['patient_id'] for e in wl.top(5, team="Respiratory")] == ["P3", "P1"]
+
+def test_updates_and_removals_supersede_old_entries():
+    wl = TriageWorklist(compact_slack=0)
+    for i in range(50):
+        wl.update(f"P{i}", {"priority": "Medium", "score": 0.5}, routed("General Ward"))
+    wl.update("P7", {"priority": "Critical", "score": 0.95}, routed("Critical Care"))
+    wl.remove("P8")
+    for _ in range(100):
+        wl.update("P9", {"priority": "Low", "score": 0.0}, routed("General Ward"))
+    assert wl.top(1)[0]['patient_id'] == "P7"
+    assert wl.top(1, team="General Ward")[0]['priority'] == "Medium"
+    assert len(wl) == 49
+    assert "P8" not in [e['patient_id'] for e in wl.snapshot()]
+    assert wl.snapshot()[-1]['patient_id'] == "P9"
+    assert wl.counts()["Critical Care"] == {"Critical": 1}
+
+def test_heaps_stay_mostly_live_under_repeated_updates():
+    wl = TriageWorklist(compact_slack=0)
+    for i in range(10):
+        wl.update(f"P{i}", {"priority": "Medium", "score": 0.5}, routed("General Ward"))
+    for n in range(1000):
+        # P0 keeps moving between tiers and teams, superseding its heap items each time
+        team = "Cardiology" if n % 2 else "General Ward"
+        wl.update("P0", {"priority": "High" if n % 3 == 0 else "Low", "score": n / 1000}, routed(team))
+    # Stale items never pass half of a heap, so top-K walks stay near K
+    assert len(wl._heap) <= 2 * len(wl)
+    assert all(len(heap) <= 2 * len(wl) for heap in wl._team_heaps.values())
+    assert wl.top(1)[0]['patient_id'] == "P0"
+    wl.remove("P0")
+    assert "Cardiology" not in wl._team_heaps and [e['patient_id'] for e in wl.top(2)] == ["P1", "P2"]
+
+def test_reads_drop_stale_items_ranked_behind_a_live_head():
+    wl = TriageWorklist()
+    wl.update("PC", {"priority": "Critical", "score": 0.9}, routed("General Ward"))
+    for i in range(200):
+        wl.update(f"P{i}", {"priority": "High", "score": 0.7}, routed("General Ward"))
+    for i in range(200):
+        wl.update(f"P{i}", {"priority": "Low", "score": 0.1}, routed("General Ward"))
+    # The downgraded High items rank just below the live root; the first read skips and drops them
+    assert [e['priority'] for e in wl.top(3)] == ["Critical", "Low", "Low"]
+    assert len(wl._heap) == len(wl)
@@ -1,90 +1,192 @@
 import argparse
+import resource
 import pandas as pd
 import numpy as np
+from scipy import sparse
 import joblib
 import json
 import matplotlib.pyplot as plt
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import roc_auc_score, classification_report
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from sklearn.calibration import CalibratedClassifierCV
-from sklearn.inspection import permutation_importance
+from agents.risk_attribution import TreePathAttributor, output_columns
+from feature_store import TimeseriesFeatureStore, FEATURE_COLUMNS
+from profiling import rss_mb
+from training_data import read_chunks, load_frame, holdout_mask, Reservoir
 from utils import seed_everything, ensure_dirs, save_json
 
-def train(data_path, out_model_path):
-    seed_everything(42)
-    ensure_dirs(['models', 'evidence'])
-    
-    df = pd.read_csv(data_path)
-    
+NUMERIC_FEATURES = ['hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr', 'age']
+CATEGORICAL_FEATURES = ['sex', 'chronic_conditions']
+DROP_COLS = ['patient_id', 'timestamp', 'clinical_note', 'medications', 'deterioration_label', 'deterioration_type',
+             'deterioration_onset', 'symptoms']
+MODEL_TYPES = ['forest', 'sgd']
+# Feature importances are estimated on at most this many holdout rows
+IMPORTANCE_ROWS = 5000
+
+def split_features(df):
     # Features and Target
-    drop_cols = ['patient_id', 'timestamp', 'clinical_note', 'medications', 'deterioration_label', 'deterioration_type', 'symptoms']
-    X = df.drop(columns=[c for c in drop_cols if c in df.columns])
+    X = df.drop(columns=[c for c in DROP_COLS if c in df.columns])
     y = df['deterioration_label']
-    
+    return X, y
+
+def build_pipeline(random_state=42, timeseries_features=False, model='forest'):
     # Preprocessing
-    numeric_features = ['hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr', 'age']
-    categorical_features = ['sex', 'chronic_conditions']
-    
     numeric_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='median')),
         ('scaler', StandardScaler())
     ])
-    
+
     categorical_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
         ('onehot', OneHotEncoder(handle_unknown='ignore'))
     ])
-    
+
     preprocessor = ColumnTransformer(
         transformers=[
-            ('num', numeric_transformer, numeric_features),
-            ('cat', categorical_transformer, categorical_features)
+            ('num', numeric_transformer, NUMERIC_FEATURES + (FEATURE_COLUMNS if timeseries_features else [])),
+            ('cat', categorical_transformer, CATEGORICAL_FEATURES)
         ])
-    
-    # Base Model
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    
+
+    # Base Model; 'sgd' is a logistic model that learns chunk by chunk with partial_fit
+    if model == 'sgd':
+        clf = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=random_state)
+    else:
+        clf = RandomForestClassifier(n_estimators=100, random_state=random_state)
+
     # Pipeline
-    pipeline = Pipeline(steps=[('preprocessor', preprocessor),
-                               ('classifier', clf)])
-    
-    # Split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
-    
-    # Train
+    return Pipeline(steps=[('preprocessor', preprocessor),
+                           ('classifier', clf)])
+
+def fit_model(X_train, y_train, X_cal, y_cal, random_state=42):
+    pipeline = build_pipeline(random_state, timeseries_features=set(FEATURE_COLUMNS) <= set(X_train.columns))
     pipeline.fit(X_train, y_train)
-    
+
     # Calibration
     calibrated_clf = CalibratedClassifierCV(pipeline, method='sigmoid', cv='prefit')
-    calibrated_clf.fit(X_test, y_test) # Using test set for calibration for simplicity in this script
-    
+    calibrated_clf.fit(X_cal, y_cal)
+    return pipeline, calibrated_clf
+
+def stream_split(data_path, store=None, chunksize=250000, test_size=0.3):
+    # (train, test) frames per chunk, split by a hash of patient_id
+    for chunk in read_chunks(data_path, chunksize):
+        if store is not None:
+            chunk = store.join(chunk)
+        mask = holdout_mask(chunk['patient_id'].to_numpy(), test_size)
+        yield chunk[~mask], chunk[mask]
+
+def fit_sampled(data_path, store=None, max_rows=1000000, chunksize=250000, test_size=0.3):
+    """Random forest on a bounded uniform sample of the training rows, read chunk by chunk."""
+    train_rows, test_rows = Reservoir(max_rows), Reservoir(max(1, int(max_rows * test_size / (1 - test_size))))
+    for train_chunk, test_chunk in stream_split(data_path, store, chunksize, test_size):
+        train_rows.add(train_chunk)
+        test_rows.add(test_chunk)
+    print(f"Sampled {len(train_rows.result())} of {train_rows.seen} training rows")
+    X_train, y_train = split_features(train_rows.result())
+    X_test, y_test = split_features(test_rows.result())
+    pipeline, calibrated_clf = fit_model(X_train, y_train, X_test, y_test)
+    return pipeline, calibrated_clf, X_test, y_test
+
+def fit_incremental(data_path, store=None, max_rows=1000000, chunksize=250000, test_size=0.3):
+    """
+    SGD logistic model trained with partial_fit over every chunk. Imputation,
+    scaling and one-hot categories are fitted on the first chunk; the holdout
+    used for calibration and evaluation is a bounded sample.
+    """
+    pipeline = build_pipeline(timeseries_features=store is not None, model='sgd')
+    preprocessor, clf = pipeline.steps[0][1], pipeline.steps[-1][1]
+    test_rows = Reservoir(max(1, int(max_rows * test_size / (1 - test_size))))
+    n_rows = 0
+    for train_chunk, test_chunk in stream_split(data_path, store, chunksize, test_size):
+        test_rows.add(test_chunk)
+        if train_chunk.empty:
+            continue
+        X, y = split_features(train_chunk)
+        if n_rows == 0:
+            preprocessor.fit(X)
+        clf.partial_fit(preprocessor.transform(X), y, classes=[0, 1])
+        n_rows += len(X)
+    print(f"Trained incrementally on {n_rows} rows")
+    X_test, y_test = split_features(test_rows.result())
+    calibrated_clf = CalibratedClassifierCV(pipeline, method='sigmoid', cv='prefit')
+    calibrated_clf.fit(X_test, y_test)
+    return pipeline, calibrated_clf, X_test, y_test
+
+def linear_importance(pipeline, X):
+    # Mean |coef * transformed value| per original column, the linear analogue of the tree-path attributions
+    preprocessor, clf = pipeline[:-1], pipeline.steps[-1][1]
+    Xt = preprocessor.transform(X)
+    if sparse.issparse(Xt):
+        contributions = np.asarray(abs(Xt.multiply(clf.coef_[0])).mean(axis=0)).ravel()
+    else:
+        contributions = np.abs(Xt * clf.coef_[0]).mean(axis=0)
+    return pd.Series(contributions, index=output_columns(preprocessor, Xt.shape[1])).groupby(level=0).sum()
+
+def train(data_path, out_model_path, features_dir=None, model='forest', max_rows=None, chunksize=250000):
+    seed_everything(42)
+    ensure_dirs(['models', 'evidence'])
+    rss_start = rss_mb()
+
+    # Windowed vitals history as of each summary row, read from the precomputed store
+    store = TimeseriesFeatureStore.load(features_dir) if features_dir else None
+    if model == 'sgd':
+        pipeline, calibrated_clf, X_test, y_test = fit_incremental(data_path, store, max_rows or 1000000, chunksize)
+    elif max_rows:
+        pipeline, calibrated_clf, X_test, y_test = fit_sampled(data_path, store, max_rows, chunksize)
+    else:
+        # Training columns only, with compact dtypes
+        df = load_frame(data_path, chunksize, with_keys=True)
+        if store is not None:
+            df = store.join(df)
+        X, y = split_features(df)
+        del df
+
+        # Split
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+
+        # Train (calibrating on the test set for simplicity in this script)
+        pipeline, calibrated_clf = fit_model(X_train, y_train, X_test, y_test)
+
     # Evaluate
     y_pred = calibrated_clf.predict(X_test)
     y_pred_proba = calibrated_clf.predict_proba(X_test)[:, 1]
-    
+
     auc = roc_auc_score(y_test, y_pred_proba)
     print(f"ROC AUC: {auc:.4f}")
-    
-    # Feature Importance (Permutation)
-    result = permutation_importance(pipeline, X_test, y_test, n_repeats=10, random_state=42, n_jobs=1)
-    importances = pd.Series(result.importances_mean, index=X.columns)
+
+    # Feature Importance (mean absolute tree-path attribution, same engine RiskAgent uses per patient)
+    X_importance = X_test.sample(n=IMPORTANCE_ROWS, random_state=42) if len(X_test) > IMPORTANCE_ROWS else X_test
+    attributor = TreePathAttributor.from_model(pipeline)
+    if attributor is not None:
+        importances = pd.Series(attributor.global_importance(X_importance))
+    else:
+        importances = linear_importance(pipeline, X_importance)
     top_features = importances.sort_values(ascending=False).head(5).to_dict()
-    
+
     with open('evidence/feature_importances.json', 'w') as f:
         json.dump(top_features, f, indent=4)
-        
+
     # Save Model
     joblib.dump(calibrated_clf, out_model_path)
     print(f"Model saved to {out_model_path}")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Memory: RSS {rss_start:.0f} MB at start, {rss_mb():.0f} MB at end, peak {peak:.0f} MB")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--data', type=str, default='data/patient_summary.csv')
     parser.add_argument('--out', type=str, default='models/risk_model.pkl')
+    parser.add_argument('--features', type=str, nargs='?', const='data/feature_store', default=None,
+                        help="Also train on timeseries features from this store (build it with feature_store.py)")
+    parser.add_argument('--model', choices=MODEL_TYPES, default='forest',
+                        help="'sgd' learns incrementally over chunks, so the full dataset never sits in memory")
+    parser.add_argument('--max_rows', type=int, default=None,
+                        help="Train the forest on a uniform sample of at most this many rows (holdout sample for 'sgd')")
+    parser.add_argument('--chunksize', type=int, default=250000, help="Rows per CSV chunk")
     args = parser.parse_args()
-    train(args.data, args.out)
+    train(args.data, args.out, args.features, args.model, args.max_rows, args.chunksize)
@@ -0,0 +1,73 @@
+import zlib
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+NUMERIC_DTYPES = {'hr': 'float32', 'sbp': 'float32', 'dbp': 'float32', 'spo2': 'float32', 'temp': 'float32',
+                  'rr': 'float32', 'age': 'float32'}
+CATEGORICAL_COLUMNS = ['sex', 'chronic_conditions']
+LABEL = 'deterioration_label'
+KEY_COLUMNS = ['patient_id', 'timestamp']
+
+
+def training_columns(with_keys=True):
+    return list(NUMERIC_DTYPES) + CATEGORICAL_COLUMNS + [LABEL] + (KEY_COLUMNS if with_keys else [])
+
+
+def read_chunks(path, chunksize=250000, with_keys=True):
+    """
+    Stream a patient_summary CSV with only the training columns: numerics as
+    float32, the label as int8, and low-cardinality strings as categories.
+    Notes and medication lists are never parsed.
+    """
+    dtypes = dict(NUMERIC_DTYPES, **{c: 'category' for c in CATEGORICAL_COLUMNS}, **{LABEL: 'int8'})
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in training_columns(with_keys) if c in header]
+    return pd.read_csv(path, usecols=usecols, dtype={c: t for c, t in dtypes.items() if c in usecols},
+                       chunksize=chunksize)
+
+
+def concat_frames(frames):
+    # Chunks see different category sets; plain concat would fall back to object strings
+    for col in CATEGORICAL_COLUMNS:
+        if len(frames) > 1 and all(col in f for f in frames):
+            categories = union_categoricals([f[col] for f in frames]).categories
+            frames = [f.assign(**{col: f[col].cat.set_categories(categories)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_frame(path, chunksize=250000, with_keys=True):
+    return concat_frames(list(read_chunks(path, chunksize, with_keys)))
+
+
+def holdout_mask(patient_ids, test_size=0.3):
+    # Deterministic per patient, so the split is the same whichever chunk a row lands in
+    buckets = np.fromiter((zlib.crc32(str(p).encode()) % 10000 for p in patient_ids), dtype=np.int64,
+                          count=len(patient_ids))
+    return buckets < test_size * 10000
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most `size` rows over a stream of frames:
+    every row draws a random key and the `size` smallest keys are kept.
+    """
+
+    def __init__(self, size, seed=42):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.frame = None
+        self.keys = np.empty(0)
+        self.seen = 0
+
+    def add(self, frame):
+        self.seen += len(frame)
+        keys = np.concatenate([self.keys, self.rng.random(len(frame))])
+        frame = frame if self.frame is None else concat_frames([self.frame, frame])
+        if len(frame) > self.size:
+            keep = np.sort(np.argpartition(keys, self.size)[:self.size])
+            frame, keys = frame.iloc[keep].reset_index(drop=True), keys[keep]
+        self.frame, self.keys = frame, keys
+
+    def result(self):
+        return self.frame
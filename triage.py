@@ -0,0 +1,231 @@
+import copy
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from agents.symptom_agent import SymptomAgent
+from agents.med_safety_agent import MedicationSafetyAgent
+from agents.risk_agent import RiskAgent
+from agents.priority_agent import PriorityAgent
+from agents.explanation_agent import ExplanationAgent
+from agents.routing_agent import RoutingAgent
+from rules.clinical_alerts import check_clinical_rules
+
+VITAL_FIELDS = ['hr', 'sbp', 'spo2', 'temp', 'rr']
+RISK_FIELDS = ['hr', 'sbp', 'dbp', 'spo2', 'temp', 'rr', 'age', 'sex', 'chronic_conditions']
+EXPLANATION_POLICIES = ['all', 'escalated-only', 'none', 'lazy']
+
+
+def parse_medications(meds_input):
+    # If string, split it. If list, keep it.
+    if isinstance(meds_input, str):
+        return [m.strip() for m in meds_input.split(',') if m.strip()]
+    elif isinstance(meds_input, list):
+        return [str(m).strip() for m in meds_input if str(m).strip()]
+    return []
+
+
+class _PatientState:
+    __slots__ = ('keys', 'outputs', 'versions')
+
+    def __init__(self):
+        self.keys = {}
+        self.outputs = {}
+        self.versions = {}
+
+
+class TriageGraph:
+    """
+    Agent chain modelled as a dependency graph. Each node declares the sample
+    fields and upstream nodes it reads; on re-evaluation of a patient only
+    nodes whose inputs changed are recomputed. A node whose recomputed output
+    is unchanged does not invalidate its dependents.
+    """
+
+    def __init__(self, symptom_agent=None, med_agent=None, risk_agent=None, priority_agent=None,
+                 routing_agent=None, explanation_agent=None, max_patients=10000, worklist=None,
+                 explanation_policy='all'):
+        self.symptom_agent = symptom_agent or SymptomAgent()
+        self.med_agent = med_agent or MedicationSafetyAgent()
+        self.risk_agent = risk_agent or RiskAgent()
+        self.priority_agent = priority_agent or PriorityAgent()
+        self.routing_agent = routing_agent or RoutingAgent()
+        self.explanation_agent = explanation_agent or ExplanationAgent()
+        self.max_patients = max_patients
+        self.worklist = worklist
+        # 'all' renders text for every patient, 'escalated-only' for High/Critical;
+        # 'none' and 'lazy' leave it to ExplanationAgent.from_result on demand
+        self._explanation_policy = explanation_policy
+
+        # With a feature store the risk also depends on the patient's history up to this reading
+        risk_fields = RISK_FIELDS
+        if getattr(self.risk_agent, 'feature_store', None) is not None:
+            risk_fields = RISK_FIELDS + ['patient_id', 'timestamp']
+
+        # (name, sample fields, upstream nodes, compute) in topological order
+        self.nodes = [
+            ('symptoms', ['clinical_note'], [], self._symptoms),
+            ('med_list', ['medications'], ['symptoms'], self._med_list),
+            ('medications', [], ['med_list'], self._medications),
+            ('risk', risk_fields, [], self._risk),
+            ('alerts', VITAL_FIELDS, [], self._alerts),
+            ('priority', [], ['symptoms', 'medications', 'risk', 'alerts'], self._priority),
+            ('routing', ['patient_id'], ['priority', 'alerts'], self._routing),
+            ('timestamp', ['timestamp'], [], self._timestamp),
+            ('explanation', ['patient_id'], ['symptoms', 'medications', 'risk', 'priority', 'routing', 'timestamp'], self._explanation),
+        ]
+        self._states = OrderedDict()
+        self._lock = threading.RLock()
+        self.last_recomputed = []
+        self.last_timings = {}
+
+    @property
+    def explanation_policy(self):
+        return self._explanation_policy
+
+    @explanation_policy.setter
+    def explanation_policy(self, policy):
+        # The policy is not a node input, so cached explanations are dropped when it changes
+        if policy != self._explanation_policy:
+            self._explanation_policy = policy
+            self.invalidate(list(self._states), node='explanation')
+
+    # Node computations
+    def _symptoms(self, sample, out):
+        return self.symptom_agent.extract(sample.get('clinical_note', ''))
+
+    def _med_list(self, sample, out):
+        meds_input = sample.get('medications', '')
+        if not meds_input:
+            meds_input = out['symptoms']['medications_mentioned']
+        return parse_medications(meds_input)
+
+    def _medications(self, sample, out):
+        return self.med_agent.check(out['med_list'])
+
+    def _risk(self, sample, out):
+        return self.risk_agent.predict(sample)
+
+    def _alerts(self, sample, out):
+        vitals = {k: sample.get(k) for k in VITAL_FIELDS}
+        return check_clinical_rules(vitals)
+
+    def _priority(self, sample, out):
+        priority_out = self.priority_agent.decide(out['symptoms'], out['medications'], out['risk'])
+        return self.priority_agent.escalate(priority_out, out['alerts'])
+
+    def _routing(self, sample, out):
+        return self.routing_agent.route(out['priority'], sample.get('patient_id'), out['alerts'])
+
+    def _timestamp(self, sample, out):
+        # The sample's timestamp, else when it was first evaluated; shared by the explanation and stored results
+        return sample.get('timestamp') or datetime.datetime.now().isoformat()
+
+    def _explanation(self, sample, out):
+        if self.explanation_policy in ('none', 'lazy'):
+            return None
+        if self.explanation_policy == 'escalated-only' and out['priority']['priority'] not in ['High', 'Critical']:
+            return None
+        return self.explanation_agent.generate(
+            sample.get('patient_id', 'Unknown'),
+            out['timestamp'],
+            out['symptoms'], out['medications'], out['risk'], out['priority'], out['routing']
+        )
+
+    def _state_for(self, patient_id):
+        state = self._states.get(patient_id)
+        if state is None:
+            state = _PatientState()
+            self._states[patient_id] = state
+            while len(self._states) > self.max_patients:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(patient_id)
+        return state
+
+    def evaluate(self, sample):
+        with self._lock:
+            state = self._state_for(sample.get('patient_id', 'Unknown'))
+            recomputed = []
+            timings = {}
+            for name, fields, deps, compute in self.nodes:
+                key = tuple(sample.get(f) for f in fields) + tuple(state.versions[d] for d in deps)
+                if name in state.outputs and state.keys.get(name) == key:
+                    continue
+                start = time.perf_counter()
+                output = compute(sample, state.outputs)
+                timings[name] = time.perf_counter() - start
+                if name not in state.outputs or state.outputs[name] != output:
+                    state.versions[name] = state.versions.get(name, 0) + 1
+                state.outputs[name] = output
+                state.keys[name] = key
+                recomputed.append(name)
+            self.last_recomputed = recomputed
+            # Seconds spent in each recomputed node during this evaluation
+            self.last_timings = timings
+            out = state.outputs
+            if self.worklist is not None and {'priority', 'routing', 'alerts'} & set(recomputed):
+                self.worklist.update(sample.get('patient_id', 'Unknown'), out['priority'], out['routing'], out['alerts'])
+
+            # A copy: callers may edit the result without corrupting the memoized outputs
+            return copy.deepcopy({
+                "symptom_out": out['symptoms'],
+                "med_out": out['medications'],
+                "meds_list": out['med_list'],
+                "risk_out": out['risk'],
+                "priority_out": out['priority'],
+                "routing_out": out['routing'],
+                "explanation": out['explanation'],
+                "alerts": out['alerts'],
+                "timestamp": out['timestamp']
+            })
+
+    def fast_route(self, sample):
+        """
+        Cheap deterministic pass: if a critical rule alert fires, route the patient
+        as Critical straight away and return that preliminary result; else None.
+        A later evaluate() enriches it with the full chain's decision. That is
+        the decision a normal run makes: unless the critical_alerts floor is on
+        in the priority config, the patient may be re-decided (e.g. to High) and
+        re-routed, which the routing agent logs as a transition.
+        """
+        alerts = check_clinical_rules({k: sample.get(k) for k in VITAL_FIELDS})
+        priority_out = self.priority_agent.fast_path(alerts)
+        if priority_out is None:
+            return None
+        pid = sample.get('patient_id', 'Unknown')
+        with self._lock:
+            # A cached routing no longer matches the routing agent's record for this patient
+            state = self._states.get(pid)
+            if state is not None:
+                state.keys.pop('routing', None)
+        routing_out = self.routing_agent.route(priority_out, pid, alerts)
+        if self.worklist is not None:
+            self.worklist.update(pid, priority_out, routing_out, alerts)
+        return {"priority_out": priority_out, "routing_out": routing_out, "alerts": alerts}
+
+    def resize(self, max_patients):
+        # Evict least recently evaluated patients down to the new cap
+        with self._lock:
+            self.max_patients = max_patients
+            while len(self._states) > max_patients:
+                self._states.popitem(last=False)
+
+    def invalidate(self, patient_ids, node='medications'):
+        # Recompute `node` on each patient's next evaluation even if their inputs are unchanged
+        # (e.g. after a medication rules change; see MedicationIndex.apply_rules)
+        with self._lock:
+            for pid in patient_ids:
+                state = self._states.get(pid)
+                if state is not None:
+                    state.keys.pop(node, None)
+
+    def forget(self, patient_id):
+        with self._lock:
+            self._states.pop(patient_id, None)
+            self.routing_agent.forget(patient_id)
+            if self.worklist is not None:
+                self.worklist.remove(patient_id)
+
+    def __len__(self):
+        return len(self._states)
@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import threading
+import datetime
+
+PRIORITY_RANK = {'Critical': 3, 'High': 2, 'Medium': 1, 'Low': 0}
+
+
+class TriageWorklist:
+    """
+    Live ranking of monitored patients by priority tier, then PriorityAgent score.
+    Updates and removals are O(log n) amortized: superseded heap items are left in
+    place and skipped lazily, and a heap is compacted once its stale items pass
+    `compact_fraction` of it (and `compact_slack`), or once a top-K read has to
+    skip more than K of them. Top-K reads walk only the head of the heap, so
+    their cost depends on K, not n.
+    """
+
+    def __init__(self, compact_fraction=0.5, compact_slack=64):
+        self._entries = {}
+        self._keys = {}
+        self._heap = []
+        self._team_heaps = {}
+        # Live keys in each team heap, to tell how stale it is
+        self._team_live = {}
+        self._seq = itertools.count()
+        self._compact_fraction = compact_fraction
+        self._compact_slack = compact_slack
+        self._lock = threading.Lock()
+
+    def update(self, patient_id, priority_out, routing_out=None, alerts=None):
+        priority = priority_out.get('priority', 'Low')
+        # Fast-path results (TriageGraph.fast_route) are not scored yet
+        score = priority_out.get('score') or 0.0
+        routing_out = routing_out or {}
+        entry = {
+            "patient_id": patient_id,
+            "priority": priority,
+            "score": score,
+            "team": routing_out.get('team', 'General Ward'),
+            "assigned_to": routing_out.get('assigned_to', 'Routine Queue'),
+            "escalated": routing_out.get('escalated', False),
+            "alerts": [a['code'] for a in (alerts or [])],
+            "updated_at": datetime.datetime.now().isoformat()
+        }
+        with self._lock:
+            key = (-PRIORITY_RANK.get(priority, 0), -score, next(self._seq), patient_id)
+            old = self._entries.get(patient_id)
+            if old is not None:
+                self._team_live[old['team']] -= 1
+            self._entries[patient_id] = entry
+            self._keys[patient_id] = key
+            self._team_live[entry['team']] = self._team_live.get(entry['team'], 0) + 1
+            heapq.heappush(self._heap, key)
+            heapq.heappush(self._team_heaps.setdefault(entry['team'], []), key)
+            self._maybe_compact(self._heap, len(self._keys))
+            self._maybe_compact_team(entry['team'])
+            if old is not None and old['team'] != entry['team']:
+                self._maybe_compact_team(old['team'])
+        return entry
+
+    def update_from_analysis(self, patient_id, analysis):
+        return self.update(patient_id, analysis['priority_out'], analysis['routing_out'], analysis['alerts'])
+
+    def remove(self, patient_id):
+        with self._lock:
+            self._keys.pop(patient_id, None)
+            entry = self._entries.pop(patient_id, None)
+            if entry is not None:
+                self._team_live[entry['team']] -= 1
+                self._maybe_compact(self._heap, len(self._keys))
+                self._maybe_compact_team(entry['team'])
+            return entry
+
+    def get(self, patient_id):
+        return self._entries.get(patient_id)
+
+    def _is_live(self, key):
+        return self._keys.get(key[3]) is key
+
+    def _maybe_compact(self, heap, live):
+        # Rebuild in place from the live keys; each rebuild follows at least
+        # compact_fraction * len(heap) superseding pushes, so the cost is amortized
+        stale = len(heap) - live
+        if stale > self._compact_slack and stale > self._compact_fraction * len(heap):
+            self._compact(heap)
+
+    def _compact(self, heap):
+        heap[:] = [key for key in heap if self._is_live(key)]
+        heapq.heapify(heap)
+
+    def _maybe_compact_team(self, team):
+        if not self._team_live.get(team):
+            # Nobody left on this team
+            self._team_heaps.pop(team, None)
+            self._team_live.pop(team, None)
+            return
+        self._maybe_compact(self._team_heaps[team], self._team_live[team])
+
+    def _top_keys(self, heap, k):
+        # Drop stale items sitting at the root, then best-first walk of the heap tree
+        while heap and not self._is_live(heap[0]):
+            heapq.heappop(heap)
+        out = []
+        skipped = 0
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier and len(out) < k:
+            key, i = heapq.heappop(frontier)
+            if self._is_live(key):
+                out.append(key)
+            else:
+                skipped += 1
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        if skipped > max(k, self._compact_slack):
+            # Stale items ranked among the top (e.g. behind a live root) cost every read; drop them now
+            self._compact(heap)
+        return out
+
+    def top(self, k=10, team=None):
+        with self._lock:
+            heap = self._heap if team is None else self._team_heaps.get(team, [])
+            return [dict(self._entries[key[3]]) for key in self._top_keys(heap, k)]
+
+    def snapshot(self, team=None, limit=None):
+        with self._lock:
+            keys = [key for key in self._keys.values()
+                    if team is None or self._entries[key[3]]['team'] == team]
+            keys.sort()
+            if limit is not None:
+                keys = keys[:limit]
+            return [dict(self._entries[key[3]]) for key in keys]
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for entry in self._entries.values():
+                team = counts.setdefault(entry['team'], {})
+                team[entry['priority']] = team.get(entry['priority'], 0) + 1
+            return counts
+
+    def teams(self):
+        return sorted({e['team'] for e in self._entries.values()})
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._entries